@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Measure the cold-start time of each entry point (i.e. the time for a fresh interpreter to import
+the entry point and parse its arguments) and check it against its budget. Heavy libraries are only
+imported when a plot or statistical test runs, so these times are dominated by numpy and pandas.
+
+usage: python coldstart.py [n_repeats]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import subprocess
+
+# budget of the best of n_repeats cold starts, in seconds
+BUDGETS = {
+    'simulation': 0.5,
+    'robots': 1.5,
+    'politics': 1.5,
+}
+
+
+def cold_start_time(entry_point, n_repeats=5):
+    """Return the fastest of n_repeats cold starts of the entry point"""
+
+    times = list()
+
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(n_repeats):
+            start = time.time()
+            subprocess.check_call([sys.executable, entry_point, '--help'], stdout=devnull)
+            times.append(time.time() - start)
+
+    return min(times)
+
+
+if __name__ == '__main__':
+
+    n_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    over_budget = False
+    for entry_point in sorted(BUDGETS):
+        elapsed = cold_start_time(os.path.join(root, entry_point), n_repeats)
+        status = 'ok' if elapsed <= BUDGETS[entry_point] else 'OVER BUDGET'
+        over_budget |= elapsed > BUDGETS[entry_point]
+
+        print('{0:s}: {1:.3f}s (budget {2:.1f}s) {3:s}'.format(entry_point, elapsed, BUDGETS[entry_point], status))
+
+    sys.exit(1 if over_budget else 0)
@@ -17,12 +17,13 @@ case "$1" in
   robots)
     # Run the robot experiment analyses
     # usage: simulation/ input_csv n output_location
-    python ~/robots/ ~/data/robots/robots-first/robots_results.csv n "$2"
+    # the simulation directory holds the agent that --fit fits to the participants
+    PYTHONPATH=~/simulation python ~/robots/ ~/data/robots/robots-first/robots_results.csv n "$2"
     ;;
   robots_rerun)
     # Run the robot experiment analyses
     # usage: simulation/ input_csv n output_location
-    python ~/robots/ ~/data/robots/robots-rerun/robots_rerun_results.csv y "$2"
+    PYTHONPATH=~/simulation python ~/robots/ ~/data/robots/robots-rerun/robots_rerun_results.csv y "$2"
     ;;
   *)
     echo "usage - simulation|robots|robots_rerun|politics output_location"
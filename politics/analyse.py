@@ -11,16 +11,12 @@ from __future__ import division
 import sys
 import logging
 import pandas as pd
-import numpy as np
-from datetime import datetime
 
-from scipy.stats import chi2_contingency, mannwhitneyu, iqr, wilcoxon
-import statsmodels.formula.api as smf
-from statsmodels.graphics.factorplots import interaction_plot
+# scipy and the plotting libraries are slow to import, so they are only imported by the
+# functions that use them
 
 # from config import CONFIG
 from prepare import rename_data, profile_participants
-from plot import create_comparison_boxplot, plot_kdes_of_changes
 
 
 def initialise_logger():
@@ -45,6 +41,8 @@ def calculate_median_and_range(data, target_col, grouping_col='VOTE_CONTRO_DIR')
     As we're looking at ranks, we'll report the medians and IQR
     """
 
+    from scipy.stats import iqr
+
     # calculate the mean average
     mean_diff = data.groupby(grouping_col)[target_col].median()
     iqr_diff = data.groupby(grouping_col)[target_col].agg(iqr)
@@ -86,6 +84,8 @@ def common_language_effect_size(lessers, greaters):
 def two_samples_test(sample_means_one, sample_means_two):
     """Perform a two-sample non-parametric test"""
 
+    from scipy.stats import mannwhitneyu
+
     t, p = mannwhitneyu(sample_means_one.values, sample_means_two.values)
 
     return t, p
@@ -141,6 +141,8 @@ that chose left and right candidates were different: U={1:f} p={2:f}, effect siz
 def count_and_chi_square(index, columns):
     """Perform a crosstab of index and columns and then calculate a chi-square contingency"""
 
+    from scipy.stats import chi2_contingency
+
     # generate counts
     counts = pd.crosstab(index, columns)
 
@@ -180,6 +182,8 @@ def compare_overall_and_pairwise(data, slider_col, grouping_col, topic_col, code
 def post_hoc_analyses(data, affiliation_col, contro_col, slider_raw_col):
     """Perform post-hoc analyses"""
 
+    from scipy.stats import iqr, wilcoxon
+
     # produce a 2 x 2 chi-square between Vote and Affiliation
     chi2, p, dof = count_and_chi_square(data[affiliation_col], data[contro_col])
     logging.info(
@@ -194,6 +198,8 @@ def post_hoc_analyses(data, affiliation_col, contro_col, slider_raw_col):
 def compare_democrats_and_republicans(data, config):
     """Evaluate the effects of the candidate's revelation for democrats and republicans separately"""
 
+    from plot import create_comparison_boxplot
+
     # calculate the per-topic changes for democrats and republicans
     for affil in data[config['affiliation_col']].unique():
         logging.info('** Analysing {0:s} participants **'.format(affil))
@@ -222,6 +228,8 @@ def compare_democrats_and_republicans(data, config):
 def main(config):
     """Main entrypoint for code"""
 
+    from plot import create_comparison_boxplot, plot_kdes_of_changes
+
     initialise_logger()
 
     # import data
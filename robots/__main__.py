@@ -33,6 +33,10 @@ def initialise_cli_args():
                        help='Are you analysing data from the rerun (with political analyses)? (y/n)')
     parser.add_argument('output', type=str,
                        help='Location of the directory to output plots')
+    parser.add_argument('--fit', action='store_true',
+                        help='Also fit the Coherency Maximising agent to every participant (saved to agent_fits.csv)')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='Number of processes to fit the agent in')
 
     args = parser.parse_args()
 
@@ -52,6 +56,10 @@ def create_config(args):
 
         # output path
         'plot_savepath': args.output, # the path to save the plots
+
+        # fit the Coherency Maximising agent to every participant's choices
+        'fit_agent': args.fit,
+        'n_jobs': args.n_jobs,
     }
 
     return config
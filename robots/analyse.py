@@ -3,21 +3,15 @@
 # Adam Hornsby
 from __future__ import division
 
-import matplotlib
-matplotlib.use('Agg')
-
 import sys
-import scipy
-from scipy import stats
 import pandas as pd
 import numpy as np
-import statsmodels
-from scipy.stats import friedmanchisquare, wilcoxon, iqr
-import statsmodels.api as st
 import logging
 
-from prepare import qa_results, prepare_modelling_data
-from plot import barplot, plot_trial_variability
+# scipy, statsmodels and the plotting libraries are slow to import, so they are only
+# imported by the functions that use them
+
+from prepare import qa_results, prepare_modelling_data, prepare_choice_sequences
 
 CONFIG = {
     # input data
@@ -29,6 +23,10 @@ CONFIG = {
 
     # output path
     'plot_savepath': './plots/', # the path to save the plots
+
+    # fit the Coherency Maximising agent to every participant's choices
+    'fit_agent': False,
+    'n_jobs': 1, # number of processes to fit in
 }
 
 
@@ -48,7 +46,9 @@ def initialise_logger():
 def run_ols(df, x_col, y_col):
     """Run multiple OLS' returning the p values each time"""
 
-    mod = statsmodels.regression.linear_model.OLS(df[y_col], st.add_constant(df[x_col].astype(float), prepend=False))
+    import statsmodels.api as st
+
+    mod = st.OLS(df[y_col], st.add_constant(df[x_col].astype(float), prepend=False))
     result = mod.fit()
     logging.info(result.summary())
 
@@ -56,6 +56,8 @@ def run_ols(df, x_col, y_col):
 def calculate_rank_sums(data):
     """Calculate the rank sums of preference for each choice type"""
 
+    from scipy.stats import iqr
+
     # rollup ranks across blocks
     data['Preference'] = data['Preference'].astype(int)
 
@@ -73,6 +75,8 @@ def calculate_rank_sums(data):
 def friedman_chi_square(rank_sums):
     """Calculate the Friedman omnibus test on the summed preferences"""
 
+    from scipy.stats import friedmanchisquare
+
     # calculate the friedman model
     chi, p = friedmanchisquare(rank_sums['NotChosen'].values,
                                rank_sums['Shared'].values,
@@ -84,12 +88,14 @@ def friedman_chi_square(rank_sums):
 def perform_wilcoxon_tests(rank_sums):
     """Perform three wilcoxon tests to calculate significance of each of the pairwise comparisons"""
 
+    from scipy.stats import norm, wilcoxon
+
     # compare chosen unique with shared
     # z methodology here: https://www.sheffield.ac.uk/polopoly_fs/1.714576!/file/stcp-marquier-WilcoxonR.pdf
     for a, b in [['Chosen', 'Shared'], ['Chosen', 'NotChosen'], ['NotChosen', 'Shared']]:
         T, p = wilcoxon(rank_sums[a].values - rank_sums[b].values)
 
-        z = scipy.stats.norm.ppf(p / 2.)
+        z = norm.ppf(p / 2.)
         r = np.abs(z) / np.sqrt(rank_sums[a].shape[0])
 
         logging.info(
@@ -126,6 +132,8 @@ def run_significance_tests_and_plot(data, line_plot_path, bar_plot_path):
     by image type and then plot these for the paper.
     """
 
+    from plot import barplot, plot_trial_variability
+
     # format data in friendly way, such that each trial has a separate row
     modelling_data = prepare_modelling_data(data, trials=10)
 
@@ -148,6 +156,33 @@ def run_significance_tests_and_plot(data, line_plot_path, bar_plot_path):
     barplot(modelling_data, save_path=bar_plot_path)
 
 
+def fit_coherency_agent(data, save_path, n_jobs=1):
+    """
+    Fit the Coherency Maximising agent to the sequence of first choices of every participant
+    by maximum likelihood, and save the fitted parameters to a CSV
+    """
+
+    # the agent is implemented alongside the simulation, whose directory must be on the PYTHONPATH
+    from fit import fit_choice_sequences, PARAMETERS
+
+    observations, actions, participants, designs = prepare_choice_sequences(data, trials=10)
+
+    logging.info('Fitting {0:d} participants on {1:d} back designs'.format(len(participants), len(designs)))
+
+    fitted = fit_choice_sequences(observations, actions, n_jobs=n_jobs,
+                                  random_state=np.random.RandomState(30))
+
+    results = pd.DataFrame(dict((key, fitted[key]) for key in PARAMETERS + ['log_likelihood', 'n_trials']),
+                           columns=PARAMETERS + ['log_likelihood', 'n_trials'])
+    results.insert(0, 'Participant', participants)
+
+    logging.info('Median fitted parameters: {0:s}'.format(results[PARAMETERS].median()))
+
+    results.to_csv(save_path, index=False)
+
+    return results
+
+
 def main(config):
     """Main entrypoint for code"""
 
@@ -178,3 +213,7 @@ def main(config):
                 '{0:s}{1:s}_{2:s}'.format(config['plot_savepath'], party, 'line_plot.png'),
                  '{0:s}{1:s}_{2:s}'.format(config['plot_savepath'], party, '2d_axis_plot.png')
                  )
+
+    if config.get('fit_agent', False):
+        logging.info('*** FITTING COHERENCY MAXIMISING AGENT ***')
+        fit_coherency_agent(data, config['plot_savepath'] + 'agent_fits.csv', n_jobs=config.get('n_jobs', 1))
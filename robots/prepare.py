@@ -27,6 +27,28 @@ def qa_results(data):
     logging.info('The gender split was: {0:s}'.format(gender_counts))
 
 
+def _parse_row(data, repeat):
+    """
+    Parse the back configuration and choices of a participant's row of the raw data
+
+    # Parameters
+    :param data: Pandas DataFrame containing raw data, as it is shown in the original CSV
+    :param repeat: Integer index of the row
+    :return: The back configuration and the choices of every trial, or None if the choices cannot be parsed
+    """
+
+    back_config = ast.literal_eval(data.ix[repeat, 'back_config'])
+    choices = data.ix[repeat, 'choices']
+
+    try:
+        choices = ast.literal_eval(choices.replace(',null', ''))
+    except ValueError:
+        print('Skipping row {0:d} because {1:s}'.format(repeat, choices))
+        return None
+
+    return back_config, choices
+
+
 def prepare_modelling_data(data, trials=10):
     """
     Prepare the raw data for statistical analyses
@@ -43,20 +65,10 @@ def prepare_modelling_data(data, trials=10):
     for repeat in range(data.shape[0]):
 
         # subset each row out
-        back_config = data.ix[repeat, 'back_config']
-        back_config = ast.literal_eval(back_config)
+        row = _parse_row(data, repeat)
 
-        choices = data.ix[repeat, 'choices']
-
-        skip = False
-        try:
-            choices = choices.replace(',null', '')
-            choices = ast.literal_eval(choices)
-        except ValueError:
-            skip = True
-            print('Skipping row {0:d} because {1:s}'.format(repeat, choices))
-
-        if not skip:
+        if row is not None:
+            back_config, choices = row
 
             for trial in range(trials):
 
@@ -88,4 +100,61 @@ def prepare_modelling_data(data, trials=10):
                               columns=['Robot Design', 'Trial', 'NotChosen', 'Shared'
                                   , 'Chosen', 'Participant', 'Preference'])
 
-    return final_data
\ No newline at end of file
+    return final_data
+
+def prepare_choice_sequences(data, trials=10):
+    """
+    Prepare each participant's sequence of first choices for fitting the Coherency Maximising agent.
+
+    Every robot is described by one-hot attributes for the backs that it shows: the back shared by both
+    robots and its own unique back. Each trial is therefore a choice between two items, and the action
+    is the robot that was chosen first.
+
+    # Parameters
+    :param data: Pandas DataFrame containing raw data, as it is shown in the original CSV
+    :param trials: Integer describing the number of trials that were run (in this case, =10)
+    :return: Observations (participants x trials x backs x 2), actions (participants x trials), the
+             row of each participant in data and the back design of each attribute
+    """
+
+    sequences = []
+
+    # loop over all rows in the data
+    for repeat in range(data.shape[0]):
+
+        row = _parse_row(data, repeat)
+
+        if row is None:
+            continue
+
+        back_config, choices = row
+
+        trial_data = []
+        for trial in range(trials):
+            backs = back_config[trial]
+
+            items = [[backs['both'][0], backs['robot' + str(robot) + '_back'][0]] for robot in [1, 2]]
+            action = choices[trial][0] - 1  # robots are numbered from 1
+
+            trial_data.append((items, action))
+
+        sequences.append((repeat, trial_data))
+
+    # every back design that was shown is one attribute
+    designs = sorted(set(back for _, trial_data in sequences
+                         for items, _ in trial_data for item in items for back in item))
+    attribute = dict((design, i) for i, design in enumerate(designs))
+
+    observations = np.zeros((len(sequences), trials, len(designs), 2))
+    actions = np.zeros((len(sequences), trials), dtype=int)
+
+    for p, (_, trial_data) in enumerate(sequences):
+        for trial, (items, action) in enumerate(trial_data):
+            for i, item in enumerate(items):
+                observations[p, trial, [attribute[back] for back in item], i] = 1.
+
+            actions[p, trial] = action
+
+    participants = np.array([repeat for repeat, _ in sequences])
+
+    return observations, actions, participants, designs
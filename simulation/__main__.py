@@ -10,7 +10,15 @@ maximize coherency between one's past and present preferences
 """
 
 import argparse
+
+import numpy as np
+
 from simulate import CONFIG, main 
+from sweep import load_sweep, run_sweep
+from recovery import run_recovery
+from profiling import PhaseProfiler, print_progress
+from basins import run_basins, save_basins
+from meanfield import run_mean_field, format_mean_field
 
 
 def initialise_cli_args():
@@ -20,9 +28,31 @@ def initialise_cli_args():
 
     parser.add_argument('output', type=str,
                        help='Location of the directory to output plots')
+    parser.add_argument('--sweep', type=str, default=None,
+                        help='JSON file containing a grid or list of CONFIG overrides to sweep over')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='Number of processes to run the sweep or recovery study in')
+    parser.add_argument('--recovery', type=int, default=None,
+                        help='Run a parameter recovery study with this many synthetic agents')
+    parser.add_argument('--basins', type=int, default=None,
+                        help='Map the basins of attraction of the initial preferences on a grid of this resolution')
+    parser.add_argument('--mean-field', action='store_true',
+                        help='Simulate the expected updates of the agent and compare them with stochastic simulations')
+    parser.add_argument('--network', type=int, default=None,
+                        help='Simulate this many agents on a random social network, learning from their neighbours\' choices')
+    parser.add_argument('--social-weight', type=float, default=0.5,
+                        help='Weight of the neighbours\' choices in what each agent of the --network learns from')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the simulation from the checkpoint in the output directory')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time every phase of the simulation, report progress and print a summary at the end')
 
     args = parser.parse_args()
 
+    # the recovery study and the mean-field map do not run through the profiled simulation loop
+    if args.profile and (args.recovery is not None or args.mean_field):
+        parser.error('--profile cannot be combined with --recovery or --mean-field')
+
     return args
 
 
@@ -32,6 +62,9 @@ def create_config(args, config):
     config.update({
         # output path
         'save_path': args.output, # the path to save the plots
+
+        # resume an interrupted run
+        'resume': args.resume,
     })
 
     return config
@@ -43,5 +76,47 @@ if __name__ == '__main__':
     args = initialise_cli_args()
     config = create_config(args, CONFIG)
 
+    # optionally time the phases of the simulation(s), reporting progress as they run
+    profiler = PhaseProfiler(progress=print_progress) if args.profile else None
+
     # run the analyses
-    main(config)
+    if args.recovery is not None:
+        summary = run_recovery(args.recovery, config['save_path'], config=config, n_jobs=args.n_jobs)
+
+        for name in sorted(summary):
+            print('{0:s}: {1:s}'.format(name, ', '.join('{0:s}={1:.3f}'.format(key, value)
+                                                          for key, value in sorted(summary[name].items()))))
+    elif args.basins is not None:
+        basins = run_basins(config, resolution=args.basins, profiler=profiler)
+        save_basins(basins, config['save_path'] + 'basins.npz')
+
+        # matplotlib and seaborn are slow to import, so only import them when plotting
+        from plot import plot_basins
+        plot_basins(basins, save_path=config['save_path'] + 'basins.eps')
+    elif args.mean_field:
+        mean_field, stochastic, comparison = run_mean_field(config)
+        np.savez(config['save_path'] + 'mean_field.npz', preference=mean_field[0], attention_weights=mean_field[1],
+                 **comparison)
+
+        print(format_mean_field(mean_field, stochastic, comparison))
+    elif args.network is not None:
+        # scipy is slow to import, so only import the network simulation when it is run
+        from network import run_network, format_network
+
+        network = run_network(config, n_agents=args.network, social_weight=args.social_weight, profiler=profiler)
+        np.savez(config['save_path'] + 'network.npz', **network)
+
+        print(format_network(network))
+    elif args.sweep is not None:
+        run_sweep(load_sweep(args.sweep),
+                  config['save_path'] + 'sweep_results.csv',
+                  base_config=config,
+                  n_jobs=args.n_jobs,
+                  profiler=profiler,
+                  progress=print_progress if args.profile else None)
+    else:
+        main(config, profiler=profiler)
+
+    if profiler is not None:
+        print(profiler.format_summary())
+        profiler.dump(config['save_path'] + 'profile.json')
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Analytics of the actions taken during a simulation
+
+Actions are logged with shape (n_timesteps,) for a single agent or (n_timesteps, n_agents) for a
+population (see ActionLog). Streaks (runs of the same action), switches between actions and the time
+at which an agent locks in to a single action are computed with vectorised run-length encoding and
+windowed counts along the time axis, such that whole populations are analysed at once.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+def _as_population(actions):
+    """View the actions of a single agent as those of a population of one"""
+
+    actions = np.asarray(actions)
+
+    return actions.reshape(len(actions), -1)
+
+
+def _windows(n_steps, window):
+    """First step and number of steps of every consecutive window"""
+
+    starts = np.arange(0, n_steps, window)
+
+    return starts, np.diff(np.append(starts, n_steps))
+
+
+def run_lengths(actions):
+    """
+    Run-length encode the actions of every agent into streaks of the same action
+
+    # Parameters
+    actions (numpy.ndarray): Actions of shape (n_timesteps,) or (n_timesteps, n_agents)
+
+    # Returns
+    Dictionary with the agent, first step, length and action of every streak, ordered by agent and then by step
+    """
+
+    # agents along the rows, such that the streaks of every agent are contiguous
+    by_agent = np.ascontiguousarray(_as_population(actions).T)
+    n_steps = by_agent.shape[1]
+
+    # a streak starts on the first step and on every switch
+    starts = np.ones(by_agent.shape, dtype=bool)
+    np.not_equal(by_agent[:, 1:], by_agent[:, :-1], out=starts[:, 1:])
+
+    index = np.flatnonzero(starts)
+
+    return {'agent': index // n_steps,
+            'start': index % n_steps,
+            'length': np.diff(np.append(index, by_agent.size)),
+            'action': by_agent.ravel()[index]}
+
+
+def switch_rates(actions, window=None):
+    """
+    Share of steps on which every agent switched to another action than the one it took on the step before
+
+    # Parameters
+    actions (numpy.ndarray): Actions of shape (n_timesteps,) or (n_timesteps, n_agents)
+    window (int): Compute the rate within consecutive windows of this many steps, rather than over the whole run
+
+    # Returns
+    The switch rate of every agent, of shape (n_agents,), or (n_windows, n_agents) if window is given.
+    The agent axis is dropped for the actions of a single agent
+    """
+
+    population = _as_population(actions)
+    switches = population[1:] != population[:-1]
+
+    if window is None:
+        rates = switches.mean(axis=0)
+    else:
+        starts, sizes = _windows(len(switches), window)
+        rates = np.add.reduceat(switches, starts, axis=0) / sizes[:, np.newaxis]
+
+    return rates if np.ndim(actions) > 1 else rates[..., 0]
+
+
+def time_to_lock_in(actions, window=100, threshold=0.9):
+    """
+    Step at which every agent locked in to the action it ends the run with, i.e. the start of the first
+    window from which on that action makes up at least threshold of the steps of every window
+
+    # Parameters
+    actions (numpy.ndarray): Actions of shape (n_timesteps,) or (n_timesteps, n_agents)
+    window (int): Number of steps per window. Lock-in is resolved to the start of a window
+    threshold (float): Share of the steps in a window on which the final action must be taken
+
+    # Returns
+    The final (most common) action of every agent in the last window, and its step of lock-in or -1 if
+    the agent had not locked in by the end of the run, each of shape (n_agents,) or scalars for the
+    actions of a single agent
+    """
+
+    population = _as_population(actions)
+    n_items = int(population.max()) + 1 if population.size else 1
+
+    # the most common action of every agent in the last window
+    last = population[-window:]
+    counts = np.stack([(last == item).sum(axis=0) for item in range(n_items)])
+    final = np.argmax(counts, axis=0)
+
+    # the share of the final action in every window
+    starts, sizes = _windows(len(population), window)
+    shares = np.add.reduceat(population == final, starts, axis=0) / sizes[:, np.newaxis]
+
+    # lock-in is the window after the last window that fell short of the threshold
+    below = shares < threshold
+    last_below = np.where(below.any(axis=0), len(starts) - 1 - np.argmax(below[::-1], axis=0), -1)
+
+    # agents whose last window fell short have not locked in
+    lock_in = np.append(starts, -1)[last_below + 1]
+
+    if np.ndim(actions) > 1:
+        return final, lock_in
+
+    return final[0], lock_in[0]
+
+
+def summarise_actions(actions, window=100, threshold=0.9, block_size=10000):
+    """
+    Summarise the streaks, switches and lock-in of every agent. Agents are analysed in blocks, which
+    bounds the working memory for large populations
+
+    # Parameters
+    actions (numpy.ndarray): Actions of shape (n_timesteps,) or (n_timesteps, n_agents), e.g. a memory-mapped ActionLog
+    window (int): Number of steps per window, in which lock-in is measured (see time_to_lock_in)
+    threshold (float): Share of the steps in a window on which the final action must be taken to be locked in
+    block_size (int): Number of agents analysed at once
+
+    # Returns
+    Dictionary with the number of streaks, the mean and longest streak length, the switch rate, the
+    final action and the step of lock-in (see time_to_lock_in) of every agent, each of shape (n_agents,)
+    """
+
+    population = _as_population(actions)
+    n_steps, n_agents = population.shape
+
+    keys = ['n_streaks', 'mean_streak', 'longest_streak', 'switch_rate', 'final_action', 'lock_in']
+    summary = dict((key, list()) for key in keys)
+
+    for first in range(0, n_agents, block_size):
+        block = np.asarray(population[:, first:first + block_size])
+
+        runs = run_lengths(block)
+        n_streaks = np.bincount(runs['agent'], minlength=block.shape[1])
+
+        # the first streak of every agent starts on step 0
+        first_streaks = np.flatnonzero(runs['start'] == 0)
+
+        final, lock_in = time_to_lock_in(block, window=window, threshold=threshold)
+
+        summary['n_streaks'].append(n_streaks)
+        summary['mean_streak'].append(n_steps / n_streaks)
+        summary['longest_streak'].append(np.maximum.reduceat(runs['length'], first_streaks))
+        summary['switch_rate'].append((n_streaks - 1) / max(n_steps - 1, 1))
+        summary['final_action'].append(final)
+        summary['lock_in'].append(lock_in)
+
+    return dict((key, np.concatenate(values)) for key, values in summary.items())
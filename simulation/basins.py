@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Basins of attraction of the initial preferences and attention weights
+
+A grid of starting points is laid over two coordinates of the initial state (e.g. the initial
+preference on both attributes), with the remaining coordinates taken from the config. Every starting
+point becomes one agent of a single BatchedCoherencyAgent, so the whole grid is simulated in one
+vectorised pass. The final state of every agent is then classified by the choice type (cluster)
+its preference settled on.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from model import BatchedCoherencyAgent
+from record import TrajectoryRecorder
+from convergence import ConvergenceMonitor
+from simulate import simulate_blobs, simulate_population_choices
+
+# coordinates of the initial state spanned by the grid, as (vector, attribute) pairs
+DEFAULT_AXES = (('preference', 0), ('preference', 1))
+
+
+def start_grid(config, resolution=200, axes=DEFAULT_AXES, limits=((0., 1.), (0., 1.))):
+    """
+    Lay a grid of starting points over two coordinates of the initial state
+
+    # Parameters
+    config (dict): Simulation config, as in CONFIG, from which the other coordinates are taken
+    resolution (int): Number of grid points along each axis
+    axes (tuple): The two coordinates spanned by the grid, as ('preference' or 'weights', attribute) pairs
+    limits (tuple): (lower, upper) limits of each axis
+
+    # Returns
+    Initial preferences and attention weights of shape (resolution ** 2, n_attributes), with the
+    grid points ordered row by row (i.e. along the first axis fastest), and the values along each axis
+    """
+
+    n_attributes = len(config['cluster_centers'][0])
+    n_starts = resolution ** 2
+
+    starts = {
+        'preference': np.tile(np.asarray(config['preference'], dtype=float), (n_starts, 1)),
+        'weights': np.tile(np.asarray(config['weights'], dtype=float), (n_starts, 1)),
+    }
+
+    values = [np.linspace(low, high, resolution) for low, high in limits]
+    grid = np.meshgrid(*values)
+
+    for (vector, attribute), coordinate in zip(axes, grid):
+        if vector not in starts or not 0 <= attribute < n_attributes:
+            raise ValueError('Unknown axis ({0:s}, {1:d})'.format(vector, attribute))
+
+        starts[vector][:, attribute] = coordinate.ravel()
+
+    return starts['preference'], starts['weights'], values
+
+
+def classify_attractors(preferences, attention_weights, centers):
+    """
+    Label every agent with the cluster nearest to its preference, measured with its own attention weights
+
+    # Parameters
+    preferences (numpy.ndarray): Preferences of shape (n_agents, n_attributes)
+    attention_weights (numpy.ndarray): Attention weights of shape (n_agents, n_attributes)
+    centers (numpy.ndarray): Cluster centers of shape (n_clusters, n_attributes)
+
+    # Returns
+    The index of the nearest cluster of every agent
+    """
+
+    centers = np.asarray(centers, dtype=float)
+    distance = np.einsum('na,nka->nk', attention_weights,
+                         np.square(preferences[:, np.newaxis, :] - centers[np.newaxis]))
+
+    return np.argmin(distance, axis=1)
+
+
+def run_basins(config, resolution=200, axes=DEFAULT_AXES, limits=((0., 1.), (0., 1.)), random_state=None,
+               profiler=None):
+    """
+    Simulate every starting point of a grid and classify the attractor it ends up in
+
+    # Parameters
+    config (dict): Simulation config, as in CONFIG
+    resolution (int): Number of grid points along each axis
+    axes (tuple): The two coordinates spanned by the grid (see start_grid)
+    limits (tuple): (lower, upper) limits of each axis
+    random_state (numpy.random.RandomState): Random state to simulate choices with. Defaults to the global state
+    profiler (PhaseProfiler): Optional profiler, timing every phase of the simulation loop
+
+    # Returns
+    Dictionary with the attractor labels of shape (resolution, resolution), in which rows follow the
+    second axis and columns the first, the final preferences and attention weights of shape
+    (resolution, resolution, n_attributes) and the values along each axis. Agents that had not
+    converged by the end of the run (if convergence_window is set) are labelled -1.
+    """
+
+    X, y = simulate_blobs(config['cluster_centers'],
+                          n_samples=config['n_choices'],
+                          cluster_std=config['cluster_std'])
+
+    p_init, w_init, values = start_grid(config, resolution=resolution, axes=axes, limits=limits)
+    n_agents, n_attributes = p_init.shape
+
+    agent = BatchedCoherencyAgent(n_agents, config['n_items'], n_attributes,
+                                  c=config['c'], p_eta=config['lr'], w_eta=config['lr'],
+                                  learn_prefs=True, learn_weights=True,
+                                  p_init=p_init, w_init=w_init, dtype=config['dtype'])
+
+    # only the final states are classified
+    recorder = TrajectoryRecorder(config['n_timesteps'], n_attributes, n_agents=n_agents, final_only=True,
+                                  dtype=agent.dtype)
+
+    # freeze agents once they have settled, and stop once all of them have
+    monitor = None
+    if config['convergence_window'] is not None:
+        monitor = ConvergenceMonitor(window=config['convergence_window'], tol=config['convergence_tol'],
+                                     n_agents=n_agents)
+
+    pref_hist, att_hist = simulate_population_choices(X, y, agent, config['n_timesteps'],
+                                                      epsilon=config['epsilon'],
+                                                      epsilon_greedy=config['epsilon_greedy'],
+                                                      random_state=random_state,
+                                                      recorder=recorder,
+                                                      monitor=monitor,
+                                                      profiler=profiler)
+
+    labels = classify_attractors(pref_hist[-1], att_hist[-1], config['cluster_centers'])
+
+    if monitor is not None:
+        labels[~monitor.converged_] = -1
+
+    return {
+        'labels': labels.reshape(resolution, resolution),
+        'preference': pref_hist[-1].reshape(resolution, resolution, n_attributes),
+        'attention_weights': att_hist[-1].reshape(resolution, resolution, n_attributes),
+        'x': values[0],
+        'y': values[1],
+    }
+
+
+def save_basins(basins, path):
+    """Save the output of run_basins to an .npz file"""
+
+    with open(path, 'wb') as f:
+        np.savez(f, **basins)
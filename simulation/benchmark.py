@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Micro and macro benchmarks of the simulation engine
+
+Micro benchmarks time SimilarityLayer.feed_forward, SimilarityLayer.compute_gradient and
+update_agent (of a single agent and of a BatchedCoherencyAgent population) for choice sets of
+2 to 100 items and attributes. Macro benchmarks time whole runs of simulate_choices and
+simulate_population_choices of 10^3 to 10^6 steps, and measure their peak memory in a separate
+run. Results are stored as JSON and can be compared against a saved baseline to flag regressions.
+
+usage: python benchmark.py output.json [--baseline baseline.json] [--tolerance 0.2] [--quick]
+"""
+
+from __future__ import division, print_function
+
+import sys
+import json
+import time
+import platform
+import argparse
+import timeit
+
+import numpy as np
+
+from model import CoherencyMaximisingAgent, BatchedCoherencyAgent
+from sampler import ChoiceSetSampler, make_blobs, random_cluster_centers
+from simulate import simulate_choices, simulate_population_choices
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SIZES = [2, 10, 100]
+N_AGENTS = 1000
+SINGLE_STEPS = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+POPULATION_STEPS = [10 ** 3, 10 ** 4]
+
+
+def create_environment(n_items, n_attributes, n_samples=1000, random_state=0):
+    """Create a choice set sampler with one cluster per item, in an n_attributes dimensional space"""
+
+    rng = np.random.RandomState(random_state)
+    centers = random_cluster_centers(n_items, n_attributes, random_state=rng)
+    X, y = make_blobs(centers, n_samples=max(n_samples, n_items), cluster_std=0.05, random_state=rng)
+
+    return X, y, ChoiceSetSampler(np.clip(X, 0, 1), y, n_items=n_items)
+
+
+def create_single_agent(n_items, n_attributes):
+    return CoherencyMaximisingAgent(n_items, n_attributes, c=1., p_eta=0.01, w_eta=0.01,
+                                    learn_prefs=True, learn_weights=True,
+                                    p_init=[0.5] * n_attributes, track_history=False)
+
+
+def create_population(n_items, n_attributes, n_agents=N_AGENTS):
+    return BatchedCoherencyAgent(n_agents, n_items, n_attributes, c=1., p_eta=0.01, w_eta=0.01,
+                                 learn_prefs=True, learn_weights=True, p_init=0.5)
+
+
+def time_call(fn, repeat=5, min_time=0.05):
+    """
+    Time fn, calling it often enough that each measurement takes at least min_time
+
+    # Returns
+    The best time per call over repeat measurements, in seconds
+    """
+
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    return min([elapsed] + [timeit.timeit(fn, number=number) for _ in range(repeat - 1)]) / number
+
+
+def peak_memory(fn):
+    """
+    Run fn and return its peak memory in MB. Uses tracemalloc where it is available, which measures
+    the peak of fn itself. Otherwise falls back to the peak resident size of the whole process.
+    """
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return peak / 2 ** 20
+
+    import resource
+
+    fn()
+
+    # ru_maxrss is in kilobytes on linux, bytes on mac
+    scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def micro_benchmarks(sizes=SIZES):
+    """Time the forward pass, the gradient and the update of a single agent and of a population"""
+
+    results = dict()
+
+    for n_items in sizes:
+        for n_attributes in sizes:
+            _, _, sampler = create_environment(n_items, n_attributes)
+            size = 'items={0:d},attributes={1:d}'.format(n_items, n_attributes)
+
+            # single agent
+            agent = create_single_agent(n_items, n_attributes)
+            observation = sampler.sample(random_state=np.random.RandomState(0))
+            agent.feed_forward(observation)
+            o_grad = agent.h1.compute_gradient(agent.h1.activations_[0], np.eye(n_items)[0])
+
+            results['single/feed_forward/' + size] = time_call(lambda: agent.h0.feed_forward(observation))
+            results['single/compute_gradient/' + size] = time_call(lambda: agent.h0.compute_gradient(o_grad))
+            results['single/update_agent/' + size] = time_call(lambda: agent.update_agent(observation, 0))
+
+            # population
+            population = create_population(n_items, n_attributes)
+            observations = sampler.sample(n_sets=N_AGENTS, random_state=np.random.RandomState(0))
+            actions = np.zeros(N_AGENTS, dtype=int)
+            probs = population.feed_forward(observations)
+
+            results['population/feed_forward/' + size] = time_call(lambda: population.feed_forward(observations))
+            results['population/compute_gradient/' + size] = time_call(
+                lambda: population.compute_gradients(probs, actions))
+            results['population/update_agent/' + size] = time_call(
+                lambda: population.update_agent(observations, actions))
+
+    return dict((name, {'seconds': seconds}) for name, seconds in results.items())
+
+
+def macro_benchmarks(single_steps=SINGLE_STEPS, population_steps=POPULATION_STEPS, n_items=2, n_attributes=2):
+    """Time whole simulations (best of three if under a second) and measure their peak memory in a separate run"""
+
+    X, y, sampler = create_environment(n_items, n_attributes)
+    runs = dict()
+
+    for n_steps in single_steps:
+        def run(n_steps=n_steps):
+            agent = create_single_agent(n_items, n_attributes)
+            simulate_choices(X, y, agent, n_steps, random_state=np.random.RandomState(0), sampler=sampler)
+
+        runs['single/simulate_choices/steps={0:d}'.format(n_steps)] = run
+
+    for n_steps in population_steps:
+        def run(n_steps=n_steps):
+            population = create_population(n_items, n_attributes)
+            simulate_population_choices(X, y, population, n_steps, random_state=np.random.RandomState(0),
+                                        sampler=sampler)
+
+        runs['population/simulate_choices/agents={0:d},steps={1:d}'.format(N_AGENTS, n_steps)] = run
+
+    results = dict()
+    for name, run in sorted(runs.items()):
+        seconds = timeit.timeit(run, number=1)
+
+        # short runs are noisy, so keep the best of a few
+        if seconds < 1.:
+            seconds = min([seconds] + [timeit.timeit(run, number=1) for _ in range(2)])
+
+        results[name] = {'seconds': seconds, 'peak_memory_mb': peak_memory(run)}
+
+    return results
+
+
+def run_benchmarks(quick=False):
+    """
+    Run the micro and macro benchmarks
+
+    # Parameters
+    quick (bool): Skip the largest sizes and the longest runs
+
+    # Returns
+    Dictionary with a description of the machine and the results of every benchmark
+    """
+
+    sizes = SIZES[:2] if quick else SIZES
+    single_steps = SINGLE_STEPS[:2] if quick else SINGLE_STEPS
+    population_steps = POPULATION_STEPS[:1] if quick else POPULATION_STEPS
+
+    results = micro_benchmarks(sizes)
+    results.update(macro_benchmarks(single_steps, population_steps))
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def load_baseline(path):
+    """
+    Load the results of an earlier run_benchmarks to compare against, checking that they hold results
+
+    # Parameters
+    path (str): Location of the JSON results
+
+    # Returns
+    The results, as returned by run_benchmarks
+    """
+
+    with open(path, 'r') as f:
+        baseline = json.load(f)
+
+    if not isinstance(baseline, dict) or not isinstance(baseline.get('results'), dict):
+        raise ValueError('{0:s} does not hold benchmark results'.format(path))
+
+    for name, metrics in baseline['results'].items():
+        if not isinstance(metrics, dict) or not isinstance(metrics.get('seconds'), (int, float)):
+            raise ValueError('{0:s} holds no time of the benchmark {1:s}'.format(path, name))
+
+    return baseline
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Compare benchmark results against a baseline
+
+    # Parameters
+    results (dict): Results of run_benchmarks
+    baseline (dict): Results of an earlier run_benchmarks, e.g. loaded from JSON
+    tolerance (float): Relative slowdown (or memory increase) above which a benchmark counts as a regression
+
+    # Returns
+    List of (name, metric, baseline value, new value) tuples, one per regression
+    """
+
+    regressions = list()
+
+    for name, metrics in sorted(results['results'].items()):
+        if name not in baseline['results']:
+            continue
+
+        for metric, value in sorted(metrics.items()):
+            previous = baseline['results'][name].get(metric)
+
+            if previous is not None and value > previous * (1 + tolerance):
+                regressions.append((name, metric, previous, value))
+
+    return regressions
+
+
+def format_results(results, baseline=None):
+    """Format the results (and their change relative to the baseline) as a table"""
+
+    lines = ['{0:<70s} {1:>14s} {2:>12s} {3:>9s}'.format('benchmark', 'time', 'memory (MB)', 'change')]
+
+    for name, metrics in sorted(results['results'].items()):
+        seconds = metrics['seconds']
+        time_str = '{0:.2f}us'.format(seconds * 1e6) if seconds < 1e-2 else '{0:.3f}s'.format(seconds)
+        memory_str = '{0:.1f}'.format(metrics['peak_memory_mb']) if 'peak_memory_mb' in metrics else ''
+
+        change = ''
+        if baseline is not None and name in baseline['results']:
+            change = '{0:+.0%}'.format(seconds / baseline['results'][name]['seconds'] - 1)
+
+        lines.append('{0:<70s} {1:>14s} {2:>12s} {3:>9s}'.format(name, time_str, memory_str, change))
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the simulation engine')
+    parser.add_argument('output', type=str, help='JSON file to save the results to')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown above which a benchmark counts as a regression')
+    parser.add_argument('--quick', action='store_true', help='Skip the largest sizes and the longest runs')
+    args = parser.parse_args()
+
+    # check the baseline before spending minutes on the benchmarks
+    baseline = None
+    if args.baseline is not None:
+        try:
+            baseline = load_baseline(args.baseline)
+        except (IOError, ValueError) as e:
+            parser.error('cannot compare against the baseline: {0}'.format(e))
+
+    results = run_benchmarks(quick=args.quick)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    print(format_results(results, baseline))
+
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+
+        for name, metric, previous, value in regressions:
+            print('REGRESSION {0:s} {1:s}: {2:.4g} -> {3:.4g}'.format(name, metric, previous, value))
+
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Checkpointing of long simulation runs, such that an interrupted run can be resumed exactly
+where it stopped and produce the same results as an uninterrupted run
+"""
+
+from __future__ import division
+
+import os
+import numpy as np
+
+# parameters of the agent that a checkpoint must have been saved with to be restored into it
+AGENT_PARAMETERS = ['n_items', 'c', 'p_eta', 'a_eta']
+
+
+class Checkpointer(object):
+    """
+    Periodically saves the state of a simulation run to a compressed .npz file. The checkpoint holds
+    the step counter, the state of the random stream, the agent's parameters, preference, attention
+    weights and streaks, the history recorded so far, the state of the convergence monitor (if any) and
+    the actions logged so far (if any).
+
+    # Parameters
+    path (str): Location of the checkpoint file
+    every (int): Save a checkpoint every this many timesteps, or None to only ever restore
+    """
+    def __init__(self, path, every=100000):
+        super(Checkpointer, self).__init__()
+        self.path = path
+        self.every = every
+
+    def exists(self):
+        """Whether there is a checkpoint to resume from"""
+
+        return os.path.exists(self.path)
+
+    def due(self, previous_step, step):
+        """Whether a checkpoint should be saved after advancing from previous_step to step"""
+
+        return self.every is not None and step // self.every > previous_step // self.every
+
+    def save(self, step, model, rng_state, recorder, monitor=None, action_log=None):
+        """
+        Save a checkpoint of the run
+
+        # Parameters
+        step (int): Number of timesteps completed
+        model (CoherencyMaximisingAgent): Model agent
+        rng_state (tuple): State of the random stream from which the run continues (see RandomPlan.get_state)
+        recorder (TrajectoryRecorder): Recorder of the preference and attention history
+        monitor (ConvergenceMonitor): Optional convergence monitor of the run
+        action_log (ActionLog): Optional log of the actions of the run
+        """
+
+        _, keys, pos, has_gauss, cached_gaussian = rng_state
+
+        arrays = {
+            'step': step,
+            'rng_keys': keys,
+            'rng_pos': pos,
+            'rng_has_gauss': has_gauss,
+            'rng_cached_gaussian': cached_gaussian,
+            'preference': model.h0.preference_,
+            'attention_weights': model.h0.attention_weights_,
+            'actions_taken': model.actions_taken_,
+            'streak': model.streak_,
+            'streak_lengths': np.asarray(model.streak_lengths_, dtype=int),
+            'last_chosen': getattr(model, 'last_chosen_', -1),
+        }
+
+        for name in AGENT_PARAMETERS:
+            arrays['agent_' + name] = getattr(model, name)
+
+        for key, value in recorder.get_state().items():
+            arrays['recorder_' + key] = value
+
+        if monitor is not None:
+            for key, value in monitor.get_state().items():
+                arrays['monitor_' + key] = value
+
+        if action_log is not None:
+            for key, value in action_log.get_state().items():
+                arrays['action_log_' + key] = value
+
+        # write to a temporary file first, such that an interruption never leaves a corrupt checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+        os.rename(tmp_path, self.path)
+
+    def _check(self, checkpoint, model, recorder, monitor=None, action_log=None):
+        """Raise a ValueError if the checkpoint was saved by another run than the one it is restored into"""
+
+        problems = list()
+
+        expected = {'preference': model.h0.preference_, 'attention_weights': model.h0.attention_weights_}
+        for key, value in recorder.get_state().items():
+            expected['recorder_' + key] = value
+
+        for key, value in sorted(expected.items()):
+            if key not in checkpoint.files:
+                problems.append('no {0:s}'.format(key))
+                continue
+
+            value = np.asarray(value)
+            stored = checkpoint[key]
+
+            if key.startswith('recorder_') and value.ndim > 0:
+                # the recorder only saves the rows it has recorded so far
+                fits = stored.shape[1:] == value.shape[1:] and len(stored) <= recorder.n_kept
+            else:
+                fits = stored.shape == value.shape
+
+            if not fits or stored.dtype.kind != value.dtype.kind:
+                problems.append('{0:s} of shape {1} ({2:s}), but the run has {3} ({4:s})'.format(
+                    key, stored.shape, stored.dtype.name, value.shape, value.dtype.name))
+
+        if checkpoint['preference'].dtype != model.dtype:
+            problems.append('an agent of dtype {0:s}, but the run has {1:s}'.format(
+                checkpoint['preference'].dtype.name, model.dtype.name))
+
+        for name in AGENT_PARAMETERS:
+            key = 'agent_' + name
+
+            if not np.array_equal(checkpoint[key], getattr(model, name)):
+                problems.append('{0:s}={1}, but the run has {2}'.format(name, checkpoint[key], getattr(model, name)))
+
+        if monitor is not None and 'monitor_converged' in checkpoint.files:
+            if (int(checkpoint['monitor_window']) != monitor.window or
+                    int(checkpoint['monitor_bucket_size']) != monitor.bucket_size or
+                    checkpoint['monitor_converged'].shape != monitor.converged_.shape):
+                problems.append('a convergence monitor of window {0:d} (buckets of {1:d}) over {2:d} agents, but the '
+                                'run monitors a window of {3:d} (buckets of {4:d}) over {5:d}'.format(
+                                    int(checkpoint['monitor_window']), int(checkpoint['monitor_bucket_size']),
+                                    len(checkpoint['monitor_converged']), monitor.window, monitor.bucket_size,
+                                    len(monitor.converged_)))
+
+        if action_log is not None and 'action_log_count' in checkpoint.files:
+            stored = checkpoint['action_log_actions']
+
+            if stored.shape[1:] != action_log.actions_.shape[1:] or len(stored) > len(action_log.actions_):
+                problems.append('actions of shape {0}, but the run logs {1}'.format(stored.shape,
+                                                                                   action_log.actions_.shape))
+
+        if problems:
+            raise ValueError('The checkpoint {0:s} was saved by a different run, it holds {1:s}. Remove it or run '
+                             'without resuming'.format(self.path, '; '.join(problems)))
+
+    def restore(self, model, random_state, recorder, monitor=None, action_log=None):
+        """
+        Restore the state of a run from the checkpoint. The checkpoint must have been saved by a run with the
+        same agent, recording and action log as this one, otherwise a ValueError is raised before anything is restored
+
+        # Parameters
+        model (CoherencyMaximisingAgent): Model agent, initialised as for the interrupted run
+        random_state (numpy.random.RandomState): Random state of the run. Defaults to the global state
+        recorder (TrajectoryRecorder): Recorder, initialised as for the interrupted run
+        monitor (ConvergenceMonitor): Optional convergence monitor, initialised as for the interrupted run
+        action_log (ActionLog): Optional action log, initialised as for the interrupted run
+
+        # Returns
+        The timestep from which to resume the run
+        """
+
+        rng = np.random if random_state is None else random_state
+
+        with np.load(self.path) as checkpoint:
+            self._check(checkpoint, model, recorder, monitor, action_log=action_log)
+
+            rng.set_state(('MT19937',
+                           checkpoint['rng_keys'],
+                           int(checkpoint['rng_pos']),
+                           int(checkpoint['rng_has_gauss']),
+                           float(checkpoint['rng_cached_gaussian'])))
+
+            model.h0.preference_ = checkpoint['preference']
+            model.h0.attention_weights_ = checkpoint['attention_weights']
+
+            model.actions_taken_ = int(checkpoint['actions_taken'])
+            model.streak_ = int(checkpoint['streak'])
+            model.streak_lengths_ = checkpoint['streak_lengths'].tolist()
+
+            if model.actions_taken_ > 0:
+                model.last_chosen_ = int(checkpoint['last_chosen'])
+
+            recorder.set_state(dict((key[len('recorder_'):], checkpoint[key])
+                                    for key in checkpoint.files if key.startswith('recorder_')))
+
+            if monitor is not None and 'monitor_converged' in checkpoint.files:
+                monitor.set_state(dict((key[len('monitor_'):], checkpoint[key])
+                                       for key in checkpoint.files if key.startswith('monitor_')))
+
+            if action_log is not None and 'action_log_count' in checkpoint.files:
+                action_log.set_state(dict((key[len('action_log_'):], checkpoint[key])
+                                          for key in checkpoint.files if key.startswith('action_log_')))
+
+            return int(checkpoint['step'])
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+pytest configuration of the simulation tests. The simulation modules import each other by their flat
+names (as when running `python simulation/`), so their directory is put on the path.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
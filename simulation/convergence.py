@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Detection of agents that have settled into a coherent preference
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class ConvergenceMonitor(object):
+    """
+    Monitors the drift of preferences (and attention weights) over a rolling window of timesteps.
+
+    After every step, the range (max - min) of each preference and attention weight over the window that
+    ends at that step is measured. An agent has converged once that range is below tol on every attribute.
+    Its time to coherence is the first timestep of that window. Converged agents remain converged.
+    Attention weights are not bounded and keep growing whilst an agent settles, so the attention that
+    the agent pays to every attribute is measured as its share of the total attention.
+
+    The window is divided into n_buckets buckets, of which only the minimum and maximum are kept. The
+    window rolls forward on every step, whilst its start moves a bucket at a time, such that it spans
+    between window and window + window / n_buckets - 1 steps. n_buckets=window measures every window of
+    exactly window steps, at the cost of keeping window minima and maxima for every agent.
+
+    # Parameters
+    window (int): Number of timesteps in each window
+    tol (float): Largest drift within a window for which an agent counts as converged
+    n_agents (int): Number of agents in the population, or None when monitoring a single agent
+    track_attention (bool): Whether the attention weights must have settled too
+    n_buckets (int): Number of buckets the window is divided into
+    """
+    def __init__(self, window=500, tol=1e-3, n_agents=None, track_attention=True, n_buckets=20):
+        super(ConvergenceMonitor, self).__init__()
+        self.window = window
+        self.tol = tol
+        self.n_agents = n_agents
+        self.track_attention = track_attention
+
+        self.bucket_size = -(-window // min(n_buckets, window))
+        self.n_buckets = -(-window // self.bucket_size)
+
+        n = 1 if n_agents is None else n_agents
+        self.converged_ = np.zeros(n, dtype=bool)
+        self.time_to_coherence_ = np.full(n, -1, dtype=int)
+
+        # the step at which every agent had converged
+        self.done_step_ = -1
+
+        # the extrema of the bucket being filled, and of the newest 1, 2, ... complete buckets
+        self._steps_in_bucket = 0
+        self._n_complete = 0
+        self._low = None
+        self._high = None
+        self._newest_low = None
+        self._newest_high = None
+
+    @property
+    def done(self):
+        """Whether every agent has converged"""
+
+        return bool(self.converged_.all())
+
+    def _states(self, preferences, attention_weights):
+        """
+        Stack the monitored states of a block of steps into an array of shape (n_steps, n_states, n_agents).
+        The states of every agent lie along the middle axis, across which they are reduced quickly
+        """
+
+        n_steps = len(preferences)
+        n = len(self.converged_)
+
+        preferences = np.reshape(preferences, (n_steps, n, -1))
+        n_attributes = preferences.shape[2]
+
+        states = np.empty((n_steps, n_attributes * (2 if self.track_attention else 1), n), dtype=preferences.dtype)
+        states[:, :n_attributes] = np.swapaxes(preferences, 1, 2)
+
+        if self.track_attention:
+            # the share of the (non-negative) attention weights paid to every attribute
+            shares = states[:, n_attributes:]
+            shares[:] = np.swapaxes(np.reshape(attention_weights, (n_steps, n, -1)), 1, 2)
+
+            total = shares.sum(axis=1, keepdims=True)
+            np.divide(shares, total, out=shares, where=total > 0)
+
+        return states
+
+    def update_block(self, t, preferences, attention_weights):
+        """
+        Update the monitor with the states after a block of consecutive steps, starting at step t
+
+        # Parameters
+        t (int): Step of the simulation at the start of the block
+        preferences (numpy.ndarray): Preference vector(s) after every step of the block
+        attention_weights (numpy.ndarray): Attention weight vector(s) after every step of the block
+
+        # Returns
+        Whether every agent has converged
+        """
+
+        states = self._states(preferences, attention_weights)
+        start = 0
+
+        while start < len(states) and not self.done:
+            # the part of the block that falls within the current bucket
+            stop = min(len(states), start + self.bucket_size - self._steps_in_bucket)
+            self._update_bucket(t + start, states[start:stop])
+
+            start = stop
+
+        return self.done
+
+    def update(self, t, preference, attention_weights):
+        """
+        Update the monitor with the state of the agent(s) after step t
+
+        # Returns
+        Whether every agent has converged
+        """
+
+        return self.update_block(t, np.asarray(preference)[np.newaxis], np.asarray(attention_weights)[np.newaxis])
+
+    def _update_bucket(self, t, segment):
+        """Measure the windows that end on the steps of a segment of the current bucket, starting at step t"""
+
+        # the extrema of the bucket up to every step of the segment
+        if len(segment) > 1:
+            low, high = np.minimum.accumulate(segment, axis=0), np.maximum.accumulate(segment, axis=0)
+        else:
+            low, high = segment.copy(), segment.copy()
+
+        if self._steps_in_bucket > 0:
+            np.minimum(low, self._low, out=low)
+            np.maximum(high, self._high, out=high)
+
+        # every window is made up of the current bucket and as many complete buckets as make up the window
+        in_bucket = self._steps_in_bucket + 1 + np.arange(len(segment))
+        n_buckets = -(-np.maximum(self.window - in_bucket, 0) // self.bucket_size)
+
+        window_steps = in_bucket + n_buckets * self.bucket_size
+        complete = n_buckets <= self._n_complete
+
+        drift = high - low
+
+        # windows that reach back into complete buckets, over the same number of buckets for a run of steps
+        for n_previous in sorted(set(n_buckets[complete & (n_buckets > 0)].tolist())):
+            steps = np.flatnonzero(n_buckets == n_previous)
+            steps = slice(steps[0], steps[-1] + 1)
+
+            drift[steps] = (np.maximum(high[steps], self._newest_high[n_previous - 1]) -
+                            np.minimum(low[steps], self._newest_low[n_previous - 1]))
+
+        settled = (drift.max(axis=1) < self.tol) & complete[:, np.newaxis]
+
+        # the first window over which every agent settled
+        newly_converged = settled.any(axis=0) & ~self.converged_
+
+        if newly_converged.any():
+            first = np.argmax(settled[:, newly_converged], axis=0)
+
+            self.converged_ |= newly_converged
+            self.time_to_coherence_[newly_converged] = t + first - window_steps[first] + 1
+
+            if self.done:
+                self.done_step_ = t + int(first.max())
+
+        self._low, self._high = low[-1], high[-1]
+        self._steps_in_bucket += len(segment)
+
+        if self._steps_in_bucket == self.bucket_size:
+            self._close_bucket()
+
+    def _close_bucket(self):
+        """Add the extrema of the full bucket to those of the newest complete buckets"""
+
+        if self._newest_low is None:
+            shape = (self.n_buckets,) + self._low.shape
+            self._newest_low = np.empty(shape, dtype=self._low.dtype)
+            self._newest_high = np.empty(shape, dtype=self._high.dtype)
+
+        n = min(self._n_complete, self.n_buckets - 1)
+        for k in range(n, 0, -1):
+            np.minimum(self._newest_low[k - 1], self._low, out=self._newest_low[k])
+            np.maximum(self._newest_high[k - 1], self._high, out=self._newest_high[k])
+
+        self._newest_low[0] = self._low
+        self._newest_high[0] = self._high
+
+        self._n_complete = n + 1
+        self._steps_in_bucket = 0
+
+    def get_state(self):
+        """Return the state of the monitor as a dictionary of arrays, for checkpointing"""
+
+        state = {'window': self.window,
+                 'bucket_size': self.bucket_size,
+                 'converged': self.converged_,
+                 'time_to_coherence': self.time_to_coherence_,
+                 'done_step': self.done_step_,
+                 'steps_in_bucket': self._steps_in_bucket,
+                 'n_complete': self._n_complete}
+
+        if self._steps_in_bucket > 0:
+            state.update({'low': self._low, 'high': self._high})
+
+        if self._n_complete > 0:
+            state.update({'newest_low': self._newest_low[:self._n_complete],
+                          'newest_high': self._newest_high[:self._n_complete]})
+
+        return state
+
+    def set_state(self, state):
+        """Restore the state of the monitor from a dictionary created by get_state"""
+
+        self.converged_ = np.array(state['converged'], dtype=bool)
+        self.time_to_coherence_ = np.array(state['time_to_coherence'], dtype=int)
+        self.done_step_ = int(state['done_step'])
+        self._steps_in_bucket = int(state['steps_in_bucket'])
+        self._n_complete = int(state['n_complete'])
+
+        if self._steps_in_bucket > 0:
+            self._low, self._high = np.array(state['low']), np.array(state['high'])
+
+        if self._n_complete > 0:
+            low, high = np.asarray(state['newest_low']), np.asarray(state['newest_high'])
+
+            self._newest_low = np.empty((self.n_buckets,) + low.shape[1:], dtype=low.dtype)
+            self._newest_high = np.empty((self.n_buckets,) + high.shape[1:], dtype=high.dtype)
+            self._newest_low[:self._n_complete] = low
+            self._newest_high[:self._n_complete] = high
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Vectorised environments, which generate the choice sets of a simulation
+
+An environment hands out a batch of choice sets (one per agent) on reset, and takes the batch of
+actions that the agents chose on every step before handing out the next batch. The simulation loop
+only talks to the environment and the agent, such that new task designs plug in without touching
+the loop. Like the ChoiceSetSampler, every environment turns uniform numbers into choice sets, so
+that its random numbers can be drawn in blocks by a RandomPlan.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class ChoiceEnvironment(object):
+    """
+    Base class of the environments, which runs the steps of an environment. Subclasses define
+    n_uniforms, the number of uniform numbers every agent needs on every step, and observe(uniforms),
+    which turns uniforms of shape batch_shape + (n_uniforms,) into the choice sets of the current step,
+    of shape batch_shape + (n_attributes, n_items). They may override transition to change the
+    environment in response to the agents' actions.
+
+    # Parameters
+    n_items (int): How many options are in each choice set?
+    n_attributes (int): How many attributes belong to each choice?
+    n_agents (int): Number of agents acting in the environment in lockstep, or None for a single agent
+    dtype (numpy.dtype): Floating point type of the choice sets
+    """
+    def __init__(self, n_items, n_attributes, n_agents=None, dtype=float):
+        super(ChoiceEnvironment, self).__init__()
+        self.n_items = n_items
+        self.n_attributes = n_attributes
+        self.n_agents = n_agents
+        self.dtype = np.dtype(dtype)
+
+        self.batch_shape = () if n_agents is None else (n_agents,)
+        self.t_ = 0
+
+    def transition(self, actions):
+        """Change the environment in response to the agents' actions. Stationary environments do nothing"""
+
+        pass
+
+    def _uniforms(self, uniforms, random_state):
+        """Draw the uniforms of a step, unless they were given"""
+
+        if uniforms is not None:
+            return uniforms
+
+        rng = np.random if random_state is None else random_state
+
+        return rng.rand(*(self.batch_shape + (self.n_uniforms,)))
+
+    def reset(self, uniforms=None, random_state=None, t=0):
+        """
+        Start a run of the environment
+
+        # Parameters
+        uniforms (numpy.ndarray): Optional uniforms of the first step, otherwise they are drawn from random_state
+        random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+        t (int): Step to start from, e.g. when resuming a run from a checkpoint
+
+        # Returns
+        The choice sets of the first step
+        """
+
+        self.t_ = t
+
+        return self.observe(self._uniforms(uniforms, random_state))
+
+    def step(self, actions, uniforms=None, random_state=None):
+        """
+        Take the agents' actions and move on to the next step
+
+        # Parameters
+        actions (int or numpy.ndarray): The item chosen by every agent
+        uniforms (numpy.ndarray): Optional uniforms of the next step, otherwise they are drawn from random_state
+        random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+        # Returns
+        The choice sets of the next step
+        """
+
+        self.transition(actions)
+        self.t_ += 1
+
+        return self.observe(self._uniforms(uniforms, random_state))
+
+
+class ClusterEnvironment(ChoiceEnvironment):
+    """
+    Choice sets drawn from fixed clusters of options (i.e. choice types), as in the original simulation
+
+    # Parameters
+    sampler (ChoiceSetSampler): Sampler of the choice sets
+    n_agents (int): Number of agents acting in the environment in lockstep, or None for a single agent
+    """
+    def __init__(self, sampler, n_agents=None):
+        self.sampler = sampler
+
+        super(ClusterEnvironment, self).__init__(sampler.n_items, sampler.n_attributes, n_agents=n_agents,
+                                                 dtype=sampler.dtype)
+
+    @property
+    def n_uniforms(self):
+        return self.sampler.n_uniforms
+
+    def observe(self, uniforms):
+        return self.sampler.from_uniforms(uniforms)
+
+
+class DriftingClusterEnvironment(ClusterEnvironment):
+    """
+    Choice sets drawn from clusters whose centers drift through the space at a constant velocity.
+    Options are kept within the space (between 0 and 1).
+
+    # Parameters
+    sampler (ChoiceSetSampler): Sampler of the choice sets at the first step
+    drift (numpy.ndarray): Distance every cluster moves along every attribute per step, of shape (n_clusters, n_attributes)
+    n_agents (int): Number of agents acting in the environment in lockstep, or None for a single agent
+    """
+    def __init__(self, sampler, drift, n_agents=None):
+        super(DriftingClusterEnvironment, self).__init__(sampler, n_agents=n_agents)
+
+        self.drift = np.asarray(drift, dtype=self.dtype).reshape(sampler.n_clusters, sampler.n_attributes)
+
+    def observe(self, uniforms):
+        clusters, rows = self.sampler.draw_options(uniforms)
+
+        options = np.clip(self.sampler.pool_[rows] + self.t_ * self.drift[clusters], 0, 1)
+
+        return np.swapaxes(options, -1, -2)
+
+
+class SharedFeatureEnvironment(ChoiceEnvironment):
+    """
+    Choice sets in the style of the robots experiment. Every attribute is a design (e.g. of a robot's
+    back), and every item shows two designs: one that all items of the set share, and one unique to
+    the item. Designs are drawn at random, without repetition within a set. Note that with binary
+    attributes a learning agent's preference can coincide exactly with an item, where the gradient of
+    its (square root) distance is undefined. Such an item then contributes no gradient to the agent.
+
+    # Parameters
+    n_designs (int): Number of designs, i.e. attributes. Must be larger than n_items
+    n_items (int): How many options are in each choice set?
+    n_agents (int): Number of agents acting in the environment in lockstep, or None for a single agent
+    dtype (numpy.dtype): Floating point type of the choice sets
+    """
+    def __init__(self, n_designs, n_items=2, n_agents=None, dtype=float):
+        if n_designs <= n_items:
+            raise ValueError('n_designs ({0:d}) must be larger than n_items ({1:d})'.format(n_designs, n_items))
+
+        super(SharedFeatureEnvironment, self).__init__(n_items, n_designs, n_agents=n_agents, dtype=dtype)
+
+    @property
+    def n_uniforms(self):
+        return self.n_attributes
+
+    def observe(self, uniforms):
+        # a random permutation of the designs: the first is shared, the next n_items are unique
+        designs = np.argsort(uniforms, axis=-1)[..., :self.n_items + 1]
+
+        observations = np.zeros(self.batch_shape + (self.n_attributes, self.n_items), dtype=self.dtype)
+
+        index = np.indices(self.batch_shape)
+        items = np.arange(self.n_items)
+
+        observations[tuple(i[..., np.newaxis] for i in index) + (designs[..., :1], items)] = 1.
+        observations[tuple(i[..., np.newaxis] for i in index) + (designs[..., 1:], items)] = 1.
+
+        return observations
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Maximum-likelihood fitting of the Coherency Maximising agent to observed sequences of choices
+
+Every sequence (e.g. one participant of an experiment) is replayed through its own agent of a
+BatchedCoherencyAgent, such that the log-likelihood of many sequences, or of many candidate
+parameters of the same sequence, is computed in a single lockstep pass. Fitting is done in two
+stages: a shared set of candidate parameters is screened for every sequence at once, and the best
+candidates of each sequence are then refined by projected gradient descent, in parallel.
+"""
+
+from __future__ import division
+
+import multiprocessing
+import warnings
+
+import numpy as np
+
+from model import BatchedCoherencyAgent
+
+PARAMETERS = ['c', 'p_eta', 'w_eta']
+
+DEFAULT_BOUNDS = {
+    'c': (0.01, 100.),
+    'p_eta': (1e-4, 10.),
+    'w_eta': (1e-4, 10.),
+}
+
+
+def log_likelihood(observations, actions, c=1., p_eta=0.01, w_eta=0.01, p_init=0.5, w_init=None,
+                   learn_prefs=True, learn_weights=True):
+    """
+    Compute the log-likelihood of sequences of choices under the Coherency Maximising agent
+
+    # Parameters
+    observations (numpy.ndarray): Choice sets of shape (n_sequences, n_trials, n_attributes, n_items)
+    actions (numpy.ndarray): The chosen item of every trial, of shape (n_sequences, n_trials). Trials
+                             with a negative action (e.g. missing responses) are skipped
+    c (float or numpy.ndarray): The lambda parameter, either shared or one value per sequence
+    p_eta (float or numpy.ndarray): The learning rate for the preference vector, shared or per sequence
+    w_eta (float or numpy.ndarray): The learning rate for the attention weight vector, shared or per sequence
+    p_init (float or numpy.ndarray): Initial preferences, shared or per sequence
+    w_init (float or numpy.ndarray): Initial attention weights, shared or per sequence. Defaults to uniform
+    learn_prefs (bool): Whether or not the agent updates its preferences after choice
+    learn_weights (bool): Whether or not the agent updates its attention weights after choice
+
+    # Returns
+    The log-likelihood of every sequence, of shape (n_sequences,)
+    """
+
+    n_sequences, n_trials, n_attributes, n_items = observations.shape
+
+    agent = BatchedCoherencyAgent(n_sequences, n_items, n_attributes, c=c, p_eta=p_eta, w_eta=w_eta,
+                                  learn_weights=learn_weights, learn_prefs=learn_prefs,
+                                  p_init=p_init, w_init=w_init)
+
+    rows = np.arange(n_sequences)
+    ll = np.zeros(n_sequences)
+
+    for t in range(n_trials):
+        observed = actions[:, t] >= 0
+        chosen = np.where(observed, actions[:, t], 0)
+
+        agent.feed_forward(observations[:, t])
+        ll += np.where(observed, agent.log_probs_[rows, chosen], 0.)
+
+        # the agent learns from the choice that was actually made
+        agent.backpropagate(chosen, active=observed)
+
+    return ll
+
+
+def _take(data, rows):
+    """Select rows of every per-sequence array in data"""
+
+    return tuple(array[rows] for array in data)
+
+
+def _negative_log_likelihood(theta, data, settings):
+    """
+    Negative log-likelihood of log-parameters theta (n_sequences, 3). Non-finite values are reported with a
+    warning and mapped to inf, such that they rank last.
+    data is a tuple of per-sequence observations, actions, initial preferences and initial attention weights
+    """
+
+    observations, actions, p_init, w_init = data
+
+    params = np.exp(theta)
+    nll = -log_likelihood(observations, actions, c=params[:, 0], p_eta=params[:, 1], w_eta=params[:, 2],
+                          p_init=p_init, w_init=w_init, **settings)
+
+    # the log-likelihood is finite for any parameters of the agent, so anything else is a numerical problem
+    invalid = ~np.isfinite(nll)
+    if invalid.any():
+        first = params[np.argmax(invalid)]
+        warnings.warn('{0:d} of {1:d} log-likelihoods are not finite (e.g. for c={2:.3g}, p_eta={3:.3g}, '
+                      'w_eta={4:.3g}), they rank last'.format(int(invalid.sum()), len(nll), *first), RuntimeWarning)
+
+        nll[invalid] = np.inf
+
+    return nll
+
+
+def _log_bounds(bounds):
+    """Lower and upper bounds of the log-parameters"""
+
+    bounds = dict(DEFAULT_BOUNDS, **(bounds or {}))
+
+    lower = np.log([bounds[name][0] for name in PARAMETERS])
+    upper = np.log([bounds[name][1] for name in PARAMETERS])
+
+    return lower, upper
+
+
+def screen_candidates(data, candidates, settings, max_rows=4096):
+    """
+    Evaluate the negative log-likelihood of every candidate for every sequence
+
+    # Parameters
+    data (tuple): Per-sequence observations, actions, initial preferences and initial attention weights
+    candidates (numpy.ndarray): Candidate log-parameters of shape (n_candidates, 3)
+    settings (dict): Keyword arguments of log_likelihood other than the fitted parameters and initialisations
+    max_rows (int): Upper bound on the number of agents replayed in one pass, which bounds memory
+
+    # Returns
+    Matrix of negative log-likelihoods of shape (n_sequences, n_candidates)
+    """
+
+    n_sequences = len(data[0])
+    n_candidates = len(candidates)
+    per_pass = max(1, max_rows // n_sequences)
+
+    nll = np.empty((n_sequences, n_candidates))
+
+    for start in range(0, n_candidates, per_pass):
+        block = candidates[start:start + per_pass]
+
+        # rows are ordered (sequence, candidate)
+        sequences = np.repeat(np.arange(n_sequences), len(block))
+        theta = np.tile(block, (n_sequences, 1))
+
+        nll[:, start:start + len(block)] = _negative_log_likelihood(
+            theta, _take(data, sequences), settings).reshape(n_sequences, len(block))
+
+    return nll
+
+
+def refine(task):
+    """
+    Refine starting points by projected gradient descent on the log-parameters. Every row has its
+    own step size, which grows after an improving step and shrinks otherwise. A row stops once its
+    step size falls below tol, or once a step improves its log-likelihood by less than ftol. Gradients
+    are central differences, computed for all rows at once.
+
+    task is a (data, theta, lower, upper, settings, n_iter, tol, ftol) tuple, where theta are the
+    starting log-parameters with one row per sequence in data (see screen_candidates).
+
+    # Returns
+    The refined log-parameters and their negative log-likelihoods
+    """
+
+    data, theta, lower, upper, settings, n_iter, tol, ftol = task
+
+    theta = np.clip(theta, lower, upper)
+    nll = _negative_log_likelihood(theta, data, settings)
+    step = np.full(len(theta), 0.5)
+    running = np.isfinite(nll)
+
+    h = 1e-4
+    n_params = theta.shape[1]
+
+    for _ in range(n_iter):
+        rows = np.flatnonzero(running)
+
+        if len(rows) == 0:
+            break
+
+        subset, current = _take(data, rows), theta[rows]
+
+        # central differences of every parameter, evaluated in a single pass
+        shifts = np.concatenate([np.eye(n_params) * h, -np.eye(n_params) * h])
+        shifted = (current[:, np.newaxis, :] + shifts[np.newaxis]).reshape(-1, n_params)
+
+        repeated = np.repeat(np.arange(len(rows)), len(shifts))
+        values = _negative_log_likelihood(shifted, _take(subset, repeated), settings)
+        values = values.reshape(len(rows), len(shifts))
+
+        with np.errstate(invalid='ignore'):
+            grad = (values[:, :n_params] - values[:, n_params:]) / (2 * h)
+        grad[~np.isfinite(grad)] = 0.
+
+        candidate = np.clip(current - step[rows, np.newaxis] * grad, lower, upper)
+        candidate_nll = _negative_log_likelihood(candidate, subset, settings)
+
+        improved = candidate_nll < nll[rows]
+        gain = nll[rows] - candidate_nll
+
+        theta[rows[improved]] = candidate[improved]
+        nll[rows[improved]] = candidate_nll[improved]
+
+        step[rows] *= np.where(improved, 2., 0.5)
+        running[rows] = (step[rows] > tol) & ~(improved & (gain < ftol))
+
+    return theta, nll
+
+
+def fit_choice_sequences(observations, actions, bounds=None, n_candidates=256, n_starts=4, n_iter=200,
+                         tol=1e-4, ftol=1e-4, n_jobs=1, p_init=0.5, w_init=None, learn_prefs=True, learn_weights=True,
+                         random_state=None):
+    """
+    Fit c, p_eta and w_eta to every sequence of choices by maximum likelihood
+
+    # Parameters
+    observations (numpy.ndarray): Choice sets of shape (n_sequences, n_trials, n_attributes, n_items)
+    actions (numpy.ndarray): Chosen items of shape (n_sequences, n_trials), negative for missing trials
+    bounds (dict): Optional (lower, upper) bounds per parameter, overriding DEFAULT_BOUNDS
+    n_candidates (int): Number of candidate parameters screened for every sequence
+    n_starts (int): Number of best candidates of each sequence from which to start the refinement
+    n_iter (int): Maximum number of refinement iterations
+    tol (float): Step size (in log-parameter space) below which the refinement of a start stops
+    ftol (float): Improvement of the log-likelihood below which the refinement of a start stops
+    n_jobs (int): Number of processes to run the refinement in
+    p_init (float or numpy.ndarray): Initial preferences, shared or per sequence (n_sequences, n_attributes)
+    w_init (float or numpy.ndarray): Initial attention weights, shared or per sequence. Defaults to uniform
+    learn_prefs (bool): Whether or not the agent updates its preferences after choice
+    learn_weights (bool): Whether or not the agent updates its attention weights after choice
+    random_state (numpy.random.RandomState): Random state to draw the candidates from. Defaults to the global state
+
+    # Returns
+    Dictionary with the fitted parameters and maximised log-likelihood of every sequence
+    """
+
+    rng = np.random if random_state is None else random_state
+    settings = {'learn_prefs': learn_prefs, 'learn_weights': learn_weights}
+
+    lower, upper = _log_bounds(bounds)
+    n_sequences, _, n_attributes, _ = observations.shape
+
+    # every row of the screening and refinement carries the initialisation of its sequence
+    if w_init is None:
+        w_init = 1. / n_attributes
+
+    data = (observations, actions,
+            np.broadcast_to(p_init, (n_sequences, n_attributes)),
+            np.broadcast_to(w_init, (n_sequences, n_attributes)))
+    n_starts = min(n_starts, n_candidates)
+
+    # screen candidates spread uniformly over the log-parameter space
+    candidates = lower + (upper - lower) * rng.rand(n_candidates, len(PARAMETERS))
+    screened = screen_candidates(data, candidates, settings)
+
+    # refine the best candidates of every sequence, with rows ordered (sequence, start)
+    best = np.argsort(screened, axis=1)[:, :n_starts]
+    theta = candidates[best].reshape(-1, len(PARAMETERS))
+    sequences = np.repeat(np.arange(n_sequences), n_starts)
+
+    tasks = list()
+    for chunk in np.array_split(np.arange(len(theta)), n_jobs):
+        if len(chunk) > 0:
+            rows = sequences[chunk]
+            tasks.append((_take(data, rows), theta[chunk], lower, upper, settings, n_iter, tol, ftol))
+
+    if n_jobs == 1:
+        results = list(map(refine, tasks))
+    else:
+        pool = multiprocessing.Pool(n_jobs)
+        results = pool.map(refine, tasks)
+        pool.close()
+        pool.join()
+
+    theta = np.concatenate([result[0] for result in results]).reshape(n_sequences, n_starts, -1)
+    nll = np.concatenate([result[1] for result in results]).reshape(n_sequences, n_starts)
+
+    # keep the best start of every sequence
+    winner = np.argmin(nll, axis=1)
+    rows = np.arange(n_sequences)
+    params = np.exp(theta[rows, winner])
+
+    fitted = dict((name, params[:, i]) for i, name in enumerate(PARAMETERS))
+    fitted.update({
+        'log_likelihood': -nll[rows, winner],
+        'n_trials': (actions >= 0).sum(axis=1),
+    })
+
+    return fitted
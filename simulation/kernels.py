@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+JIT-compiled kernel of the simulation loop
+
+The kernel runs the same computations as CoherencyMaximisingAgent.step, ChoiceSetSampler.from_uniforms
+and the policies, on scalars rather than on tiny arrays, such that the whole simulation loop can be
+compiled by Numba. Numba is optional: when it is not installed, simulate_choices falls back to the NumPy
+implementation. Numba is slow to import, so it is only imported (and the kernel compiled) on first use.
+"""
+
+from __future__ import division
+
+import math
+import numpy as np
+
+from random_plan import RandomPlan
+
+try:
+    from importlib.util import find_spec
+except ImportError:
+    from pkgutil import find_loader as find_spec
+
+HAS_NUMBA = find_spec('numba') is not None
+
+
+def _simulate_chunk(pool, offsets, counts, slot_clusters, random_clusters, sampler_uniforms, policy_uniforms,
+                    epsilon_greedy, epsilon, c, p_eta, w_eta, learn_prefs, learn_weights, pref, att,
+                    pref_out, att_out, action_out):
+    """
+    Simulate the timesteps of a chunk of pre-drawn uniforms, updating pref and att in place and writing
+    the preferences and attention weights after every step into pref_out and att_out, and the actions
+    into action_out
+    """
+
+    n_steps = sampler_uniforms.shape[0]
+    n_items = slot_clusters.shape[0]
+    n_attributes = pref.shape[0]
+
+    clusters = np.empty(n_items, dtype=np.int64)
+    distance = np.empty((n_attributes, n_items))
+    activation = np.empty(n_items)
+    probs = np.empty(n_items)
+    grad_p = np.empty(n_attributes)
+    grad_w = np.empty(n_attributes)
+
+    for t in range(n_steps):
+
+        # draw the choice set (see ChoiceSetSampler.from_uniforms)
+        if random_clusters:
+            order = np.argsort(sampler_uniforms[t, n_items:])
+            for i in range(n_items):
+                clusters[i] = order[i]
+        else:
+            for i in range(n_items):
+                clusters[i] = slot_clusters[i]
+
+        # attention-weighted distance of every item to the preference (see SimilarityLayer.feed_forward)
+        for i in range(n_items):
+            count = counts[clusters[i]]
+            within = min(int(sampler_uniforms[t, i] * count), count - 1)
+            option = offsets[clusters[i]] + within
+
+            euclid = 0.
+            for a in range(n_attributes):
+                distance[a, i] = pool[option, a] - pref[a]
+                euclid += att[a] * distance[a, i] ** 2
+
+            activation[i] = -c * math.sqrt(euclid)
+
+        # numerically stable softmax
+        max_activation = activation[0]
+        for i in range(1, n_items):
+            max_activation = max(max_activation, activation[i])
+
+        normaliser = 0.
+        for i in range(n_items):
+            probs[i] = math.exp(activation[i] - max_activation)
+            normaliser += probs[i]
+
+        for i in range(n_items):
+            probs[i] /= normaliser
+
+        # select the action (see EpsilonGreedyPolicy.choose and SoftmaxPolicy.choose)
+        if epsilon_greedy:
+            if policy_uniforms[t, 0] < epsilon:
+                action = min(int(policy_uniforms[t, 1] * n_items), n_items - 1)
+            else:
+                action = 0
+                for i in range(1, n_items):
+                    if probs[i] > probs[action]:
+                        action = i
+        else:
+            action = 0
+            cumulative = probs[0]
+            while action < n_items - 1 and cumulative < policy_uniforms[t, 0]:
+                action += 1
+                cumulative += probs[action]
+
+        action_out[t] = action
+
+        # gradients of the choice (see SimilarityLayer.compute_gradient)
+        for a in range(n_attributes):
+            grad_p[a] = 0.
+            grad_w[a] = 0.
+
+        for i in range(n_items):
+            # items that coincide with the preference contribute no gradient (see _divide_by_activation)
+            if activation[i] == 0.:
+                continue
+
+            o_grad = probs[i] - (1. if i == action else 0.)
+
+            for a in range(n_attributes):
+                grad_w[a] += o_grad * ((c ** 2 / 2) * (distance[a, i] ** 2 / activation[i]))
+                grad_p[a] += o_grad * (-c ** 2 * (distance[a, i] * att[a]) / activation[i])
+
+        # clipped gradient descent
+        for a in range(n_attributes):
+            if learn_prefs:
+                pref[a] = min(max(pref[a] - p_eta * grad_p[a], 0.), 1.)
+            if learn_weights:
+                att[a] = max(att[a] - w_eta * grad_w[a], 0.)
+
+            pref_out[t, a] = pref[a]
+            att_out[t, a] = att[a]
+
+
+_compiled_chunk = None
+
+
+def _compiled_kernel():
+    """Return the compiled kernel, importing numba and compiling it on the first call"""
+
+    global _compiled_chunk
+
+    if _compiled_chunk is None:
+        import numba
+        _compiled_chunk = numba.njit(cache=True)(_simulate_chunk)
+
+    return _compiled_chunk
+
+
+def simulate_choices_jit(sampler, model, n_choices, policy, recorder, random_state=None, monitor=None,
+                         checkpointer=None, start=0, profiler=None, action_log=None):
+    """
+    Simulate the model for n_choices with the compiled kernel. The random numbers are drawn
+    from the same RandomPlan as in simulate_choices, such that both produce the same trajectories.
+
+    # Parameters
+    sampler (ChoiceSetSampler): Sampler of the choice sets
+    model (CoherencyMaximisingAgent): Model agent
+    n_choices (int): Number of choices by which to simulate
+    policy (EpsilonGreedyPolicy or SoftmaxPolicy): Policy selecting the actions
+    recorder (TrajectoryRecorder): Recorder of the preference and attention history
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    monitor (ConvergenceMonitor): Optional monitor. Convergence is checked after every chunk, and the steps
+                                  of the chunk after the one on which the agent converged are discarded
+    checkpointer (Checkpointer): Optional checkpointer. Checkpoints are saved at the end of chunks
+    start (int): Timestep to resume from, after the run was restored from a checkpoint
+    profiler (PhaseProfiler): Optional profiler. The kernel is timed as a whole, once per chunk
+    action_log (ActionLog): Optional log of the action taken on every step
+    """
+
+    plan = RandomPlan(random_state, [sampler.n_uniforms, policy.n_uniforms])
+    epsilon_greedy = hasattr(policy, 'epsilon')
+
+    # the kernel updates these in place, and the model shares their memory
+    pref = model.h0.preference_[0].astype(model.dtype)
+    att = model.h0.attention_weights_[0].astype(model.dtype)
+    model.h0.preference_ = pref.reshape(1, -1)
+    model.h0.attention_weights_ = att.reshape(1, -1)
+
+    pref_out = np.empty((plan.chunk_size, model.n_attributes), dtype=model.dtype)
+    att_out = np.empty((plan.chunk_size, model.n_attributes), dtype=model.dtype)
+    action_out = np.empty(plan.chunk_size, dtype=np.int64)
+
+    simulate_chunk = _compiled_kernel()
+
+    for chunk_start, offset, (sampler_uniforms, policy_uniforms) in plan.iterate_chunks(n_choices, start=start):
+        first, n_steps = chunk_start + offset, len(sampler_uniforms) - offset
+
+        simulate_chunk(sampler.pool_, sampler.offsets_, sampler.counts_, sampler.slot_clusters_,
+                       sampler.random_clusters, sampler_uniforms[offset:], policy_uniforms[offset:],
+                       epsilon_greedy, policy.epsilon if epsilon_greedy else 0.,
+                       float(model.c), float(model.p_eta), float(model.a_eta),
+                       model.learn_prefs, model.learn_weights, pref, att,
+                       pref_out, att_out, action_out)
+
+        if profiler is not None:
+            profiler.lap('kernel')
+
+        # stop on the step at which the agent converged, discarding the rest of the chunk
+        converged = False
+        if monitor is not None:
+            converged = monitor.update_block(first, pref_out[:n_steps], att_out[:n_steps])
+
+            if converged:
+                n_steps = monitor.done_step_ - first + 1
+                pref[:] = pref_out[n_steps - 1]
+                att[:] = att_out[n_steps - 1]
+
+            if profiler is not None:
+                profiler.lap('monitor')
+
+        model.track_actions(action_out[:n_steps])
+
+        if action_log is not None:
+            action_log.record_block(first, action_out[:n_steps])
+
+        recorder.record_block(first, pref_out[:n_steps], att_out[:n_steps])
+
+        if profiler is not None:
+            profiler.lap('record')
+
+        if converged:
+            recorder.finalise(first + n_steps - 1, pref, att)
+            break
+
+        if checkpointer is not None and checkpointer.due(first, first + n_steps):
+            checkpointer.save(first + n_steps, model, plan.get_state(first + n_steps), recorder, monitor,
+                              action_log=action_log)
+
+            if profiler is not None:
+                profiler.lap('checkpoint')
+
+        if profiler is not None:
+            profiler.end_step(first + n_steps - 1, n_steps)
+
+    return recorder.history()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Deterministic mean-field simulation of the Coherency Maximising agent
+
+Rather than drawing a choice set and an action on every step, the mean-field map moves the agent
+along its expected update: the gradient averaged over the choice sets of the environment and over
+the actions of the policy. The average over actions is exact, since the gradient is linear in the
+(one-hot) action and so the expected gradient is that towards the policy's action probabilities.
+The average over choice sets is taken over a fixed sample of them, or over every combination of
+options when there are few enough. As the map is deterministic it can take larger steps than a
+single choice, and it stops once it reaches a fixed point.
+"""
+
+from __future__ import division
+
+import itertools
+
+import numpy as np
+
+from model import BatchedCoherencyAgent
+from policy import create_policy
+from record import TrajectoryRecorder
+from sampler import ChoiceSetSampler
+from simulate import simulate_blobs, simulate_population_choices
+
+
+def choice_set_sample(sampler, n_samples=1000, random_state=None):
+    """
+    Draw the choice sets over which the expected update is averaged
+
+    # Parameters
+    sampler (ChoiceSetSampler): Sampler of the choice sets
+    n_samples (int): Number of choice sets to draw. None enumerates every combination of options,
+                     which is exact for samplers that draw item i from cluster i % n_clusters
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+    # Returns
+    Choice sets of shape (n_samples, n_attributes, n_items)
+    """
+
+    if n_samples is not None:
+        return sampler.sample(n_sets=n_samples, random_state=random_state)
+
+    if sampler.random_clusters:
+        raise ValueError('Choice sets can only be enumerated when every item has a fixed cluster')
+
+    # every combination of one option per item, each from its item's cluster
+    pools = [np.arange(sampler.offsets_[k], sampler.offsets_[k] + sampler.counts_[k]) for k in sampler.slot_clusters_]
+    rows = np.array(list(itertools.product(*pools)))
+
+    return np.swapaxes(sampler.pool_[rows], -1, -2)
+
+
+def expected_gradients(model, observations, policy, max_rows=2 ** 18):
+    """
+    Compute the expected gradients of every agent of a population, over a sample of choice sets and
+    the actions of the policy
+
+    # Parameters
+    model (BatchedCoherencyAgent): Population of agents (e.g. one per parameter setting)
+    observations (numpy.ndarray): Choice sets of shape (n_samples, n_attributes, n_items)
+    policy (EpsilonGreedyPolicy or SoftmaxPolicy): Policy selecting the actions
+    max_rows (int): Upper bound on the number of (agent, choice set) pairs evaluated at once, which bounds memory
+
+    # Returns
+    Expected preference and attention weight gradients, each of shape (n_agents, n_attributes)
+    """
+
+    n_samples = len(observations)
+    per_pass = max(1, min(n_samples, max_rows // model.n_agents))
+
+    grad_p = np.zeros((model.n_agents, model.n_attributes))
+    grad_w = np.zeros((model.n_agents, model.n_attributes))
+
+    for start in range(0, n_samples, per_pass):
+        block = observations[start:start + per_pass]
+
+        # one replica of every agent per choice set, with rows ordered (agent, choice set)
+        replicas = BatchedCoherencyAgent(model.n_agents * len(block), model.n_items, model.n_attributes,
+                                         c=np.repeat(model.c[:, 0], len(block)),
+                                         learn_prefs=model.learn_prefs, learn_weights=model.learn_weights,
+                                         p_init=np.repeat(model.preference_, len(block), axis=0),
+                                         w_init=np.repeat(model.attention_weights_, len(block), axis=0),
+                                         dtype=model.dtype)
+
+        probs = replicas.feed_forward(np.tile(block, (model.n_agents, 1, 1)))
+        block_p, block_w = replicas.compute_target_gradients(probs, policy.action_probabilities(probs))
+
+        grad_p += block_p.reshape(model.n_agents, len(block), -1).sum(axis=1)
+        grad_w += block_w.reshape(model.n_agents, len(block), -1).sum(axis=1)
+
+    return grad_p / n_samples, grad_w / n_samples
+
+
+def simulate_mean_field(sampler, model, n_choices, epsilon=0.05, epsilon_greedy=True, n_samples=1000,
+                        step_size=1, tol=1e-8, random_state=None, recorder=None):
+    """
+    Move a population of agents along their expected updates, until they reach a fixed point
+
+    # Parameters
+    sampler (ChoiceSetSampler): Sampler of the choice sets
+    model (BatchedCoherencyAgent): Population of agents (e.g. one per parameter setting), updated in place
+    n_choices (int): Number of choices by which to simulate
+    epsilon (float): Probability of taking an exploratory action, if epsilon_greedy=True
+    epsilon_greedy (bool): Whether to use epsilon greedy exploration or softmax exploration
+    n_samples (int): Number of choice sets to average over (see choice_set_sample)
+    step_size (int): Number of choices covered by every step of the map. Larger steps take fewer
+                     iterations, but follow the expected trajectory less closely
+    tol (float): Largest change of any preference or attention weight per choice at which all agents
+                 have reached a fixed point, and the simulation stops
+    random_state (numpy.random.RandomState): Random state to draw the choice sets from. Defaults to the global state
+    recorder (TrajectoryRecorder): Recorder of the history. Defaults to recording every step of the map
+
+    # Returns
+    Preference and attention histories, each of shape (n_recorded, n_agents, n_attributes). Step k
+    of the map holds the expected state after (k + 1) * step_size choices
+    """
+
+    n_steps = int(np.ceil(n_choices / step_size))
+
+    if recorder is None:
+        recorder = TrajectoryRecorder(n_steps, model.n_attributes, n_agents=model.n_agents, dtype=model.dtype)
+
+    policy = create_policy(epsilon_greedy=epsilon_greedy, epsilon=epsilon)
+    observations = choice_set_sample(sampler, n_samples=n_samples, random_state=random_state)
+
+    for t in range(n_steps):
+        previous = np.concatenate([model.preference_, model.attention_weights_], axis=1)
+
+        grad_p, grad_w = expected_gradients(model, observations, policy)
+        model.apply_gradients(grad_p.astype(model.dtype), grad_w.astype(model.dtype), scale=step_size)
+
+        recorder.record(t, model.preference_, model.attention_weights_)
+
+        change = np.abs(np.concatenate([model.preference_, model.attention_weights_], axis=1) - previous)
+
+        if change.max() / step_size < tol:
+            recorder.finalise(t, model.preference_, model.attention_weights_)
+            break
+
+    return recorder.history()
+
+
+def _attention_shares(attention_weights):
+    """The share of the (non-negative) attention weights paid to every attribute, as measured by ConvergenceMonitor"""
+
+    attention_weights = np.asarray(attention_weights, dtype=float)
+    total = attention_weights.sum(axis=-1, keepdims=True)
+
+    return np.divide(attention_weights, total, out=np.zeros_like(attention_weights), where=total > 0)
+
+
+def compare_trajectories(mean_field_history, stochastic_history, step_size=1, tol=0.05):
+    """
+    Compare mean-field trajectories with stochastic ones, and find where they diverge. Attention weights
+    are not bounded, so the attention paid to every attribute is compared as its share of the total
+    attention (as by ConvergenceMonitor), such that tol means the same for preferences and attention
+
+    # Parameters
+    mean_field_history (tuple): Preference and attention histories of simulate_mean_field, recorded every step
+    stochastic_history (tuple): Preference and attention histories of simulate_population_choices of the same
+                                agents, recorded every choice, of shape (n_choices, n_agents, n_attributes)
+    step_size (int): The step_size of the mean-field simulation
+    tol (float): Distance between the two states beyond which the trajectories count as diverged
+
+    # Returns
+    Dictionary with the distance between the mean-field and stochastic states of every agent after
+    every step of the map (n_steps, n_agents), the choice after which that distance first exceeded tol
+    for every agent (-1 if never) and the distance at the end of the shorter of the two histories
+    """
+
+    mf_state = np.concatenate([mean_field_history[0], _attention_shares(mean_field_history[1])], axis=-1)
+    stochastic_state = np.concatenate([stochastic_history[0], _attention_shares(stochastic_history[1])], axis=-1)
+
+    # the stochastic states at the choices that the steps of the map end on
+    choices = (np.arange(len(mf_state)) + 1) * step_size - 1
+    n_steps = int(np.searchsorted(choices, len(stochastic_state)))
+    choices = choices[:n_steps]
+
+    distance = np.sqrt(np.square(mf_state[:n_steps] - stochastic_state[choices]).sum(axis=-1))
+
+    diverged = distance > tol
+    divergence = np.where(diverged.any(axis=0), choices[np.argmax(diverged, axis=0)], -1)
+
+    return {'distance': distance, 'divergence_choice': divergence, 'final_distance': distance[-1]}
+
+
+def run_mean_field(config, n_samples=1000, step_size=10, n_replicates=100, tol=0.05, random_state=None):
+    """
+    Simulate the agent described by config with the mean-field map, and compare it with an ensemble
+    of stochastic simulations of the same agent
+
+    # Parameters
+    config (dict): Simulation config, as in CONFIG
+    n_samples (int): Number of choice sets to average over (see choice_set_sample)
+    step_size (int): Number of choices covered by every step of the map
+    n_replicates (int): Number of stochastic simulations to compare with, run as one population
+    tol (float): Distance between the states beyond which the trajectories count as diverged
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+    # Returns
+    The mean-field history, the stochastic history and their comparison (see compare_trajectories)
+    """
+
+    X, y = simulate_blobs(config['cluster_centers'],
+                          n_samples=config['n_choices'],
+                          cluster_std=config['cluster_std'])
+    n_attributes = X.shape[1]
+    sampler = ChoiceSetSampler(X, y, n_items=config['n_items'], dtype=config['dtype'])
+
+    def create_population(n_agents):
+        return BatchedCoherencyAgent(n_agents, config['n_items'], n_attributes,
+                                     c=config['c'], p_eta=config['lr'], w_eta=config['lr'],
+                                     learn_prefs=True, learn_weights=True,
+                                     p_init=config['preference'], w_init=config['weights'], dtype=config['dtype'])
+
+    mean_field = simulate_mean_field(sampler, create_population(1), config['n_timesteps'],
+                                     epsilon=config['epsilon'], epsilon_greedy=config['epsilon_greedy'],
+                                     n_samples=n_samples, step_size=step_size, random_state=random_state)
+
+    stochastic = simulate_population_choices(X, y, create_population(n_replicates), config['n_timesteps'],
+                                             epsilon=config['epsilon'], epsilon_greedy=config['epsilon_greedy'],
+                                             random_state=random_state, sampler=sampler)
+
+    # the single mean-field agent is compared with every replicate
+    comparison = compare_trajectories(mean_field, stochastic, step_size=step_size, tol=tol)
+
+    return mean_field, stochastic, comparison
+
+
+def format_mean_field(mean_field, stochastic, comparison):
+    """Describe the final states of a run_mean_field study, and how many stochastic runs diverged"""
+
+    diverged = comparison['divergence_choice'] >= 0
+
+    lines = [
+        'mean-field final preference: {0:s}, attention weights: {1:s}'.format(
+            np.array2string(mean_field[0][-1, 0], precision=3), np.array2string(mean_field[1][-1, 0], precision=3)),
+        'stochastic final preference: {0:s}, attention weights: {1:s} (mean of {2:d} runs)'.format(
+            np.array2string(stochastic[0][-1].mean(axis=0), precision=3),
+            np.array2string(stochastic[1][-1].mean(axis=0), precision=3), len(diverged)),
+        '{0:d} of {1:d} stochastic runs diverged from the mean-field trajectory'.format(diverged.sum(), len(diverged)),
+    ]
+
+    if diverged.any():
+        lines[-1] += ', after a median of {0:.0f} choices'.format(np.median(comparison['divergence_choice'][diverged]))
+
+    return '\n'.join(lines)
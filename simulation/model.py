@@ -13,14 +13,43 @@ import numpy as np
 def categorical_crossentropy(y, y_hat):
     """Computes the categorical crossentropy for a set of predictions p_hat"""
 
-    loss = - np.multiply(y, np.log(y_hat)).sum() / y.shape[0]
+    # the loss is always accumulated in double precision
+    loss = - np.multiply(y, np.log(np.asarray(y_hat, dtype=np.float64))).sum() / y.shape[0]
 
     return  loss
 
-def softmax(x, temp=1.0):
+def _stable_softmax(x, temp=1.0, axis=None):
+    """
+    Compute the softmax and log softmax of x in a single pass. The maximum is subtracted before
+    exponentiating (i.e. the log-sum-exp trick), so that large inputs neither overflow nor underflow.
+    The normaliser is computed in double precision, and the results are returned in the precision of x
+    """
+
+    dtype = np.result_type(x, np.float32)
+
+    shifted = np.asarray(x, dtype=np.float64) / temp
+    shifted = shifted - np.max(shifted, axis=axis, keepdims=True)
+
+    exp_shifted = np.exp(shifted)
+    normaliser = np.sum(exp_shifted, axis=axis, keepdims=True)
+
+    return (exp_shifted / normaliser).astype(dtype, copy=False), (shifted - np.log(normaliser)).astype(dtype, copy=False)
+
+def _divide_by_activation(x, activation):
+    """
+    Divide x by the activation of every item, as in the gradients of the similarity layer. Where an item
+    coincides with the preference (or all attention weights are zero) its activation is zero and the gradient
+    of the distance is undefined, so its contribution is taken to be zero there (which is a subgradient)
+    """
+
+    out = np.zeros(np.broadcast(x, activation).shape, dtype=np.result_type(x, activation))
+
+    return np.divide(x, activation, out=out, where=activation != 0)
+
+def softmax(x, temp=1.0, axis=None):
     """Softmax function with optional temperature parameter"""
 
-    return np.exp(x / temp) / np.sum(np.exp(x / temp), keepdims=True)
+    return _stable_softmax(x, temp=temp, axis=axis)[0]
 
 class SoftmaxLayer(object):
     """Softmax layer"""
@@ -32,7 +61,7 @@ class SoftmaxLayer(object):
 
     def feed_forward(self, X):
         self.input_ = X
-        self.activations_ = softmax(X)
+        self.activations_, self.log_activations_ = _stable_softmax(X, axis=-1)
 
         return self.activations_
 
@@ -50,11 +79,37 @@ class SoftmaxLayer(object):
 
         return dX
 
+def similarity(X, preference, attention_weights, c=1.):
+    """
+    Attention-weighted similarity of the items of X to a preference, as computed by the SimilarityLayer
+
+    # Parameters
+    X (numpy.ndarray): Observation of shape (n_attributes, n_items), or a batch of observations of shape
+                       (n_observations, n_attributes, n_items)
+    preference (numpy.ndarray): Preference vector of shape (1, n_attributes)
+    attention_weights (numpy.ndarray): Attention weight vector of shape (1, n_attributes)
+    c (float): The lambda parameter, by which the distance is scaled
+
+    # Returns
+    The distance of every attribute of every item to the preference, the attention-weighted (squared) euclidean
+    distance of every item of shape (1, n_items) or (n_observations, 1, n_items), and the activation of every item
+    (i.e. -c times the euclidean distance) of the same shape
+    """
+
+    # calculate euclidean distance
+    distance = np.subtract(X, preference.reshape(-1,1))
+    euclid_distance = np.matmul(attention_weights, np.square(distance))
+
+    # scale the distance by c parameter
+    return distance, euclid_distance, -c * euclid_distance ** 0.5
+
 class SimilarityLayer(object):
     """Attention-weighted similarity layer"""
 
-    def __init__(self, n_items, n_attributes, c=1., learn_weights=False, learn_prefs=False, p_init=None, w_init=None):
+    def __init__(self, n_items, n_attributes, c=1., learn_weights=False, learn_prefs=False, p_init=None, w_init=None,
+                 dtype=float):
         super(SimilarityLayer, self).__init__()
+        self.dtype = np.dtype(dtype)
         self.c = c
         self.learn_weights = learn_weights
         self.learn_prefs = learn_prefs
@@ -72,50 +127,62 @@ class SimilarityLayer(object):
 
     def _initialisation(self):
         if self.p_init is None:
-            self.preference_ = np.zeros((1, self.n_attributes))
+            self.preference_ = np.zeros((1, self.n_attributes), dtype=self.dtype)
         else:
-            self.preference_ = np.array([self.p_init])
+            self.preference_ = np.array([self.p_init], dtype=self.dtype)
 
         if self.learn_weights:
             if self.w_init is None:
-                self.attention_weights_ = np.ones((1, self.n_attributes)) / self.n_attributes
+                self.attention_weights_ = np.ones((1, self.n_attributes), dtype=self.dtype) / self.n_attributes
             else:
-                self.attention_weights_ = np.array([self.w_init])
+                self.attention_weights_ = np.array([self.w_init], dtype=self.dtype)
         else:
-            self.attention_weights_ = np.ones((1, self.n_attributes)).astype(float)
+            self.attention_weights_ = np.ones((1, self.n_attributes), dtype=self.dtype)
 
     def feed_forward(self, X):
-        """Feed forward the layer"""
+        """
+        Feed forward the layer, for a single observation X of shape (n_attributes, n_items) or
+        a batch of observations of shape (n_observations, n_attributes, n_items)
+        """
+        X = np.asarray(X, dtype=self.dtype)
         self.input = X
 
-        # calculate euclidean distance
-        self.distance = np.subtract(X, self.preference_.reshape(-1,1))
-        self.euclid_distance = np.dot(self.attention_weights_, np.square(self.distance))
-
-        # scale the distance by c parameter
-        activation = -self.c * self.euclid_distance ** 0.5
+        self.distance, self.euclid_distance, activation = similarity(X, self.preference_, self.attention_weights_, self.c)
         self.activation = activation
 
         return activation
 
-    def compute_gradient(self, grad):
-        """Compute the gradients of the layer's activations"""
+    def compute_gradient(self, grad, reduction='sum'):
+        """
+        Compute the gradients of the layer's activations. If the layer was fed a batch of observations,
+        grad holds one row per observation and the gradients are summed or averaged over the batch,
+        depending on reduction ('sum' or 'mean')
+        """
+
+        # stack the items of every observation along the first axis, such that a single dot
+        # product sums the gradient over the batch (for a single observation these are just transposes)
+        distance = np.swapaxes(self.distance, -1, -2).reshape(-1, self.n_attributes)
+        activation = np.swapaxes(self.activation, -1, -2).reshape(-1, 1)
+        grad = np.reshape(grad, -1)
+
+        n_observations = len(grad) // self.n_items
+        scale = 1. / n_observations if reduction == 'mean' else 1.
 
         if self.learn_weights:
             # Jacobian matrix W
-            grad_distw = (self.c**2/2) * (self.distance.T**2 / self.activation.T)
+            grad_distw = (self.c**2/2) * _divide_by_activation(distance**2, activation)
             # Indeed, grad_w = np.dot(grad, grad_distw) <=> grad_w = np.dot(grad_distw.T, grad.T ).T
-            grad_w = np.dot(grad, grad_distw)
+            grad_w = np.dot(grad, grad_distw) * scale
         else:
-            grad_w = np.zeros((1, self.n_attributes))
+            grad_w = np.zeros((1, self.n_attributes), dtype=self.dtype)
 
         if self.learn_prefs:
             # Jacobian matrix P"""
-            grad_distP = -self.c**2 * (self.distance.T * self.attention_weights_) / self.activation.T
+            grad_distP = _divide_by_activation(-self.c**2 * (distance * self.attention_weights_), activation)
             # Indeed, grad_p = np.dot(grad, grad_distP) <=> grad_p = np.dot(grad_distP.T, grad.T ).T
-            grad_p = np.dot(grad, grad_distP)
+            grad_p = np.dot(grad, grad_distP) * scale
         else:
-            grad_p = np.zeros(self.n_attributes)
+            grad_p = np.zeros(self.n_attributes, dtype=self.dtype)
 
         return grad_p, grad_w
 
@@ -143,9 +210,12 @@ class CoherencyMaximisingAgent(object):
 
     p_init (list): List of values to initialise the preference vector with
     w_init (list): List of values to initialise the weight vector with
+    track_history (bool): Whether to keep every preference and weight vector in p_values and w_values
+    dtype (numpy.dtype): Floating point type of the preference and attention weight vectors (e.g. float32 to save memory)
     """
     def __init__(self, n_items, n_attributes, c=1., p_eta=0.01, w_eta=0.01,
-                 learn_weights=False, learn_prefs=False, p_init=None, w_init=None):
+                 learn_weights=False, learn_prefs=False, p_init=None, w_init=None, track_history=True,
+                 dtype=float):
         super(CoherencyMaximisingAgent, self).__init__()
         self.n_items = n_items
         self.n_attributes = n_attributes
@@ -157,11 +227,14 @@ class CoherencyMaximisingAgent(object):
 
         self.p_init = p_init
         self.w_init = w_init
+        self.track_history = track_history
+        self.dtype = np.dtype(dtype)
         self.p_values = []
         self.w_values = []
 
         self._initialise_model()
 
+        # number of actions taken, length of the current streak of the same action and of every finished streak
         self.actions_taken_ = 0
         self.streak_ = 0
         self.streak_lengths_ = list()
@@ -175,12 +248,26 @@ class CoherencyMaximisingAgent(object):
                                   learn_weights=self.learn_weights,
                                   learn_prefs=self.learn_prefs,
                                   p_init=self.p_init,
-                                  w_init=self.w_init)
+                                  w_init=self.w_init,
+                                  dtype=self.dtype)
 
         self.h1 = SoftmaxLayer(self.n_items, self.n_attributes)
 
-        self.p_values.append(copy.copy(self.h0.preference_))
-        self.w_values.append(copy.copy(self.h0.attention_weights_))
+        if self.track_history:
+            self.p_values.append(copy.copy(self.h0.preference_))
+            self.w_values.append(copy.copy(self.h0.attention_weights_))
+
+    @property
+    def preference_(self):
+        """Current preference vector, of shape (1, n_attributes) as for a population of one agent"""
+
+        return self.h0.preference_
+
+    @property
+    def attention_weights_(self):
+        """Current attention weight vector, of shape (1, n_attributes) as for a population of one agent"""
+
+        return self.h0.attention_weights_
 
     def feed_forward(self, X):
         """feedforward the model using the attributes seen in matrix X"""
@@ -199,35 +286,382 @@ class CoherencyMaximisingAgent(object):
         a_prob = self.feed_forward(observation)
         action = np.random.choice(np.arange(self.n_items), p=a_prob)
 
+        self._track_action(action)
+
+        return action
+
+    def _track_action(self, action):
+        """Count the action, and extend the current streak of the same action or start a new one"""
+
+        if self.actions_taken_ > 0 and action == self.last_chosen_:
+            self.streak_ += 1
+        else:
+            if self.streak_ > 0:
+                self.streak_lengths_.append(self.streak_)
+
+            self.streak_ = 1
+
         self.actions_taken_ += 1
         self.last_chosen_ = action
 
+    def track_actions(self, actions):
+        """
+        Count a sequence of consecutive actions taken outside of step (e.g. by a compiled kernel), and
+        update the streaks as if they were taken one by one
+        """
+
+        if len(actions) == 0:
+            return
+
+        # the lengths of the runs of the same action within the sequence
+        actions = np.asarray(actions)
+        starts = np.flatnonzero(np.append(True, actions[1:] != actions[:-1]))
+        lengths = np.diff(np.append(starts, len(actions))).tolist()
+
+        # the first streak may continue the current one
+        if self.actions_taken_ > 0 and actions[0] == self.last_chosen_:
+            lengths[0] += self.streak_
+        elif self.streak_ > 0:
+            lengths.insert(0, self.streak_)
+
+        self.streak_lengths_.extend(lengths[:-1])
+        self.streak_ = lengths[-1]
+
+        self.actions_taken_ += len(actions)
+        self.last_chosen_ = int(actions[-1])
+
+    def step(self, observation, policy, uniforms=None, profiler=None):
+        """
+        Choose an action for the observation and update the agent on that choice, re-using
+        a single forward pass for both
+
+        # Parameters
+        observation (numpy.ndarray): Two dimensional matrix describing the attributes of the choices
+        policy (EpsilonGreedyPolicy or SoftmaxPolicy): Policy selecting the action from the choice probabilities
+        uniforms (numpy.ndarray): Optional uniform numbers for the policy, otherwise the policy draws its own
+        profiler (PhaseProfiler): Optional profiler, timing the forward pass, action selection and update
+        """
+
+        probs = self.feed_forward(observation)
+
+        if profiler is not None:
+            profiler.lap('forward')
+
+        if uniforms is None:
+            action = policy(probs)
+        else:
+            action = policy.choose(probs, uniforms)
+
+        if profiler is not None:
+            profiler.lap('select')
+
+        self._track_action(action)
+
+        self.backpropagate(action)
+
+        if profiler is not None:
+            profiler.lap('update')
+
         return action
 
     def update_agent(self, observation, last_action):
         """Update the preference and attention weight vectors of the agent"""
 
+        # calculate probability of choice given observation
+        self.feed_forward(observation)
+
+        self.backpropagate(last_action)
+
+    def backpropagate(self, last_action):
+        """
+        Update the preference and attention weight vectors of the agent, using the activations
+        cached by the last call to feed_forward
+        """
+
         # create one-hot encoded representation of the action
-        l_action = np.zeros(self.n_items)
+        l_action = np.zeros(self.n_items, dtype=self.dtype)
         l_action[last_action] = 1.
 
-        # calculate probability of choice given observation
-        probs = self.feed_forward(observation)
+        probs = self.h1.activations_[0]
 
         # calculate gradients
         o_grad = self.h1.compute_gradient(probs=probs, l_action=l_action)
         grad_p, grad_w = self.h0.compute_gradient(o_grad)
 
+        self._apply_gradients(grad_p, grad_w)
+
+    def update_agent_batch(self, observations, actions, reduction='mean'):
+        """
+        Update the preference and attention weight vectors of the agent on a batch of choices,
+        with a single step along the summed or averaged gradient of all of them
+
+        # Parameters
+        observations (numpy.ndarray): Observations of shape (n_observations, n_attributes, n_items)
+        actions (numpy.ndarray): The action taken in each observation, of shape (n_observations,)
+        reduction (str): Whether to take the 'mean' or the 'sum' of the gradients over the batch
+        """
+
+        # forward pass of the whole batch, with probabilities of shape (n_observations, n_items)
+        activation = self.h0.feed_forward(observations)
+        probs = self.h1.feed_forward(activation)[:, 0]
+
+        # create one-hot encoded representations of the actions
+        l_action = np.zeros((len(actions), self.n_items), dtype=self.dtype)
+        l_action[np.arange(len(actions)), actions] = 1.
+
+        # calculate gradients, reduced over the batch
+        o_grad = self.h1.compute_gradient(probs=probs, l_action=l_action)
+        grad_p, grad_w = self.h0.compute_gradient(o_grad, reduction=reduction)
+
+        self._apply_gradients(grad_p, grad_w)
+
+    def _apply_gradients(self, grad_p, grad_w):
+        """Take a clipped gradient descent step on the preference and attention weight vectors"""
+
+        self.grad_p_ = grad_p
+        self.grad_w_ = grad_w
+
+        # update values using gradient descent. each update creates new arrays, so the
+        # previous values kept in the history are never modified
+        if self.learn_prefs:
+            self.h0.preference_ = (self.h0.preference_ - self.p_eta * grad_p).clip(min=0, max=1)
+
+            if self.track_history:
+                self.p_values.append(self.h0.preference_)
+
+        if self.learn_weights:
+            self.h0.attention_weights_ = (self.h0.attention_weights_ - self.a_eta * grad_w).clip(min=0)
+
+            if self.track_history:
+                self.w_values.append(self.h0.attention_weights_)
+
+
+class BatchedCoherencyAgent(object):
+    """
+    A population of Coherency Maximising agents that are simulated in lockstep.
+
+    Each row of the preference and attention weight matrices belongs to one agent, such that
+    forward passes, action selection and the gradient updates of the whole population are
+    computed with vectorised operations. Given the same observations and random numbers, every agent
+    takes the same actions as a CoherencyMaximisingAgent initialised with its parameters. The gradients
+    are summed over the items in a different order than by the single agent, so their preferences and
+    attention weights may differ in the last bits, by no more than 1e-12 over 10000 choices.
+
+    # Parameters
+    n_agents (int): How many agents are in the population?
+    n_items (int): How many actions are there to choose from?
+    n_attributes (int): How many attributes belong to each choice?
+    c (float or numpy.ndarray): The lambda parameter, either shared or one value per agent
+    p_eta (float or numpy.ndarray): The learning rate for the preference vector, shared or per agent
+    w_eta (float or numpy.ndarray): The learning rate for the attention weight vector, shared or per agent
+
+    learn_prefs (bool): Whether or not to update preference vectors after choice
+    learn_weights (bool): Whether or not to update attention weight vectors
+
+    p_init (list or numpy.ndarray): Initial preferences, either shared (n_attributes) or per agent (n_agents, n_attributes)
+    w_init (list or numpy.ndarray): Initial attention weights, either shared (n_attributes) or per agent (n_agents, n_attributes)
+    dtype (numpy.dtype): Floating point type of the preference and attention weight matrices (e.g. float32 to save memory)
+    """
+    def __init__(self, n_agents, n_items, n_attributes, c=1., p_eta=0.01, w_eta=0.01,
+                 learn_weights=False, learn_prefs=False, p_init=None, w_init=None, dtype=float):
+        super(BatchedCoherencyAgent, self).__init__()
+        self.dtype = np.dtype(dtype)
+        self.n_agents = n_agents
+        self.n_items = n_items
+        self.n_attributes = n_attributes
+        self.learn_weights = learn_weights
+        self.learn_prefs = learn_prefs
+
+        # parameters are stored as column vectors so that they broadcast over attributes
+        self.c = self._per_agent(c)
+        self.p_eta = self._per_agent(p_eta)
+        self.a_eta = self._per_agent(w_eta)
+
+        self.p_init = p_init
+        self.w_init = w_init
+
+        self._initialise_model()
+
+    def _per_agent(self, value):
+        """Broadcast a scalar or per-agent parameter to a (n_agents, 1) column"""
+
+        value = np.asarray(value, dtype=self.dtype)
+
+        return np.broadcast_to(value.reshape(-1, 1), (self.n_agents, 1)).copy()
+
+    def _per_attribute(self, value):
+        """Broadcast a shared or per-agent initialisation to a (n_agents, n_attributes) matrix"""
+
+        value = np.asarray(value, dtype=self.dtype)
+
+        return np.broadcast_to(value, (self.n_agents, self.n_attributes)).copy()
+
+    def _initialise_model(self):
+        """Initialise the preference and attention weights of the population"""
+
+        if self.p_init is None:
+            self.preference_ = np.zeros((self.n_agents, self.n_attributes), dtype=self.dtype)
+        else:
+            self.preference_ = self._per_attribute(self.p_init)
+
+        if self.learn_weights:
+            if self.w_init is None:
+                self.attention_weights_ = np.ones((self.n_agents, self.n_attributes), dtype=self.dtype) / self.n_attributes
+            else:
+                self.attention_weights_ = self._per_attribute(self.w_init)
+        else:
+            self.attention_weights_ = np.ones((self.n_agents, self.n_attributes), dtype=self.dtype)
+
+    def feed_forward(self, X):
+        """
+        Feedforward the population using the attributes seen in X
+
+        # Parameters
+        X (numpy.ndarray): Observations of shape (n_agents, n_attributes, n_items)
+        """
+
+        X = np.asarray(X, dtype=self.dtype)
+
+        # calculate the attention-weighted euclidean distance of every item to every agent's preference
+        self.distance_ = X - self.preference_[:, :, np.newaxis]
+        self.euclid_distance_ = np.einsum('na,nai->ni', self.attention_weights_, np.square(self.distance_))
+
+        # scale the distance by c parameter
+        self.activation_ = -self.c * self.euclid_distance_ ** 0.5
+
+        # softmax over the items of each agent
+        self.probs_, self.log_probs_ = _stable_softmax(self.activation_, axis=1)
+
+        return self.probs_
+
+    def step(self, observation, policy, uniforms=None, active=None, profiler=None):
+        """
+        Choose an action for every agent and update the agents on those choices, re-using
+        a single forward pass for both
+
+        # Parameters
+        observation (numpy.ndarray): Observations of shape (n_agents, n_attributes, n_items)
+        policy (EpsilonGreedyPolicy or SoftmaxPolicy): Policy selecting the actions from the choice probabilities
+        uniforms (numpy.ndarray): Optional uniforms of shape (n_agents, policy.n_uniforms), otherwise the policy draws its own
+        active (numpy.ndarray): Optional boolean mask of the agents to update, the others stay frozen
+        profiler (PhaseProfiler): Optional profiler, timing the forward pass, action selection and update
+        """
+
+        probs = self.feed_forward(observation)
+
+        if profiler is not None:
+            profiler.lap('forward')
+
+        if uniforms is None:
+            actions = policy(probs)
+        else:
+            actions = policy.choose(probs, uniforms)
+
+        if profiler is not None:
+            profiler.lap('select')
+
+        self.backpropagate(actions, active=active)
+
+        if profiler is not None:
+            profiler.lap('update')
+
+        return actions
+
+    def compute_gradients(self, probs, actions):
+        """Compute the preference and attention weight gradients of every agent's last choice"""
+
+        # create one-hot encoded representation of the actions
+        l_action = np.zeros((self.n_agents, self.n_items), dtype=self.dtype)
+        l_action[np.arange(self.n_agents), actions] = 1.
+
+        return self.compute_target_gradients(probs, l_action)
+
+    def compute_target_gradients(self, probs, targets):
+        """
+        Compute the preference and attention weight gradients of every agent towards target choice
+        probabilities. With one-hot targets these are the gradients of the chosen actions. The gradients
+        are linear in the targets, so soft targets give the expected gradient over the actions.
+
+        # Parameters
+        probs (numpy.ndarray): Choice probabilities of the last forward pass, of shape (n_agents, n_items)
+        targets (numpy.ndarray): Target probabilities of shape (n_agents, n_items)
+        """
+
+        # gradient of the softmax, divided through by the activation (as in SimilarityLayer)
+        o_grad = _divide_by_activation(-(targets - probs), self.activation_)
+
+        if self.learn_weights:
+            grad_w = (self.c ** 2 / 2) * np.einsum('ni,nai->na', o_grad, np.square(self.distance_))
+        else:
+            grad_w = np.zeros((self.n_agents, self.n_attributes), dtype=self.dtype)
+
+        if self.learn_prefs:
+            grad_p = -self.c ** 2 * self.attention_weights_ * np.einsum('ni,nai->na', o_grad, self.distance_)
+        else:
+            grad_p = np.zeros((self.n_agents, self.n_attributes), dtype=self.dtype)
+
+        return grad_p, grad_w
+
+    def update_agent(self, observation, last_actions):
+        """
+        Update the preference and attention weight vectors of every agent
+
+        # Parameters
+        observation (numpy.ndarray): Observations of shape (n_agents, n_attributes, n_items)
+        last_actions (numpy.ndarray): The action taken by each agent, of shape (n_agents,)
+        """
+
+        # calculate probability of choice given observation
+        self.feed_forward(observation)
+
+        self.backpropagate(last_actions)
+
+    def backpropagate(self, last_actions, active=None):
+        """
+        Update the preference and attention weight vectors of every agent, using the activations
+        cached by the last call to feed_forward. If given, only the agents in the boolean mask
+        active are updated.
+        """
+
+        # calculate gradients
+        grad_p, grad_w = self.compute_gradients(self.probs_, last_actions)
+
+        self.apply_gradients(grad_p, grad_w, active=active)
+
+    def backpropagate_targets(self, targets, active=None):
+        """
+        Update the preference and attention weight vectors of every agent towards target choice
+        probabilities (see compute_target_gradients), using the activations cached by the last call
+        to feed_forward. If given, only the agents in the boolean mask active are updated.
+        """
+
+        grad_p, grad_w = self.compute_target_gradients(self.probs_, targets)
+
+        self.apply_gradients(grad_p, grad_w, active=active)
+
+    def apply_gradients(self, grad_p, grad_w, scale=1., active=None):
+        """
+        Take a clipped gradient descent step, of scale times the learning rates, on every agent's vectors,
+        or only on those of the agents in the boolean mask active
+
+        # Parameters
+        grad_p (numpy.ndarray): Preference gradients of shape (n_agents, n_attributes)
+        grad_w (numpy.ndarray): Attention weight gradients of shape (n_agents, n_attributes)
+        scale (float): Multiple of the learning rates to step by (e.g. the number of choices a step covers)
+        active (numpy.ndarray): Optional boolean mask of the agents to update, the others stay frozen
+        """
+
+        if active is not None:
+            # frozen agents take no step
+            grad_p[~active] = 0.
+            grad_w[~active] = 0.
+
         self.grad_p_ = grad_p
         self.grad_w_ = grad_w
 
         # update values using gradient descent
         if self.learn_prefs:
-            new_pref = copy.deepcopy(self.h0.preference_) - self.p_eta * grad_p
-            self.h0.preference_ = new_pref.clip(min=0, max=1)
-            self.p_values.append(copy.copy(self.h0.preference_))
+            self.preference_ = (self.preference_ - scale * self.p_eta * grad_p).clip(min=0, max=1)
 
         if self.learn_weights:
-            new_weights = copy.deepcopy(self.h0.attention_weights_ ) - self.a_eta * grad_w
-            self.h0.attention_weights_ = new_weights.clip(min=0)
-            self.w_values.append(copy.copy(self.h0.attention_weights_))
+            self.attention_weights_ = (self.attention_weights_ - scale * self.a_eta * grad_w).clip(min=0)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Simulation of a population of Coherency Maximising agents on a social network
+
+Every agent sits on a node of a (directed, weighted) graph and observes the choices of its
+neighbours. On every step all agents choose at once, and every agent then learns not only from its
+own choice but also from those of its neighbours: its learning target is a blend of its own one-hot
+choice and the share of its neighbours that chose each item. The shares of the whole population are
+one sparse matrix product with the row-normalised adjacency matrix, so a step costs time linear in
+the number of agents and edges. For the shares to be meaningful, item i must be an option of the
+same kind for every agent, e.g. drawn from the same choice type.
+"""
+
+from __future__ import division
+
+import numpy as np
+import scipy.sparse as sp
+
+from model import BatchedCoherencyAgent
+from policy import create_policy
+from record import TrajectoryRecorder
+from sampler import ChoiceSetSampler
+from environment import ClusterEnvironment
+from random_plan import RandomPlan
+from basins import classify_attractors
+from simulate import simulate_blobs
+
+
+def random_edges(n_agents, mean_degree=10, random_state=None):
+    """
+    Draw the edges of a random graph, in which every pair of agents is equally likely to be linked
+
+    # Parameters
+    n_agents (int): Number of agents (nodes)
+    mean_degree (float): Average number of neighbours of an agent, if the edges are undirected
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+    # Returns
+    Edges of shape (n_edges, 2), without self loops
+    """
+
+    rng = np.random if random_state is None else random_state
+
+    edges = rng.randint(n_agents, size=(int(round(n_agents * mean_degree / 2)), 2))
+
+    return edges[edges[:, 0] != edges[:, 1]]
+
+
+def small_world_edges(n_agents, mean_degree=10, rewire=0.1, random_state=None):
+    """
+    Draw the edges of a small world graph: a ring on which every agent is linked to its mean_degree
+    nearest agents, after which the far end of every edge is moved to a random agent with probability rewire
+
+    # Parameters
+    n_agents (int): Number of agents (nodes)
+    mean_degree (int): Number of neighbours of an agent on the ring, if the edges are undirected
+    rewire (float): Probability with which each edge is rewired
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+    # Returns
+    Edges of shape (n_edges, 2), without self loops
+    """
+
+    rng = np.random if random_state is None else random_state
+
+    # link every agent to the mean_degree // 2 agents after it on the ring
+    offsets = np.arange(1, mean_degree // 2 + 1)
+    sources = np.repeat(np.arange(n_agents), len(offsets))
+    targets = (sources + np.tile(offsets, n_agents)) % n_agents
+
+    rewired = rng.rand(len(targets)) < rewire
+    targets[rewired] = rng.randint(n_agents, size=rewired.sum())
+
+    edges = np.stack([sources, targets], axis=1)
+
+    return edges[edges[:, 0] != edges[:, 1]]
+
+
+class SocialNetwork(object):
+    """
+    The social network of a population, which mixes the choices of every agent's neighbours into its learning target
+
+    # Parameters
+    adjacency (scipy.sparse.spmatrix or numpy.ndarray): Matrix of shape (n_agents, n_agents), in which
+                                                         entry (i, j) is the weight with which agent i observes agent j
+    social_weight (float or numpy.ndarray): Weight of the neighbours' choices in the learning target, between
+                                            0 (learn from own choices only) and 1 (from the neighbours' only),
+                                            either shared or one value per agent
+    dtype (numpy.dtype): Floating point type of the learning targets
+    """
+    def __init__(self, adjacency, social_weight=0.5, dtype=float):
+        super(SocialNetwork, self).__init__()
+        self.dtype = np.dtype(dtype)
+
+        adjacency = sp.csr_matrix(adjacency, dtype=self.dtype)
+
+        if adjacency.shape[0] != adjacency.shape[1]:
+            raise ValueError('The adjacency matrix must be square, not of shape {0}'.format(adjacency.shape))
+
+        self.n_agents = adjacency.shape[0]
+
+        # normalise every row, such that the neighbours' choices become shares of the neighbourhood
+        self.degree_ = np.asarray(adjacency.sum(axis=1)).ravel()
+        has_neighbours = self.degree_ > 0
+
+        scale = np.zeros(self.n_agents, dtype=self.dtype)
+        scale[has_neighbours] = 1. / self.degree_[has_neighbours]
+
+        self.influence_ = sp.diags(scale).dot(adjacency).tocsr()
+
+        # agents without neighbours learn from their own choices alone
+        social_weight = np.broadcast_to(np.asarray(social_weight, dtype=self.dtype), (self.n_agents,))
+        self.social_weight_ = np.where(has_neighbours, social_weight, 0.).astype(self.dtype)[:, np.newaxis]
+
+    @classmethod
+    def from_edges(cls, edges, n_agents, weights=None, directed=False, social_weight=0.5, dtype=float):
+        """
+        Build the network from a list of edges. Repeated edges add up.
+
+        # Parameters
+        edges (numpy.ndarray): Edges of shape (n_edges, 2). Edge (i, j) lets agent i observe agent j
+        n_agents (int): Number of agents (nodes)
+        weights (numpy.ndarray): Optional weight of every edge. Defaults to 1
+        directed (bool): Whether agent j does not observe agent i in return
+        social_weight (float or numpy.ndarray): Weight of the neighbours' choices in the learning target
+        dtype (numpy.dtype): Floating point type of the learning targets
+        """
+
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        weights = np.ones(len(edges)) if weights is None else np.asarray(weights, dtype=float)
+
+        rows, cols = edges[:, 0], edges[:, 1]
+
+        if not directed:
+            rows, cols, weights = np.concatenate([rows, cols]), np.concatenate([cols, rows]), np.tile(weights, 2)
+
+        adjacency = sp.coo_matrix((weights, (rows, cols)), shape=(n_agents, n_agents))
+
+        return cls(adjacency, social_weight=social_weight, dtype=dtype)
+
+    def targets(self, actions, n_items):
+        """
+        Compute the learning target of every agent: its own one-hot choice, blended with its neighbours' choices
+
+        # Parameters
+        actions (numpy.ndarray): The item chosen by every agent, of shape (n_agents,)
+        n_items (int): How many actions are there to choose from?
+
+        # Returns
+        Target choice probabilities of shape (n_agents, n_items)
+        """
+
+        one_hot = self._one_hot(actions, n_items)
+
+        return one_hot + self.social_weight_ * (self.influence_.dot(one_hot) - one_hot)
+
+    def _one_hot(self, actions, n_items):
+        one_hot = np.zeros((self.n_agents, n_items), dtype=self.dtype)
+        one_hot[np.arange(self.n_agents), actions] = 1.
+
+        return one_hot
+
+
+def simulate_network_choices(X, y, model, network, n_choices, epsilon=0.05, epsilon_greedy=True, random_state=None,
+                             recorder=None, sampler=None, profiler=None, environment=None, action_log=None):
+    """
+    Simulate a population of agents on a social network in lockstep for n_choices
+
+    # Parameters
+    X (numpy.ndarray): Numpy multidimensional containing all possible observations
+    y (numpy.ndarray): Vector describing the choice type (1 or 2) of observations
+    model (BatchedCoherencyAgent): Population of model agents, one per node of the network
+    network (SocialNetwork): Social network of the agents
+    n_choices (int): Number of choices by which to simulate
+    epsilon (float): Probability of taking an exploratory action, if epsilon_greedy=True
+    epsilon_greedy (bool): Whether to use epsilon greedy exploration or softmax exploration
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    recorder (TrajectoryRecorder): Recorder of the preference and attention history. Defaults to recording every step
+    sampler (ChoiceSetSampler): Sampler of the choice sets. Defaults to drawing model.n_items options from X
+    profiler (PhaseProfiler): Optional profiler, timing every phase of the simulation loop
+    environment (ChoiceEnvironment): Environment generating the choice sets of all agents. Defaults to a
+                                     ClusterEnvironment of the sampler
+    action_log (ActionLog): Optional log of the action taken by every agent on every step
+
+    # Returns
+    Preference and attention histories, each of shape (n_recorded, n_agents, n_attributes)
+    """
+
+    if network.n_agents != model.n_agents:
+        raise ValueError('The network has {0:d} agents, but the model {1:d}'.format(network.n_agents, model.n_agents))
+
+    if recorder is None:
+        recorder = TrajectoryRecorder(n_choices, model.n_attributes, n_agents=model.n_agents, dtype=model.dtype)
+
+    if environment is None:
+        if sampler is None:
+            sampler = ChoiceSetSampler(X, y, n_items=model.n_items, dtype=model.dtype)
+
+        if sampler.random_clusters:
+            raise ValueError('Neighbours can only share their choices if every item comes from a fixed choice type, '
+                             'i.e. if n_items is at least the number of choice types')
+
+        environment = ClusterEnvironment(sampler, n_agents=model.n_agents)
+
+    policy = create_policy(epsilon_greedy=epsilon_greedy, epsilon=epsilon, random_state=random_state)
+
+    # draw the random numbers of the environment and policy in blocks
+    plan = RandomPlan(random_state, [environment.n_uniforms, policy.n_uniforms], n_agents=model.n_agents)
+
+    if profiler is not None:
+        profiler.begin(n_choices)
+
+    for t, (environment_uniforms, policy_uniforms) in plan.iterate(n_choices):
+
+        # receive the next choice set of each agent, given their last choices
+        if t == 0:
+            observation = environment.reset(environment_uniforms)
+        else:
+            observation = environment.step(actions, environment_uniforms)
+
+        if profiler is not None:
+            profiler.lap('observation')
+
+        # all agents choose at once
+        probs = model.feed_forward(observation)
+
+        if profiler is not None:
+            profiler.lap('forward')
+
+        actions = policy.choose(probs, policy_uniforms)
+
+        if action_log is not None:
+            action_log.record(t, actions)
+
+        if profiler is not None:
+            profiler.lap('select')
+
+        # learn from their own choices and those of their neighbours
+        model.backpropagate_targets(network.targets(actions, model.n_items))
+
+        if profiler is not None:
+            profiler.lap('update')
+
+        # update preference history
+        recorder.record(t, model.preference_, model.attention_weights_)
+
+        if profiler is not None:
+            profiler.lap('record')
+            profiler.end_step(t)
+
+    if profiler is not None:
+        profiler.end()
+
+    return recorder.history()
+
+
+def run_network(config, n_agents=10000, mean_degree=10, rewire=None, social_weight=0.5, random_state=None,
+                profiler=None):
+    """
+    Simulate a population of the agent described by config on a random social network, and classify
+    the choice type that every agent settled on
+
+    # Parameters
+    config (dict): Simulation config, as in CONFIG
+    n_agents (int): Number of agents (nodes)
+    mean_degree (int): Average number of neighbours of an agent
+    rewire (float): Rewiring probability of a small world network, or None for a random network
+    social_weight (float): Weight of the neighbours' choices in the learning target
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    profiler (PhaseProfiler): Optional profiler, timing every phase of the simulation loop
+
+    # Returns
+    Dictionary with the final preferences and attention weights of shape (n_agents, n_attributes),
+    the choice type of every agent, the share of agents per choice type, the edges of the network and
+    the share of edges whose agents settled on the same choice type
+    """
+
+    X, y = simulate_blobs(config['cluster_centers'],
+                          n_samples=config['n_choices'],
+                          cluster_std=config['cluster_std'])
+    n_attributes = X.shape[1]
+
+    if rewire is None:
+        edges = random_edges(n_agents, mean_degree=mean_degree, random_state=random_state)
+    else:
+        edges = small_world_edges(n_agents, mean_degree=mean_degree, rewire=rewire, random_state=random_state)
+
+    network = SocialNetwork.from_edges(edges, n_agents, social_weight=social_weight, dtype=config['dtype'])
+
+    model = BatchedCoherencyAgent(n_agents, config['n_items'], n_attributes,
+                                  c=config['c'], p_eta=config['lr'], w_eta=config['lr'],
+                                  learn_prefs=True, learn_weights=True,
+                                  p_init=config['preference'], w_init=config['weights'], dtype=config['dtype'])
+
+    # only the final states are classified
+    recorder = TrajectoryRecorder(config['n_timesteps'], n_attributes, n_agents=n_agents, final_only=True,
+                                  dtype=model.dtype)
+
+    pref_hist, att_hist = simulate_network_choices(X, y, model, network, config['n_timesteps'],
+                                                   epsilon=config['epsilon'],
+                                                   epsilon_greedy=config['epsilon_greedy'],
+                                                   random_state=random_state,
+                                                   recorder=recorder,
+                                                   profiler=profiler)
+
+    labels = classify_attractors(pref_hist[-1], att_hist[-1], config['cluster_centers'])
+    linked = network.influence_.tocoo()
+
+    return {
+        'preference': pref_hist[-1],
+        'attention_weights': att_hist[-1],
+        'labels': labels,
+        'shares': np.bincount(labels, minlength=len(config['cluster_centers'])) / n_agents,
+        'edges': edges,
+        'agreement': np.mean(labels[linked.row] == labels[linked.col]),
+    }
+
+
+def format_network(result):
+    """Describe the share of agents that settled on each choice type, and how often neighbours agree"""
+
+    lines = ['{0:.1%} of agents settled on choice type {1:d}'.format(share, k + 1)
+             for k, share in enumerate(result['shares'])]
+    lines.append('{0:.1%} of neighbours settled on the same choice type'.format(result['agreement']))
+
+    return '\n'.join(lines)
@@ -57,7 +57,54 @@ def calculate_attention_weight_ratio(att_hist):
     return att_ratio
 
 
-def annotate_preferences(ax, pref, color):
+def largest_triangle_three_buckets(points, n_out):
+    """
+    Select n_out points of a 2D path that preserve its shape, using the Largest-Triangle-Three-Buckets
+    algorithm. The first and last points are always kept, and the points in between are split into
+    n_out - 2 buckets. From every bucket, the point forming the largest triangle with the previously
+    selected point and the mean of the next bucket is kept.
+
+    # Parameters
+    points (numpy.ndarray): Path of shape (n_points, 2). Can be a memory map, which is read one bucket at a time
+    n_out (int): Number of points to keep
+
+    # Returns
+    The indices of the kept points, in order
+    """
+
+    n_points = len(points)
+
+    if n_out >= n_points or n_out < 3:
+        return np.arange(n_points)
+
+    # bucket i spans [edges[i], edges[i + 1]), the last bucket is followed by the final point
+    edges = np.linspace(1, n_points - 1, n_out - 1).astype(int)
+    edges = np.append(edges, n_points)
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n_points - 1
+
+    previous = np.asarray(points[0], dtype=float)
+    bucket = np.asarray(points[edges[0]:edges[1]], dtype=float)
+
+    for i in range(n_out - 2):
+        following = np.asarray(points[edges[i + 1]:edges[i + 2]], dtype=float)
+        target = following.mean(axis=0)
+
+        # twice the area of the triangle (previous, candidate, target) for every candidate in the bucket
+        area = np.abs((previous[0] - target[0]) * (bucket[:, 1] - previous[1])
+                      - (previous[0] - bucket[:, 0]) * (target[1] - previous[1]))
+
+        best = np.argmax(area)
+        selected[i + 1] = edges[i] + best
+        previous = bucket[best]
+
+        bucket = following
+
+    return selected
+
+
+def annotate_preferences(ax, pref, color, rasterized=False):
     """Add preferences to plot"""
 
     sns.scatterplot(pref[:, 0], pref[:, 1], 
@@ -65,6 +112,7 @@ def annotate_preferences(ax, pref, color):
     alpha=0.75, 
     palette=sns.dark_palette("gray", as_cmap=True), 
     linestyle='-',
+    rasterized=rasterized,
     s= 2.0) #  s=1.0, l, 
 
     ax.text(pref[-1, 0], pref[-1, 1], 'X', color='black');
@@ -81,7 +129,7 @@ def custom_legend(cmap):
 
     return custom_lines
 
-def plot_simulation_history(X, y, pref_hist, att_hist, save_path=None):
+def plot_simulation_history(X, y, pref_hist, att_hist, save_path=None, max_points=5000, rasterized=True, dpi=300):
     """
     Plot the preference and attention history of the simulation, including the two choice types
 
@@ -91,8 +139,18 @@ def plot_simulation_history(X, y, pref_hist, att_hist, save_path=None):
     pref_hist (numpy.ndarray): History of preferences over course of the simulation
     att_hist (numpy.ndarray): History of attention weights over course of the simulation
     save_path (str): Location to save the plot
+    max_points (int): Most preference points to render. Longer histories are decimated with
+                      largest_triangle_three_buckets, which preserves the shape of the path. None renders every point
+    rasterized (bool): Whether to rasterise the preference history within the vector figure
+    dpi (int): Resolution of the rasterised layers
     """
 
+    # decimate long histories, such that the time to plot and the file size do not grow with the history
+    if max_points is not None and len(pref_hist) > max_points:
+        kept = largest_triangle_three_buckets(pref_hist, max_points)
+        pref_hist = np.asarray(pref_hist[kept])
+        att_hist = np.asarray(att_hist[kept])
+
     # plot the clusters
     ax = plot_blobs(X, y)
 
@@ -105,7 +163,7 @@ def plot_simulation_history(X, y, pref_hist, att_hist, save_path=None):
     # att_colors = [cmap(x) for x in att_ratio]
 
     # add in preferences to plot
-    ax = annotate_preferences(ax, pref_hist, att_ratio)
+    ax = annotate_preferences(ax, pref_hist, att_ratio, rasterized=rasterized)
 
     ax.set_xlabel('Attribute 1')
     ax.set_ylabel('Attribute 2')
@@ -126,4 +184,66 @@ def plot_simulation_history(X, y, pref_hist, att_hist, save_path=None):
 
     # save the plot
     if save_path is not None:
-        plt.savefig(save_path, format='eps', dpi=1000, bbox_inches='tight')
+        plt.savefig(save_path, format='eps', dpi=dpi, bbox_inches='tight')
+
+
+def plot_streamed_history(X, y, path, save_path=None, max_points=5000):
+    """
+    Plot a history that was streamed to disk by a StreamingRecorder, without loading it into memory first
+
+    # Parameters
+    X (numpy.ndarray): A 2-dimensional matrix of options to select from
+    y (numpy.ndarray): A 1-dimensional vector of labels (either choice type 0 or 1)
+    path (str): Prefix of the streamed trajectory files
+    save_path (str): Location to save the plot
+    max_points (int): Most preference points to render (see plot_simulation_history)
+    """
+
+    from stream import load_trajectory
+
+    pref_hist, att_hist, _ = load_trajectory(path)
+
+    plot_simulation_history(X, y, pref_hist, att_hist, save_path=save_path, max_points=max_points)
+
+
+def plot_basins(basins, axes=(('preference', 0), ('preference', 1)), save_path=None, dpi=300):
+    """
+    Plot a map of the basins of attraction, colouring every starting point by the choice type it settled on
+
+    # Parameters
+    basins (dict): Output of basins.run_basins
+    axes (tuple): The two coordinates spanned by the grid, as ('preference' or 'weights', attribute) pairs
+    save_path (str): Location to save the plot
+    dpi (int): Resolution of the map within the vector figure
+    """
+
+    from matplotlib.colors import ListedColormap
+
+    font = {'size'   : 7}
+    matplotlib.rc('font', **font)
+
+    labels = basins['labels']
+    n_clusters = max(labels.max() + 1, 1)
+
+    # unconverged starting points (-1) are grey
+    cmap = ListedColormap(['#A1A0A0'] + flatui[:n_clusters])
+
+    fig, ax = plt.subplots(figsize=(3, 3))
+    extent = [basins['x'][0], basins['x'][-1], basins['y'][0], basins['y'][-1]]
+    ax.imshow(labels, origin='lower', extent=extent, cmap=cmap, vmin=-1.5, vmax=n_clusters - 0.5,
+              interpolation='nearest', aspect='auto', rasterized=True)
+
+    names = {'preference': 'Initial preference', 'weights': 'Initial attention weight'}
+    ax.set_xlabel('{0:s} (attribute {1:d})'.format(names[axes[0][0]], axes[0][1] + 1))
+    ax.set_ylabel('{0:s} (attribute {1:d})'.format(names[axes[1][0]], axes[1][1] + 1))
+
+    lines = [Line2D([0], [0], marker='s', color='w', markerfacecolor=cmap(i + 1), markersize=6)
+             for i in range(-1, n_clusters)]
+    plt.legend(lines, ['Not converged'] + ['Choice Type {0:s}'.format(chr(ord('a') + i)) for i in range(n_clusters)],
+               loc='upper left', bbox_to_anchor=(1, 1), fontsize=7, numpoints=1)
+    plt.tight_layout()
+
+    if save_path is not None:
+        plt.savefig(save_path, format='eps', dpi=dpi, bbox_inches='tight')
+
+    return ax
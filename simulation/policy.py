@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Action selection policies for the Coherency Maximizing agents
+
+A policy maps choice probabilities to actions. Policies work on the probabilities of a single
+agent (n_items) as well as those of a population (n_agents, n_items), and turn a fixed number
+of uniform random numbers per agent into an action. Those uniforms are either drawn by the
+policy itself or given to it, such that random numbers can also be drawn ahead of time.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class EpsilonGreedyPolicy(object):
+    """
+    Take the action with the highest probability, but with probability epsilon take a random action
+
+    # Parameters
+    epsilon (float): Probability of taking an exploratory action
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    """
+
+    # a coin flip for exploring and the exploratory action
+    n_uniforms = 2
+
+    def __init__(self, epsilon=0.05, random_state=None):
+        super(EpsilonGreedyPolicy, self).__init__()
+        self.epsilon = epsilon
+        self.random_state = np.random if random_state is None else random_state
+
+    def __call__(self, probs):
+        """Select action(s) given the choice probabilities, drawing uniforms from the random state"""
+
+        uniforms = self.random_state.rand(*(probs.shape[:-1] + (self.n_uniforms,)))
+
+        return self.choose(probs, uniforms)
+
+    def choose(self, probs, uniforms):
+        """Select action(s) given the choice probabilities and n_uniforms uniform numbers per agent"""
+
+        n_items = probs.shape[-1]
+
+        greedy = np.argmax(probs, axis=-1)
+        explore = np.minimum((uniforms[..., 1] * n_items).astype(int), n_items - 1)
+
+        return _as_action(np.where(uniforms[..., 0] < self.epsilon, explore, greedy))
+
+    def action_probabilities(self, probs):
+        """Return the probability with which the policy takes each action, given the choice probabilities"""
+
+        n_items = probs.shape[-1]
+
+        greedy = np.argmax(probs, axis=-1)[..., np.newaxis] == np.arange(n_items)
+
+        return (1 - self.epsilon) * greedy + self.epsilon / n_items
+
+
+class SoftmaxPolicy(object):
+    """
+    Sample an action from the choice probabilities
+
+    # Parameters
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    """
+
+    # a single uniform for inverse transform sampling
+    n_uniforms = 1
+
+    def __init__(self, random_state=None):
+        super(SoftmaxPolicy, self).__init__()
+        self.random_state = np.random if random_state is None else random_state
+
+    def __call__(self, probs):
+        """Select action(s) given the choice probabilities, drawing uniforms from the random state"""
+
+        uniforms = self.random_state.rand(*(probs.shape[:-1] + (self.n_uniforms,)))
+
+        return self.choose(probs, uniforms)
+
+    def choose(self, probs, uniforms):
+        """Select action(s) given the choice probabilities and n_uniforms uniform numbers per agent"""
+
+        n_items = probs.shape[-1]
+        action = (np.cumsum(probs, axis=-1) < uniforms[..., :1]).sum(axis=-1)
+
+        return _as_action(np.minimum(action, n_items - 1))
+
+    def action_probabilities(self, probs):
+        """Return the probability with which the policy takes each action, given the choice probabilities"""
+
+        return probs
+
+
+def _as_action(action):
+    """Return the action of a single agent as an int, and those of a population as an array"""
+
+    if np.ndim(action) == 0:
+        return int(action)
+
+    return action
+
+
+def create_policy(epsilon_greedy=True, epsilon=0.05, random_state=None):
+    """
+    Create the policy used in the simulations
+
+    # Parameters
+    epsilon_greedy (bool): Whether to use epsilon greedy exploration or softmax exploration
+    epsilon (float): Probability of taking an exploratory action, if epsilon_greedy=True
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    """
+
+    if epsilon_greedy:
+        return EpsilonGreedyPolicy(epsilon=epsilon, random_state=random_state)
+
+    return SoftmaxPolicy(random_state=random_state)
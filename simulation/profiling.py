@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Opt-in profiling of the phases of a simulation
+
+A PhaseProfiler is handed to simulate_choices (or simulate_population_choices), which then marks
+the end of every phase of every step. The time since the previous mark is added to that phase, so
+each phase costs a single timer call. Without a profiler, the simulation only pays for checking
+that none was given.
+"""
+
+from __future__ import division, print_function
+
+import sys
+import json
+import timeit
+
+# phases of a simulation step, in the order in which they run
+PHASES = ['observation', 'forward', 'select', 'update', 'record', 'monitor', 'checkpoint', 'kernel']
+
+
+def print_progress(step, n_steps, elapsed, eta, stream=sys.stderr):
+    """Default progress callback, printing the progress and the estimated time remaining"""
+
+    stream.write('step {0:d}/{1:d} ({2:.0%}), elapsed {3:.1f}s, eta {4:.1f}s\n'.format(
+        step, n_steps, step / max(n_steps, 1), elapsed, eta))
+    stream.flush()
+
+
+class PhaseProfiler(object):
+    """
+    Cumulative timers and counters of the phases of a simulation
+
+    # Parameters
+    progress (callable): Optional callback progress(step, n_steps, elapsed, eta), called during the run
+    progress_every (float): Least number of seconds between two calls of the progress callback
+    """
+    def __init__(self, progress=None, progress_every=10.):
+        self.progress = progress
+        self.progress_every = progress_every
+
+        self.totals_ = dict()
+        self.counts_ = dict()
+        self.steps_ = 0
+        self.elapsed_ = 0.
+
+        self._last = None
+
+    def begin(self, n_steps, start=0):
+        """
+        Start timing a run
+
+        # Parameters
+        n_steps (int): Number of steps the run will take in total
+        start (int): Step the run starts from, when it was resumed
+        """
+
+        self.n_steps_ = n_steps
+        self._first = start
+        self._begin = self._last = timeit.default_timer()
+        self._next_report = self._begin + self.progress_every
+
+    def lap(self, phase):
+        """Add the time since the previous mark to phase"""
+
+        now = timeit.default_timer()
+
+        self.totals_[phase] = self.totals_.get(phase, 0.) + now - self._last
+        self.counts_[phase] = self.counts_.get(phase, 0) + 1
+        self._last = now
+
+    def end_step(self, t, n_steps=1):
+        """Mark the end of the step(s) up to and including step t, reporting progress when it is due"""
+
+        self.steps_ += n_steps
+
+        if self.progress is not None and self._last >= self._next_report:
+            self.progress(t + 1, self.n_steps_, *self._progress(t))
+            self._next_report = self._last + self.progress_every
+
+    def _progress(self, t):
+        """Time elapsed since the run began, and the estimated time remaining"""
+
+        elapsed = self._last - self._begin
+        done = t + 1 - self._first
+
+        return elapsed, elapsed * (self.n_steps_ - t - 1) / max(done, 1)
+
+    def end(self):
+        """Stop timing the run"""
+
+        self.elapsed_ += timeit.default_timer() - self._begin
+
+    def to_dict(self):
+        """Return the timers and counters as a dictionary, e.g. to send them from a worker process"""
+
+        return {'totals': dict(self.totals_), 'counts': dict(self.counts_),
+                'steps': self.steps_, 'elapsed': self.elapsed_}
+
+    def merge(self, other):
+        """
+        Add the timers and counters of another profiler (e.g. of another run of a sweep) to this one
+
+        # Parameters
+        other (PhaseProfiler or dict): The other profiler, or its to_dict
+        """
+
+        if isinstance(other, PhaseProfiler):
+            other = other.to_dict()
+
+        for phase, total in other['totals'].items():
+            self.totals_[phase] = self.totals_.get(phase, 0.) + total
+            self.counts_[phase] = self.counts_.get(phase, 0) + other['counts'][phase]
+
+        self.steps_ += other['steps']
+        self.elapsed_ += other['elapsed']
+
+    def summary(self):
+        """
+        Summarise the time spent in every phase
+
+        # Returns
+        List with one dictionary per phase, holding its number of calls, total time, time per call and share of the run
+        """
+
+        rows = list()
+        profiled = sum(self.totals_.values())
+
+        for phase in PHASES + sorted(set(self.totals_) - set(PHASES)):
+            if phase not in self.totals_:
+                continue
+
+            rows.append({'phase': phase,
+                         'calls': self.counts_[phase],
+                         'total': self.totals_[phase],
+                         'per_call': self.totals_[phase] / self.counts_[phase],
+                         'share': self.totals_[phase] / profiled if profiled > 0 else 0.})
+
+        return rows
+
+    def format_summary(self):
+        """Format the summary as a table"""
+
+        lines = ['{0:<12s} {1:>10s} {2:>10s} {3:>12s} {4:>7s}'.format('phase', 'calls', 'total (s)', 'per call (us)',
+                                                                      'share')]
+
+        for row in self.summary():
+            lines.append('{0:<12s} {1:>10d} {2:>10.3f} {3:>12.2f} {4:>7.1%}'.format(
+                row['phase'], row['calls'], row['total'], row['per_call'] * 1e6, row['share']))
+
+        lines.append('{0:d} steps in {1:.3f}s'.format(self.steps_, self.elapsed_))
+
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Save the summary, and the raw timers and counters, to a JSON file"""
+
+        with open(path, 'w') as f:
+            json.dump(dict(self.to_dict(), summary=self.summary()), f, indent=2, sort_keys=True)
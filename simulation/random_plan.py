@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Block-drawn random numbers for simulations
+
+Rather than making several small draws from the random state on every timestep, a RandomPlan
+draws all the uniform numbers that a chunk of timesteps needs (to sample choice sets, flip
+exploration coins, pick exploratory actions, ...) with a single call, and hands them out step
+by step. A run is therefore fully determined by the seed of its random state, irrespective of
+the order in which the consumers of the numbers use them.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class RandomPlan(object):
+    """
+    Pre-draws the uniform numbers of a simulation, in chunks of timesteps
+
+    # Parameters
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    n_uniforms (list): Number of uniforms each consumer needs per agent and timestep (e.g. [sampler.n_uniforms, policy.n_uniforms])
+    n_agents (int): Number of agents drawing numbers in lockstep, or None for a single agent
+    max_numbers (int): Upper bound on the number of uniforms held per chunk, which bounds the chunk's memory
+    max_chunk_size (int): Upper bound on the number of timesteps per chunk
+    """
+    def __init__(self, random_state=None, n_uniforms=(1,), n_agents=None, max_numbers=2 ** 20, max_chunk_size=1024):
+        super(RandomPlan, self).__init__()
+        self.random_state = np.random if random_state is None else random_state
+        self.n_uniforms = list(n_uniforms)
+        self.n_agents = n_agents
+
+        self.batch_shape = () if n_agents is None else (n_agents,)
+        self.step_size = int(np.prod(self.batch_shape)) * sum(self.n_uniforms)
+        self.chunk_size = int(max(1, min(max_chunk_size, max_numbers // max(self.step_size, 1))))
+
+        # where each consumer's numbers end along the last axis
+        self.splits_ = np.cumsum(self.n_uniforms)[:-1]
+
+        self._chunk_start = 0
+        self._chunk_state = None
+
+    def draw_chunk(self, n_steps):
+        """Draw the uniforms of the next n_steps timesteps, split into one array per consumer"""
+
+        block = self.random_state.rand(*((n_steps,) + self.batch_shape + (sum(self.n_uniforms),)))
+
+        return np.split(block, self.splits_, axis=-1)
+
+    def iterate_chunks(self, n_timesteps, start=0):
+        """
+        Iterate over chunks of timesteps, yielding the first timestep of the chunk, the offset within
+        the chunk from which to continue and a list with the uniforms of every consumer
+
+        # Parameters
+        n_timesteps (int): Number of timesteps to draw numbers for
+        start (int): Timestep to resume from. The random state must then be in the state returned
+                     by get_state(start) when the run was interrupted
+        """
+
+        # chunks always start at multiples of the chunk size, so that resumed runs draw the same numbers
+        for chunk_start in range(start - start % self.chunk_size, n_timesteps, self.chunk_size):
+            n_steps = min(self.chunk_size, n_timesteps - chunk_start)
+
+            self._chunk_start = chunk_start
+            self._chunk_state = self.random_state.get_state()
+
+            yield chunk_start, max(start - chunk_start, 0), self.draw_chunk(n_steps)
+
+    def iterate(self, n_timesteps, start=0):
+        """
+        Iterate over timesteps, yielding the timestep and a list with the uniforms of every consumer
+
+        # Parameters
+        n_timesteps (int): Number of timesteps to draw numbers for
+        start (int): Timestep to resume from (see iterate_chunks)
+        """
+
+        for chunk_start, offset, chunk in self.iterate_chunks(n_timesteps, start=start):
+            for i in range(offset, len(chunk[0])):
+                yield chunk_start + i, [uniforms[i] for uniforms in chunk]
+
+    def get_state(self, step):
+        """
+        Return the state of the random state from which iterate(n_timesteps, start=step) continues
+        the current run, where step is within or just after the chunk being iterated over
+        """
+
+        if step >= self._chunk_start + self.chunk_size:
+            # the next chunk has not been drawn yet
+            return self.random_state.get_state()
+
+        return self._chunk_state
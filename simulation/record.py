@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Recording of preference and attention weight trajectories, and of the actions taken, during a simulation
+"""
+
+from __future__ import division
+
+import os
+
+import numpy as np
+
+
+class TrajectoryRecorder(object):
+    """
+    Records the preference and attention weight trajectories of a simulation into arrays
+    that are allocated once, up front, for the steps that are actually kept.
+
+    Every k-th step is kept (i.e. steps k-1, 2k-1, ...) together with the final step, so that
+    the last row of the history is always the final state of the agent.
+
+    # Parameters
+    n_timesteps (int): Number of steps that will be simulated
+    n_attributes (int): How many attributes belong to each choice?
+    n_agents (int): Number of agents in the population, or None when recording a single agent
+    every (int): Record every k-th step of the simulation
+    final_only (bool): Only keep the final state of the simulation
+    dtype (numpy.dtype): Floating point type of the recorded history
+    """
+    def __init__(self, n_timesteps, n_attributes, n_agents=None, every=1, final_only=False, dtype=float):
+        super(TrajectoryRecorder, self).__init__()
+        self.n_timesteps = n_timesteps
+        self.n_attributes = n_attributes
+        self.n_agents = n_agents
+        self.every = every
+        self.final_only = final_only
+        self.dtype = np.dtype(dtype)
+
+        if final_only:
+            self.n_kept = 1
+        else:
+            self.n_kept = n_timesteps // every + int(n_timesteps % every != 0)
+
+        if n_agents is None:
+            self.shape = (n_attributes,)
+        else:
+            self.shape = (n_agents, n_attributes)
+
+        self._allocate()
+
+    def _allocate(self):
+        """Preallocate the arrays holding the kept steps"""
+
+        self.preferences_ = np.zeros((self.n_kept,) + self.shape, dtype=self.dtype)
+        self.attention_weights_ = np.zeros((self.n_kept,) + self.shape, dtype=self.dtype)
+        self.steps_ = np.zeros(self.n_kept, dtype=int)
+        self.count_ = 0
+        self.last_step_ = None
+
+    def should_record(self, t):
+        """Whether step t of the simulation is kept"""
+
+        if t == self.n_timesteps - 1:
+            return True
+
+        return not self.final_only and (t + 1) % self.every == 0
+
+    def record(self, t, preference, attention_weights):
+        """
+        Record the state of the agent(s) after step t, if it is kept
+
+        # Parameters
+        t (int): Step of the simulation (starting at 0)
+        preference (numpy.ndarray): Current preference vector(s)
+        attention_weights (numpy.ndarray): Current attention weight vector(s)
+        """
+
+        if self.should_record(t):
+            self._write_row(t, preference, attention_weights)
+
+    def record_block(self, t, preferences, attention_weights):
+        """
+        Record the states of the agent(s) after a block of consecutive steps, starting at step t
+
+        # Parameters
+        t (int): Step of the simulation at the start of the block
+        preferences (numpy.ndarray): Preference vector(s) after every step of the block
+        attention_weights (numpy.ndarray): Attention weight vector(s) after every step of the block
+        """
+
+        steps = np.arange(t, t + len(preferences))
+        kept = steps == self.n_timesteps - 1
+
+        if not self.final_only:
+            kept |= (steps + 1) % self.every == 0
+
+        n_kept = kept.sum()
+
+        if n_kept > 0:
+            self._write_rows(steps[kept],
+                             np.reshape(preferences[kept], (n_kept,) + self.shape),
+                             np.reshape(attention_weights[kept], (n_kept,) + self.shape))
+
+    def finalise(self, t, preference, attention_weights):
+        """
+        Record the state after step t as the final state, for simulations that stop early. Does
+        nothing if step t was already recorded.
+        """
+
+        if self.last_step_ != t:
+            self._write_row(t, preference, attention_weights)
+
+    def _write_row(self, t, preference, attention_weights):
+        """Append the state after step t to the history"""
+
+        self.preferences_[self.count_] = np.reshape(preference, self.shape)
+        self.attention_weights_[self.count_] = np.reshape(attention_weights, self.shape)
+        self.steps_[self.count_] = t
+        self.count_ += 1
+        self.last_step_ = t
+
+    def _write_rows(self, steps, preferences, attention_weights):
+        """Append the states after several steps to the history"""
+
+        rows = slice(self.count_, self.count_ + len(steps))
+        self.preferences_[rows] = preferences
+        self.attention_weights_[rows] = attention_weights
+        self.steps_[rows] = steps
+        self.count_ += len(steps)
+        self.last_step_ = steps[-1]
+
+    def get_state(self):
+        """Return the state of the recorder as a dictionary of arrays, for checkpointing. Only the rows recorded so far are kept"""
+
+        return {'preferences': self.preferences_[:self.count_],
+                'attention_weights': self.attention_weights_[:self.count_],
+                'steps': self.steps_[:self.count_],
+                'count': self.count_}
+
+    def set_state(self, state):
+        """Restore the state of the recorder from a dictionary created by get_state"""
+
+        self.count_ = int(state['count'])
+        self.preferences_[:self.count_] = state['preferences']
+        self.attention_weights_[:self.count_] = state['attention_weights']
+        self.steps_[:self.count_] = state['steps']
+        self.last_step_ = self.steps_[self.count_ - 1] if self.count_ > 0 else None
+
+    def history(self):
+        """Return the preference and attention weight histories recorded so far"""
+
+        return self.preferences_[:self.count_], self.attention_weights_[:self.count_]
+
+
+class ActionLog(object):
+    """
+    Records the action taken on every step of a simulation into a compact array of the smallest unsigned
+    integer type that holds n_items actions (i.e. one byte per action for up to 256 items). The array is
+    allocated once, up front, or memory-mapped to a .npy file for runs that do not fit into memory.
+
+    # Parameters
+    n_timesteps (int): Number of steps that will be simulated
+    n_items (int): How many actions are there to choose from?
+    n_agents (int): Number of agents in the population, or None when recording a single agent
+    path (str): Optional location of a .npy file to memory-map the log to
+    resume (bool): Continue writing to an existing file (when resuming from a checkpoint) rather than creating it
+    """
+    def __init__(self, n_timesteps, n_items, n_agents=None, path=None, resume=False):
+        super(ActionLog, self).__init__()
+        self.n_timesteps = n_timesteps
+        self.n_items = n_items
+        self.n_agents = n_agents
+        self.path = path
+        self.dtype = np.min_scalar_type(max(n_items - 1, 0))
+
+        shape = (n_timesteps,) if n_agents is None else (n_timesteps, n_agents)
+
+        if path is None:
+            self.actions_ = np.zeros(shape, dtype=self.dtype)
+        elif resume and os.path.exists(path):
+            self.actions_ = np.load(path, mmap_mode='r+')
+        else:
+            self.actions_ = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=shape)
+
+        self.count_ = 0
+
+    def record(self, t, actions):
+        """Record the action(s) taken on step t"""
+
+        self.actions_[t] = actions
+        self.count_ = t + 1
+
+    def record_block(self, t, actions):
+        """Record the action(s) taken on a block of consecutive steps, starting at step t"""
+
+        self.actions_[t:t + len(actions)] = actions
+        self.count_ = t + len(actions)
+
+    def get_state(self):
+        """Return the state of the log as a dictionary of arrays, for checkpointing"""
+
+        return {'actions': self.actions_[:self.count_], 'count': self.count_}
+
+    def set_state(self, state):
+        """Restore the state of the log from a dictionary created by get_state"""
+
+        self.count_ = int(state['count'])
+        self.actions_[:self.count_] = state['actions']
+
+    def flush(self):
+        """Write the log to disk, if it is memory-mapped"""
+
+        if isinstance(self.actions_, np.memmap):
+            self.actions_.flush()
+
+    def history(self):
+        """Return the actions recorded so far, of shape (n_recorded,) or (n_recorded, n_agents)"""
+
+        return self.actions_[:self.count_]
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Parameter recovery studies of the maximum-likelihood fit in fit.py
+
+Ground-truth parameter sets are drawn at random, a population of agents with those parameters makes
+choices in the simulated environment, and the agents' parameters are then fitted back from their
+choices. Sets are simulated and fitted in batches of agents, across a pool of processes. The fit of
+every parameter set is cached on disk, keyed by the set and the study settings, such that a study
+can be extended or resumed without re-fitting sets that were already recovered.
+"""
+
+from __future__ import division
+
+import os
+import csv
+import json
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+from model import BatchedCoherencyAgent
+from policy import SoftmaxPolicy
+from sampler import ChoiceSetSampler
+from fit import PARAMETERS, fit_choice_sequences
+from simulate import SEED, CONFIG, simulate_blobs
+from sweep import run_seed
+
+# ranges from which the ground-truth parameters are drawn, log-uniformly
+RECOVERY_BOUNDS = {
+    'c': (0.5, 20.),
+    'p_eta': (1e-3, 1.),
+    'w_eta': (1e-3, 1.),
+}
+
+
+def draw_ground_truth(n_sets, n_attributes, bounds=RECOVERY_BOUNDS, random_state=None):
+    """
+    Draw ground-truth parameter sets. c, p_eta and w_eta are drawn log-uniformly within bounds, the
+    initial preferences uniformly within the space and the initial attention weights uniformly on the simplex.
+
+    # Parameters
+    n_sets (int): Number of parameter sets to draw
+    n_attributes (int): How many attributes belong to each choice?
+    bounds (dict): (lower, upper) bounds of c, p_eta and w_eta
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+    # Returns
+    Dictionary of parameter arrays, with one row per set
+    """
+
+    rng = np.random if random_state is None else random_state
+
+    truth = dict()
+    for name in PARAMETERS:
+        low, high = np.log(bounds[name])
+        truth[name] = np.exp(rng.uniform(low, high, size=n_sets))
+
+    truth['p_init'] = rng.rand(n_sets, n_attributes)
+    truth['w_init'] = rng.dirichlet(np.ones(n_attributes), size=n_sets)
+
+    return truth
+
+
+def parameter_key(truth, i, settings):
+    """Create a string uniquely identifying the i-th parameter set of truth within a study with the given settings"""
+
+    spec = dict((name, np.asarray(values[i]).tolist()) for name, values in truth.items())
+    spec['settings'] = settings
+
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def simulate_sequences(sampler, truth, n_trials, seeds):
+    """
+    Simulate the choices of a population of agents with the given parameters. Every agent draws
+    from its own random stream, such that its choices do not depend on the rest of the population.
+
+    # Parameters
+    sampler (ChoiceSetSampler): Sampler of the choice sets
+    truth (dict): Parameter arrays with one row per agent (see draw_ground_truth)
+    n_trials (int): Number of choices each agent makes
+    seeds (list): Seed of every agent's random stream
+
+    # Returns
+    Observations of shape (n_agents, n_trials, n_attributes, n_items) and actions of shape (n_agents, n_trials)
+    """
+
+    n_agents, n_attributes = truth['p_init'].shape
+    policy = SoftmaxPolicy()
+
+    uniforms = np.stack([np.random.RandomState(seed).rand(n_trials, sampler.n_uniforms + policy.n_uniforms)
+                         for seed in seeds], axis=1)
+
+    observations = sampler.from_uniforms(uniforms[..., :sampler.n_uniforms])
+
+    agent = BatchedCoherencyAgent(n_agents, sampler.n_items, n_attributes,
+                                  c=truth['c'], p_eta=truth['p_eta'], w_eta=truth['w_eta'],
+                                  learn_prefs=True, learn_weights=True,
+                                  p_init=truth['p_init'], w_init=truth['w_init'])
+
+    actions = np.zeros((n_agents, n_trials), dtype=int)
+    for t in range(n_trials):
+        actions[:, t] = agent.step(observations[t], policy, uniforms=uniforms[t, :, sampler.n_uniforms:])
+
+    return np.swapaxes(observations, 0, 1), actions
+
+
+def recover_batch(task):
+    """
+    Simulate and refit a batch of parameter sets. task is a (sampler, truth, seeds, n_trials, fit_kwargs) tuple
+
+    # Returns
+    Dictionary of the fitted parameters and log-likelihood of every set (see fit.fit_choice_sequences)
+    """
+
+    sampler, truth, seeds, n_trials, fit_kwargs = task
+
+    observations, actions = simulate_sequences(sampler, truth, n_trials, seeds)
+
+    # the same candidates are screened in every batch, so that a set's fit does not depend on its batch
+    return fit_choice_sequences(observations, actions, p_init=truth['p_init'], w_init=truth['w_init'],
+                                n_jobs=1, random_state=np.random.RandomState(SEED), **fit_kwargs)
+
+
+def summarise_recovery(truth, fitted):
+    """
+    Summarise how well each parameter was recovered. Errors are measured on the log scale, as the
+    parameters span orders of magnitude.
+
+    # Returns
+    Dictionary with the bias, variance and root mean squared error of the log-error of every parameter,
+    and the correlation between the true and fitted log-parameters
+    """
+
+    summary = dict()
+
+    for name in PARAMETERS:
+        error = np.log(fitted[name]) - np.log(truth[name])
+
+        summary[name] = {
+            'bias': error.mean(),
+            'variance': error.var(),
+            'rmse': np.sqrt(np.square(error).mean()),
+            'correlation': np.corrcoef(np.log(truth[name]), np.log(fitted[name]))[0, 1],
+        }
+
+    return summary
+
+
+def _cache_path(cache_dir, key):
+    """Location of the cached fit of the parameter set with the given key"""
+
+    return os.path.join(cache_dir, key + '.npz')
+
+
+def _save_cached(path, arrays):
+    """Write a cached fit via a temporary file, such that an interruption never leaves a corrupt entry"""
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+
+    os.rename(tmp_path, path)
+
+
+def run_recovery(n_sets, save_path, config=CONFIG, n_trials=200, batch_size=250, n_jobs=1, seed=SEED,
+                 bounds=RECOVERY_BOUNDS, fit_kwargs=None):
+    """
+    Run a parameter recovery study in the environment described by config
+
+    # Parameters
+    n_sets (int): Number of ground-truth parameter sets (i.e. synthetic agents)
+    save_path (str): Directory to cache the fits in and to write recovery_results.csv to
+    config (dict): Simulation config, as in CONFIG, describing the environment
+    n_trials (int): Number of choices each synthetic agent makes
+    batch_size (int): Number of agents simulated and fitted together by each task
+    n_jobs (int): Number of worker processes
+    seed (int): Seed from which the ground truth and every agent's random stream are derived
+    bounds (dict): Ranges of the ground-truth parameters (see draw_ground_truth)
+    fit_kwargs (dict): Optional keyword arguments of fit.fit_choice_sequences
+
+    # Returns
+    Summary of the recovery of every parameter (see summarise_recovery)
+    """
+
+    fit_kwargs = fit_kwargs or {}
+    cache_dir = os.path.join(save_path, 'recovery_cache')
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    X, y = simulate_blobs(config['cluster_centers'],
+                          n_samples=config['n_choices'],
+                          cluster_std=config['cluster_std'])
+    sampler = ChoiceSetSampler(X, y, n_items=config['n_items'])
+
+    truth = draw_ground_truth(n_sets, X.shape[1], bounds=bounds, random_state=np.random.RandomState(seed))
+
+    # a set's fit is only re-used within a study that simulates and fits it identically
+    settings = {'n_trials': n_trials, 'seed': seed, 'fit': fit_kwargs,
+                'environment': dict((key, config[key]) for key in ['cluster_centers', 'n_choices',
+                                                                   'cluster_std', 'n_items'])}
+    keys = [parameter_key(truth, i, settings) for i in range(n_sets)]
+
+    missing = np.array([i for i in range(n_sets) if not os.path.exists(_cache_path(cache_dir, keys[i]))], dtype=int)
+
+    tasks = list()
+    for start in range(0, len(missing), batch_size):
+        rows = missing[start:start + batch_size]
+        tasks.append((rows, (sampler, dict((name, values[rows]) for name, values in truth.items()),
+                             [run_seed(keys[i], seed) for i in rows], n_trials, fit_kwargs)))
+
+    if n_jobs == 1:
+        results = map(recover_batch, [task for _, task in tasks])
+    else:
+        pool = multiprocessing.Pool(n_jobs)
+        results = pool.imap(recover_batch, [task for _, task in tasks])
+
+    # cache every set as soon as its batch is done, so that an interrupted study can be resumed
+    for (rows, _), batch in zip(tasks, results):
+        for j, i in enumerate(rows):
+            _save_cached(_cache_path(cache_dir, keys[i]), dict((key, values[j]) for key, values in batch.items()))
+
+    if n_jobs != 1:
+        pool.close()
+        pool.join()
+
+    fitted = dict()
+    for i in range(n_sets):
+        with np.load(_cache_path(cache_dir, keys[i])) as cached:
+            for key in cached.files:
+                fitted.setdefault(key, []).append(cached[key])
+
+    fitted = dict((key, np.array(values)) for key, values in fitted.items())
+
+    with open(os.path.join(save_path, 'recovery_results.csv'), 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['key'] + ['true_' + name for name in PARAMETERS] + ['fitted_' + name for name in PARAMETERS]
+                        + ['log_likelihood'])
+
+        for i in range(n_sets):
+            writer.writerow([keys[i]] + [truth[name][i] for name in PARAMETERS]
+                            + [fitted[name][i] for name in PARAMETERS] + [fitted['log_likelihood'][i]])
+
+    return summarise_recovery(truth, fitted)
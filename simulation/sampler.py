@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Sampling of choice sets from clusters of options (i.e. choice types)
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+def random_cluster_centers(n_clusters, n_attributes, low=0.1, high=0.9, random_state=None):
+    """
+    Draw the centers of n_clusters choice types uniformly within an n_attributes dimensional space
+
+    # Parameters
+    n_clusters (int): Number of choice types
+    n_attributes (int): How many attributes belong to each choice?
+    low (float): Lower bound of the centers on every attribute
+    high (float): Upper bound of the centers on every attribute
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    """
+
+    rng = np.random if random_state is None else random_state
+
+    return rng.uniform(low, high, size=(n_clusters, n_attributes))
+
+
+def make_blobs(centers, n_samples=500, cluster_std=1.0, random_state=None):
+    """
+    Draw options from isotropic gaussian clusters, one cluster per center. Follows the same procedure
+    as scikit-learn's make_blobs (for given centers), without the cost of importing scikit-learn.
+
+    # Parameters
+    centers (list): One center per cluster, one value per attribute
+    n_samples (int): Number of options to draw, split as evenly as possible over the clusters
+    cluster_std (float): Standard deviation of the clusters
+    random_state (int or numpy.random.RandomState): Seed or random state to draw from. Defaults to the global state
+
+    # Returns
+    The options, of shape (n_samples, n_attributes), and the cluster of every option, in random order
+    """
+
+    if random_state is None:
+        rng = np.random
+    elif isinstance(random_state, np.random.RandomState):
+        rng = random_state
+    else:
+        rng = np.random.RandomState(random_state)
+
+    centers = np.asarray(centers, dtype=float)
+    n_centers, n_attributes = centers.shape
+
+    # the first n_samples % n_centers clusters get one extra option
+    counts = [n_samples // n_centers + (i < n_samples % n_centers) for i in range(n_centers)]
+
+    X = np.concatenate([centers[i] + rng.normal(scale=cluster_std, size=(count, n_attributes))
+                        for i, count in enumerate(counts)])
+    y = np.repeat(np.arange(n_centers), counts)
+
+    indices = np.arange(n_samples)
+    rng.shuffle(indices)
+
+    return X[indices], y[indices]
+
+
+class ChoiceSetSampler(object):
+    """
+    Draws choice sets of n_items options, each option belonging to one of the clusters in y.
+
+    The options of every cluster are gathered into a contiguous pool once, so that whole
+    choice sets (or batches of them) are drawn with a single fancy index. When there are at least
+    as many items as clusters, item i is drawn from cluster i % n_clusters. When there are fewer,
+    every choice set is drawn from n_items distinct clusters, chosen at random.
+
+    # Parameters
+    X (numpy.ndarray): A 2-dimensional matrix of options to select from
+    y (numpy.ndarray): A 1-dimensional vector of labels, describing the cluster of each option
+    n_items (int): How many options are in each choice set?
+    dtype (numpy.dtype): Floating point type of the choice sets
+    """
+    def __init__(self, X, y, n_items=2, dtype=float):
+        super(ChoiceSetSampler, self).__init__()
+        self.n_items = n_items
+        self.n_attributes = X.shape[1]
+        self.dtype = np.dtype(dtype)
+
+        self._build_pools(X, y)
+
+    def _build_pools(self, X, y):
+        """Sort the options by cluster and determine where the pool of every cluster starts"""
+
+        self.labels_, cluster = np.unique(y, return_inverse=True)
+        self.n_clusters = len(self.labels_)
+
+        order = np.argsort(cluster, kind='mergesort')
+        self.pool_ = X[order].astype(self.dtype)
+
+        self.counts_ = np.bincount(cluster, minlength=self.n_clusters)
+        self.offsets_ = np.concatenate([[0], np.cumsum(self.counts_)[:-1]])
+
+        self.random_clusters = self.n_items < self.n_clusters
+        self.slot_clusters_ = np.arange(self.n_items) % self.n_clusters
+
+    @property
+    def n_uniforms(self):
+        """Number of uniform numbers needed to draw a single choice set"""
+
+        if self.random_clusters:
+            return self.n_items + self.n_clusters
+
+        return self.n_items
+
+    def draw_options(self, uniforms):
+        """
+        Turn uniform numbers into the options of choice sets
+
+        # Parameters
+        uniforms (numpy.ndarray): Uniform numbers of shape (..., n_uniforms)
+
+        # Returns
+        The cluster of every item (broadcastable to (..., n_items)) and the row of every item in pool_
+        """
+
+        if self.random_clusters:
+            # a random permutation of the clusters, of which the first n_items are used
+            clusters = np.argsort(uniforms[..., self.n_items:], axis=-1)[..., :self.n_items]
+        else:
+            clusters = self.slot_clusters_
+
+        counts = self.counts_[clusters]
+        within = np.minimum((uniforms[..., :self.n_items] * counts).astype(int), counts - 1)
+
+        return clusters, self.offsets_[clusters] + within
+
+    def from_uniforms(self, uniforms):
+        """
+        Turn uniform numbers into choice sets
+
+        # Parameters
+        uniforms (numpy.ndarray): Uniform numbers of shape (..., n_uniforms)
+
+        # Returns
+        Choice sets of shape (..., n_attributes, n_items)
+        """
+
+        _, rows = self.draw_options(uniforms)
+
+        return np.swapaxes(self.pool_[rows], -1, -2)
+
+    def sample(self, n_sets=None, random_state=None):
+        """
+        Draw choice sets
+
+        # Parameters
+        n_sets (int): Number of choice sets to draw, or None to draw a single choice set
+        random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+
+        # Returns
+        A choice set of shape (n_attributes, n_items), or (n_sets, n_attributes, n_items)
+        """
+
+        rng = np.random if random_state is None else random_state
+        shape = () if n_sets is None else (n_sets,)
+
+        return self.from_uniforms(rng.rand(*(shape + (self.n_uniforms,))))
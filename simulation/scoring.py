@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Scoring of large numbers of choice sets with a trained agent
+
+The choice probabilities of an agent are computed for a whole array (or memory-mapped .npy file) of
+choice sets, one chunk at a time, such that only a few chunks are ever held in memory. The agent's
+preference and attention weights are copied once and only read, so scoring neither changes the agent
+nor the activations it caches for learning, and chunks can be scored on several threads at once.
+"""
+
+from __future__ import division
+
+import collections
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from model import similarity, softmax
+
+# bytes of working memory of the chunks being scored, if neither chunk_size nor max_memory are given
+MAX_MEMORY = 2 ** 26
+
+
+def _chunk_size(n_attributes, n_items, max_memory=MAX_MEMORY):
+    """Number of choice sets whose scoring fits into max_memory bytes"""
+
+    # the choice sets, distances and squared distances, plus the double precision softmax of every item
+    per_set = 3 * n_attributes * n_items * 8 + 6 * n_items * 8
+
+    return max(1, int(max_memory // per_set))
+
+
+def _open(choice_sets):
+    """Open a .npy file of choice sets as a read-only memory map, or pass an array through"""
+
+    if isinstance(choice_sets, str):
+        return np.load(choice_sets, mmap_mode='r')
+
+    return choice_sets
+
+
+def _score_chunk(choice_sets, start, stop, preference, attention_weights, c, dtype):
+    """Score choice sets start to stop (see CoherencyMaximisingAgent.feed_forward)"""
+
+    X = np.asarray(choice_sets[start:stop], dtype=dtype)
+    activation = similarity(X, preference, attention_weights, c)[2]
+
+    return start, softmax(activation[:, 0], axis=-1)
+
+
+def iter_scores(agent, choice_sets, chunk_size=None, max_memory=MAX_MEMORY, n_jobs=1):
+    """
+    Score choice sets chunk by chunk, yielding the choice probabilities of every chunk in order
+
+    # Parameters
+    agent (CoherencyMaximisingAgent): The agent whose choice probabilities are computed. It is not modified
+    choice_sets (numpy.ndarray or str): Choice sets of shape (n_sets, n_attributes, n_items), or the location
+                                        of a .npy file holding them, which is memory-mapped
+    chunk_size (int): Number of choice sets per chunk. Defaults to as many as fit into max_memory
+    max_memory (int): Bytes of working memory of all chunks being scored at once, if chunk_size is not given
+    n_jobs (int): Number of threads scoring chunks at once. At most 2 * n_jobs chunks are held in memory
+
+    # Returns
+    Generator of (start, probabilities) pairs, in which probabilities of shape (chunk_size, n_items)
+    belong to the choice sets from start onwards
+    """
+
+    choice_sets = _open(choice_sets)
+    n_sets, n_attributes, n_items = choice_sets.shape
+
+    # threads work on one chunk each, whilst as many chunks again wait to be yielded
+    in_flight = 1 if n_jobs == 1 else 2 * n_jobs
+
+    if chunk_size is None:
+        chunk_size = _chunk_size(n_attributes, n_items, max_memory=max_memory // in_flight)
+
+    # a read-only copy of the agent's state, shared by all chunks
+    state = [np.array(agent.preference_, dtype=agent.dtype), np.array(agent.attention_weights_, dtype=agent.dtype),
+             agent.c, agent.dtype]
+    for array in state[:2]:
+        array.setflags(write=False)
+
+    starts = range(0, n_sets, chunk_size)
+
+    if n_jobs == 1:
+        for start in starts:
+            yield _score_chunk(choice_sets, start, start + chunk_size, *state)
+
+        return
+
+    pool = ThreadPool(n_jobs)
+
+    try:
+        # keep a bounded number of chunks in flight, yielding them in order as they finish
+        pending = collections.deque()
+
+        for start in starts:
+            pending.append(pool.apply_async(_score_chunk, (choice_sets, start, start + chunk_size) + tuple(state)))
+
+            if len(pending) >= in_flight:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def score_choice_sets(agent, choice_sets, out=None, chunk_size=None, max_memory=MAX_MEMORY, n_jobs=1):
+    """
+    Compute the choice probabilities of an agent for every one of a large number of choice sets
+
+    # Parameters
+    agent (CoherencyMaximisingAgent): The agent whose choice probabilities are computed. It is not modified
+    choice_sets (numpy.ndarray or str): Choice sets of shape (n_sets, n_attributes, n_items), or the location
+                                        of a .npy file holding them, which is memory-mapped
+    out (numpy.ndarray or str): Array of shape (n_sets, n_items) to write the probabilities into, or the
+                                location of a .npy file to write them to. Defaults to a new array
+    chunk_size (int): Number of choice sets per chunk. Defaults to as many as fit into max_memory
+    max_memory (int): Bytes of working memory of all chunks being scored at once, if chunk_size is not given
+    n_jobs (int): Number of threads scoring chunks at once
+
+    # Returns
+    The choice probabilities of shape (n_sets, n_items), as a memory map if out is a location
+    """
+
+    choice_sets = _open(choice_sets)
+    shape = (len(choice_sets), choice_sets.shape[2])
+
+    if out is None:
+        out = np.empty(shape, dtype=agent.dtype)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=agent.dtype, shape=shape)
+
+    for start, probs in iter_scores(agent, choice_sets, chunk_size=chunk_size, max_memory=max_memory, n_jobs=n_jobs):
+        out[start:start + len(probs)] = probs
+
+    if isinstance(out, np.memmap):
+        out.flush()
+
+    return out
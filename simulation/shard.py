@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Sharded execution of sweeps across any number of processes and hosts, through a shared directory
+
+A sweep is split into shards, described by a manifest in the shard directory. Every shard starts
+as a file in pending/. A worker claims a shard by renaming that file into claimed/, which only one
+worker can do, and keeps the claim alive by touching it while the shard runs. The summaries of a
+shard's runs are written to a CSV in done/ via a temporary file, such that a shard is either done
+or not. A claim that has not been touched for longer than the lease (e.g. because its worker
+crashed) is moved back to pending/ by any other worker, which removes any partial results of the
+shard from done/. Finally, the shards are merged into the results CSV of the whole sweep.
+
+usage:
+    python shard.py plan sweep.json /shared/dir [--n-shards N]
+    python shard.py work /shared/dir [--n-workers N]
+    python shard.py status /shared/dir
+    python shard.py merge /shared/dir results.csv
+"""
+
+from __future__ import division, print_function
+
+import os
+import csv
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+
+from simulate import SEED, CONFIG
+from sweep import RESULT_COLUMNS, load_sweep, create_task, run_single
+
+# seconds after which an untouched claim counts as abandoned, and between touches of a live claim
+LEASE = 600.
+HEARTBEAT = 30.
+
+
+def _paths(shard_dir):
+    return {'manifest': os.path.join(shard_dir, 'manifest.json'),
+            'pending': os.path.join(shard_dir, 'pending'),
+            'claimed': os.path.join(shard_dir, 'claimed'),
+            'done': os.path.join(shard_dir, 'done')}
+
+
+def _shard_name(shard):
+    return 'shard_{0:05d}'.format(shard)
+
+
+def plan_shards(overrides, shard_dir, n_shards=None, shard_size=None, base_config=CONFIG, seed=SEED):
+    """
+    Split a sweep into shards, writing the manifest and a pending file per shard
+
+    # Parameters
+    overrides (list): List of dictionaries, each overriding keys of base_config for one run
+    shard_dir (str): Shared directory to keep the manifest, claims and results of the shards in
+    n_shards (int): Number of shards to split the runs over
+    shard_size (int): Number of runs per shard, if n_shards is not given. Defaults to one run per shard
+    base_config (dict): Config that the overrides are applied to
+    seed (int): Seed from which each run's random stream is derived
+
+    # Returns
+    The number of shards
+    """
+
+    paths = _paths(shard_dir)
+
+    if os.path.exists(paths['manifest']):
+        raise ValueError('{0:s} already holds a sweep'.format(shard_dir))
+
+    if n_shards is None:
+        n_shards = int(-(-len(overrides) // (shard_size or 1)))
+
+    n_shards = max(1, min(n_shards, len(overrides)))
+
+    # spread the runs evenly, with neighbouring runs in the same shard
+    bounds = [len(overrides) * i // n_shards for i in range(n_shards + 1)]
+    shards = [overrides[bounds[i]:bounds[i + 1]] for i in range(n_shards)]
+
+    for key in ['pending', 'claimed', 'done']:
+        if not os.path.exists(paths[key]):
+            os.makedirs(paths[key])
+
+    # write the manifest last, via a temporary file, so that workers never see half a sweep
+    for shard in range(n_shards):
+        open(os.path.join(paths['pending'], _shard_name(shard)), 'w').close()
+
+    tmp_path = paths['manifest'] + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'base_config': base_config, 'seed': seed, 'shards': shards}, f)
+
+    os.rename(tmp_path, paths['manifest'])
+
+    return n_shards
+
+
+def load_manifest(shard_dir):
+    """Load the manifest of a sharded sweep"""
+
+    with open(_paths(shard_dir)['manifest'], 'r') as f:
+        return json.load(f)
+
+
+def _listdir(path):
+    return sorted(name for name in os.listdir(path) if not name.startswith('.'))
+
+
+def _tmp_path(shard_dir, shard):
+    return os.path.join(_paths(shard_dir)['done'], '.{0:s}.{1:d}.tmp'.format(_shard_name(shard), os.getpid()))
+
+
+def _remove_partial(shard_dir, shard):
+    """Remove the partly written results of a shard, left behind by workers that crashed before finishing it"""
+
+    done = _paths(shard_dir)['done']
+    prefix = '.{0:s}.'.format(_shard_name(shard))
+
+    for name in os.listdir(done):
+        if name.startswith(prefix) and name.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(done, name))
+            except OSError:
+                pass
+
+
+def reclaim_stale(shard_dir, lease=LEASE):
+    """
+    Move claims that have not been touched for longer than lease back to pending
+
+    # Returns
+    The shards that were reclaimed
+    """
+
+    paths = _paths(shard_dir)
+    now = time.time()
+    reclaimed = list()
+
+    for name in _listdir(paths['claimed']):
+        claim = os.path.join(paths['claimed'], name)
+        shard = name.split('@')[0]
+
+        try:
+            if now - os.path.getmtime(claim) <= lease:
+                continue
+
+            # only one worker manages to move the claim
+            os.rename(claim, os.path.join(paths['pending'], shard))
+        except OSError:
+            continue
+
+        reclaimed.append(int(shard.split('_')[1]))
+        _remove_partial(shard_dir, reclaimed[-1])
+
+    return reclaimed
+
+
+def claim_shard(shard_dir, worker_id):
+    """
+    Claim a pending shard
+
+    # Returns
+    The index of the shard and the path of its claim, or (None, None) if no shard is pending
+    """
+
+    paths = _paths(shard_dir)
+
+    for name in _listdir(paths['pending']):
+        pending = os.path.join(paths['pending'], name)
+        claim = os.path.join(paths['claimed'], '{0:s}@{1:s}'.format(name, worker_id))
+
+        try:
+            # touch the file first, so that the claim does not look stale before the first heartbeat
+            os.utime(pending, None)
+            os.rename(pending, claim)
+        except OSError:
+            # another worker got there first
+            continue
+
+        return int(name.split('_')[1]), claim
+
+    return None, None
+
+
+class Heartbeat(object):
+    """
+    Keeps a claim alive by touching it every interval seconds, on a background thread
+
+    # Parameters
+    claim (str): Path of the claim
+    interval (float): Seconds between touches
+    """
+    def __init__(self, claim, interval=HEARTBEAT):
+        self.claim = claim
+        self.interval = interval
+        self.lost_ = False
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat)
+        self._thread.daemon = True
+
+    def _beat(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.claim, None)
+            except OSError:
+                # the claim was reclaimed by another worker, whose results will be the same
+                self.lost_ = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_shard(shard_dir, shard, manifest):
+    """
+    Run every simulation of a shard and write their summaries to the shard's CSV in done/
+
+    # Returns
+    Whether the summaries were written, rather than discarded because the shard was reclaimed meanwhile
+    """
+
+    path = os.path.join(_paths(shard_dir)['done'], _shard_name(shard) + '.csv')
+    tmp_path = _tmp_path(shard_dir, shard)
+
+    with open(tmp_path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+
+        for override in manifest['shards'][shard]:
+            row, _ = run_single(create_task(override, manifest['base_config'], manifest['seed']))
+            writer.writerow(row)
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # the shard was reclaimed and its partial results removed, so the worker that took it over writes them
+        if os.path.exists(tmp_path):
+            raise
+
+        return False
+
+    return True
+
+
+def run_worker(shard_dir, worker_id=None, lease=LEASE, heartbeat=HEARTBEAT, wait=True, poll=None):
+    """
+    Claim and run shards until every shard is done
+
+    # Parameters
+    shard_dir (str): Shared directory of the sweep (see plan_shards)
+    worker_id (str): Name of the worker in its claims. Defaults to the host name and process id
+    lease (float): Seconds after which an untouched claim counts as abandoned
+    heartbeat (float): Seconds between touches of the worker's own claim
+    wait (bool): Whether to wait for the shards claimed by other workers (and take them over if those workers die)
+    poll (float): Seconds between checks while waiting. Defaults to the heartbeat
+
+    # Returns
+    The shards that this worker ran
+    """
+
+    worker_id = worker_id or '{0:s}-{1:d}'.format(socket.gethostname(), os.getpid())
+    manifest = load_manifest(shard_dir)
+    paths = _paths(shard_dir)
+
+    completed = list()
+
+    while True:
+        shard, claim = claim_shard(shard_dir, worker_id)
+
+        if shard is None:
+            if reclaim_stale(shard_dir, lease=lease):
+                continue
+
+            if not wait or not _listdir(paths['claimed']):
+                break
+
+            time.sleep(heartbeat if poll is None else poll)
+            continue
+
+        # a worker that lost its claim may have finished the shard after all
+        if not os.path.exists(os.path.join(paths['done'], _shard_name(shard) + '.csv')):
+            with Heartbeat(claim, interval=heartbeat):
+                written = run_shard(shard_dir, shard, manifest)
+
+            if written:
+                completed.append(shard)
+
+        try:
+            os.remove(claim)
+        except OSError:
+            pass
+
+    return completed
+
+
+def shard_status(shard_dir):
+    """
+    Count the pending, claimed and done shards
+
+    # Returns
+    Dictionary with the number of shards in each state, and the age in seconds of every claim
+    """
+
+    paths = _paths(shard_dir)
+    now = time.time()
+
+    claims = dict()
+    for name in _listdir(paths['claimed']):
+        try:
+            claims[name] = now - os.path.getmtime(os.path.join(paths['claimed'], name))
+        except OSError:
+            pass
+
+    return {'shards': len(load_manifest(shard_dir)['shards']),
+            'pending': len(_listdir(paths['pending'])),
+            'claimed': len(claims),
+            'done': len([name for name in _listdir(paths['done']) if name.endswith('.csv')]),
+            'claim_ages': claims}
+
+
+def merge_shards(shard_dir, results_path):
+    """
+    Merge the CSVs of the done shards into the results CSV of the sweep, in the order of the manifest
+
+    # Returns
+    The shards that are not done yet, whose runs are missing from the results
+    """
+
+    n_shards = len(load_manifest(shard_dir)['shards'])
+    done = _paths(shard_dir)['done']
+    missing = list()
+
+    with open(results_path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+
+        for shard in range(n_shards):
+            path = os.path.join(done, _shard_name(shard) + '.csv')
+
+            if not os.path.exists(path):
+                missing.append(shard)
+                continue
+
+            with open(path, 'r') as shard_file:
+                for row in csv.DictReader(shard_file):
+                    writer.writerow(row)
+
+    return missing
+
+
+def _work(args):
+    """Entry point of a local worker process"""
+
+    shard_dir, lease, heartbeat = args
+
+    return run_worker(shard_dir, lease=lease, heartbeat=heartbeat)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run a sweep in shards, across processes and hosts')
+    commands = parser.add_subparsers(dest='command')
+
+    plan = commands.add_parser('plan', help='Split a sweep into shards')
+    plan.add_argument('sweep', type=str, help='JSON file containing a grid or list of CONFIG overrides')
+    plan.add_argument('shard_dir', type=str, help='Shared directory to keep the shards in')
+    plan.add_argument('--n-shards', type=int, default=None, help='Number of shards (default: one per run)')
+
+    work = commands.add_parser('work', help='Claim and run shards until all are done')
+    work.add_argument('shard_dir', type=str)
+    work.add_argument('--n-workers', type=int, default=1, help='Number of worker processes to start on this host')
+    work.add_argument('--lease', type=float, default=LEASE, help='Seconds after which an untouched claim is reclaimed')
+    work.add_argument('--heartbeat', type=float, default=HEARTBEAT, help='Seconds between touches of a claim')
+
+    status = commands.add_parser('status', help='Count the pending, claimed and done shards')
+    status.add_argument('shard_dir', type=str)
+
+    merge = commands.add_parser('merge', help='Merge the done shards into a single results CSV')
+    merge.add_argument('shard_dir', type=str)
+    merge.add_argument('results', type=str, help='Location of the merged CSV')
+
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        print('{0:d} shards'.format(plan_shards(load_sweep(args.sweep), args.shard_dir, n_shards=args.n_shards)))
+
+    elif args.command == 'work':
+        task = (args.shard_dir, args.lease, args.heartbeat)
+
+        if args.n_workers == 1:
+            completed = _work(task)
+        else:
+            pool = multiprocessing.Pool(args.n_workers)
+            completed = sum(pool.map(_work, [task] * args.n_workers), [])
+            pool.close()
+            pool.join()
+
+        print('ran {0:d} shards'.format(len(completed)))
+
+    elif args.command == 'status':
+        counts = shard_status(args.shard_dir)
+        print('{shards:d} shards: {pending:d} pending, {claimed:d} claimed, {done:d} done'.format(**counts))
+
+        for name, age in sorted(counts['claim_ages'].items()):
+            print('  {0:s} last touched {1:.0f}s ago'.format(name, age))
+
+    elif args.command == 'merge':
+        missing = merge_shards(args.shard_dir, args.results)
+
+        if missing:
+            print('{0:d} shards are not done yet: {1:s}'.format(len(missing), ', '.join(map(str, missing))))
+            sys.exit(1)
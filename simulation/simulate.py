@@ -6,16 +6,27 @@
 Perform a simulation in which the Coherency Maximizing agent chooses between
 two choice types (1 and 2). These two choose types should be distinct on one attribute
 but the same on another.
+
+More generally, choice sets of n_items options can be drawn from any number of choice types
+within any number of attributes (see sampler.py).
 """
 
 SEED = 30
 import random
+import warnings
 import numpy as np
-from sklearn.datasets.samples_generator import make_blobs
 
 # own libraries
 from model import CoherencyMaximisingAgent
-from plot import plot_simulation_history
+from policy import create_policy
+from record import TrajectoryRecorder, ActionLog
+from stream import StreamingRecorder
+from sampler import ChoiceSetSampler, make_blobs
+from environment import ClusterEnvironment, DriftingClusterEnvironment
+from convergence import ConvergenceMonitor
+from checkpoint import Checkpointer
+from random_plan import RandomPlan
+from kernels import HAS_NUMBA, simulate_choices_jit
 
 np.random.seed(SEED)
 random.seed(SEED)
@@ -29,15 +40,29 @@ CONFIG = {
     'lr': 0.01,  # the learning rate
     'c': 1,  # lambda value (i.e., "fussiness" parameter)
     'epsilon_greedy': True,  # use epsilon greedy selection or softmax selection?
+    'epsilon': 0.05,  # probability of taking an exploratory action, if epsilon_greedy=True
 
     # simulation
-    'cluster_centers': [[0.2, 0.2], [0.2, 0.8]],
+    'cluster_centers': [[0.2, 0.2], [0.2, 0.8]],  # one center per choice type, one value per attribute
+    'n_items': 2,  # how many options are in each choice set
     'n_choices': 500,
     'cluster_std': 0.05,  # std of the clusters
+    'cluster_drift': None,  # distance each center moves per timestep, one list per center (None = fixed clusters)
     'n_timesteps': 10000,
+    'record_every': 1,  # keep the preferences and attention weights of every k-th timestep
+    'record_final_only': False,  # only keep the final preferences and attention weights
+    'record_actions': False,  # log the action taken at every timestep to actions.npy in save_path (see analytics.py)
+    'stream_trajectory': False,  # stream the kept history to memory-mapped files in save_path, rather than keeping it in memory
+    'backend': 'numpy',  # run the simulation loop with 'numpy' or as a compiled 'numba' kernel
+    'convergence_window': None,  # stop once the agent settles for a window of this many timesteps (None = never stop)
+    'convergence_tol': 1e-3,  # largest drift of preferences and attention within a window for the agent to have settled
+    'checkpoint_every': None,  # save a checkpoint of the run every this many timesteps (None = never)
+    'resume': False,  # resume the run from the last checkpoint, if there is one
+    'dtype': 'float64',  # floating point type of the agent and its history ('float32' halves their memory)
 
     # outputs
     'save_path': './figures/',
+    'plot_max_points': 5000,  # most preference points to render, longer histories are decimated (None = render all)
 }
 
 
@@ -52,8 +77,8 @@ def simulate_blobs(centers, n_samples=500, cluster_std=1.5, random_state=32):
 
     """
 
-    X, y = make_blobs(n_samples=n_samples,
-                      centers=centers,
+    X, y = make_blobs(centers,
+                      n_samples=n_samples,
                       cluster_std=cluster_std,
                       random_state=random_state)
 
@@ -63,114 +88,319 @@ def simulate_blobs(centers, n_samples=500, cluster_std=1.5, random_state=32):
     return X, y
 
 
-def update_agent(mod, action, observation):
+def simulate_choices(X, y, model, n_choices, epsilon=0.05, epsilon_greedy=True, random_state=None,
+                     recorder=None, sampler=None, backend='numpy', monitor=None, checkpointer=None, resume=False,
+                     profiler=None, environment=None, action_log=None):
     """
-    Determine gradient of choice
+    Simulate the model for n_choices, taking an softmax exploration strategy
 
     # Parameters
-    mod (CoherencyMaximisingAgent): Model agent object
-    action (int): Either 1 or 0 depending on choice type made
-    observation (numpy.ndarray): Two dimensional matrix describing the attributes of the two choices
+    X (numpy.ndarray): Numpy multidimensional containing all possible observations
+    y (numpy.ndarray): Vector describing the choice type (1 or 2) of observations
+    model (CoherencyMaximisingAgent): Model agent
+    n_choices (int): Number of choices by which to simulate
+    epsilon (float): Probability of taking an exploratory action, if epsilon_greedy=True
+    epsilon_greedy (bool): Whether to use epsilon greedy exploration or softmax exploration
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    recorder (TrajectoryRecorder): Recorder of the preference and attention history. Defaults to recording every step
+    sampler (ChoiceSetSampler): Sampler of the choice sets. Defaults to drawing model.n_items options from X
+    backend (str): Run the loop with 'numpy', or as a compiled kernel with 'numba' (if it is installed)
+    monitor (ConvergenceMonitor): Optional monitor, stopping the simulation once the agent has converged
+    checkpointer (Checkpointer): Optional checkpointer, periodically saving the state of the run
+    resume (bool): Whether to resume the run from the checkpointer's checkpoint, if there is one
+    profiler (PhaseProfiler): Optional profiler, timing every phase of the simulation loop
+    environment (ChoiceEnvironment): Environment generating the choice sets. Defaults to a ClusterEnvironment of the sampler
+    action_log (ActionLog): Optional log of the action taken on every step
     """
 
-    mod.update_agent(observation, action)
+    rng = np.random if random_state is None else random_state
 
-    # extract the current preference and attention weights, for plotting
-    pref = mod.h0.preference_
-    attention = mod.h0.attention_weights_
+    if recorder is None:
+        recorder = TrajectoryRecorder(n_choices, model.n_attributes, dtype=model.dtype)
 
-    return pref, attention
+    if environment is None:
+        if sampler is None:
+            sampler = ChoiceSetSampler(X, y, n_items=model.n_items, dtype=model.dtype)
 
+        environment = ClusterEnvironment(sampler)
 
-def create_random_observation(choice_ones, choice_twos, n):
-    """
-    Randomly select n of choice_ones and n of choice_twos and then row concatenate
-    """
+    policy = create_policy(epsilon_greedy=epsilon_greedy, epsilon=epsilon, random_state=rng)
+
+    # pick up an interrupted run where it stopped
+    start = 0
+    if resume and checkpointer is not None and checkpointer.exists():
+        start = checkpointer.restore(model, rng, recorder, monitor, action_log=action_log)
+
+    if profiler is not None:
+        profiler.begin(n_choices, start=start)
+
+    if backend == 'numba':
+        # the compiled kernel draws the choice sets itself, so it only supports fixed clusters
+        if type(environment) is not ClusterEnvironment:
+            warnings.warn('the numba backend only supports a ClusterEnvironment, falling back to the numpy backend')
+        elif HAS_NUMBA:
+            history = simulate_choices_jit(environment.sampler, model, n_choices, policy, recorder, random_state=rng,
+                                           monitor=monitor, checkpointer=checkpointer, start=start,
+                                           profiler=profiler, action_log=action_log)
+
+            if profiler is not None:
+                profiler.end()
+
+            return history
+        else:
+            warnings.warn('numba is not installed, falling back to the numpy backend')
+
+    # draw the random numbers of the environment and policy in blocks
+    plan = RandomPlan(rng, [environment.n_uniforms, policy.n_uniforms])
+
+    # now make n_choices according to a e-greedy strategy
+    for t, (environment_uniforms, policy_uniforms) in plan.iterate(n_choices, start=start):
+
+        # receive the next choice set, given the last choice
+        if t == start:
+            observation = environment.reset(environment_uniforms, t=start)
+        else:
+            observation = environment.step(action, environment_uniforms)
+
+        if profiler is not None:
+            profiler.lap('observation')
+
+        # choose between the items and update the agent given the choice
+        action = model.step(observation, policy, uniforms=policy_uniforms, profiler=profiler)
+
+        if action_log is not None:
+            action_log.record(t, action)
+
+        # update preference history
+        recorder.record(t, model.preference_, model.attention_weights_)
+
+        if profiler is not None:
+            profiler.lap('record')
 
-    choice_one = choice_ones[np.random.choice(choice_ones.shape[0], n), :]
-    choice_two = choice_twos[np.random.choice(choice_twos.shape[0], n), :]
+        # stop once the agent has settled into a coherent preference
+        if monitor is not None:
+            converged = monitor.update(t, model.preference_, model.attention_weights_)
 
-    return np.vstack([choice_one, choice_two])
+            if profiler is not None:
+                profiler.lap('monitor')
 
+            if converged:
+                recorder.finalise(t, model.preference_, model.attention_weights_)
+                break
 
-def simulate_choices(X, y, model, n_choices, epsilon=0.05, epsilon_greedy=True):
+        if checkpointer is not None and checkpointer.due(t, t + 1):
+            checkpointer.save(t + 1, model, plan.get_state(t + 1), recorder, monitor, action_log=action_log)
+
+            if profiler is not None:
+                profiler.lap('checkpoint')
+
+        if profiler is not None:
+            profiler.end_step(t)
+
+    if profiler is not None:
+        profiler.end()
+
+    return recorder.history()
+
+
+def simulate_population_choices(X, y, model, n_choices, epsilon=0.05, epsilon_greedy=True, random_state=None,
+                                recorder=None, sampler=None, monitor=None, profiler=None, environment=None,
+                                action_log=None):
     """
-    Simulate the model for n_choices, taking an softmax exploration strategy
+    Simulate a population of agents in lockstep for n_choices
 
     # Parameters
     X (numpy.ndarray): Numpy multidimensional containing all possible observations
     y (numpy.ndarray): Vector describing the choice type (1 or 2) of observations
-    model (CoherencyMaximisingAgent): Model agent
+    model (BatchedCoherencyAgent): Population of model agents
     n_choices (int): Number of choices by which to simulate
     epsilon (float): Probability of taking an exploratory action, if epsilon_greedy=True
     epsilon_greedy (bool): Whether to use epsilon greedy exploration or softmax exploration
+    random_state (numpy.random.RandomState): Random state to draw from. Defaults to the global state
+    recorder (TrajectoryRecorder): Recorder of the preference and attention history. Defaults to recording every step
+    sampler (ChoiceSetSampler): Sampler of the choice sets. Defaults to drawing model.n_items options from X
+    monitor (ConvergenceMonitor): Optional monitor. Converged agents are frozen and the simulation stops once all have converged
+    profiler (PhaseProfiler): Optional profiler, timing every phase of the simulation loop
+    environment (ChoiceEnvironment): Environment generating the choice sets of all agents. Defaults to a
+                                     ClusterEnvironment of the sampler
+    action_log (ActionLog): Optional log of the action taken by every agent on every step
+
+    # Returns
+    Preference and attention histories, each of shape (n_recorded, n_agents, n_attributes)
     """
 
-    pref_hist = list()
-    attention_hist = list()
+    if recorder is None:
+        recorder = TrajectoryRecorder(n_choices, model.n_attributes, n_agents=model.n_agents, dtype=model.dtype)
 
-    # now make n_choices according to a e-greedy strategy
-    for _ in range(n_choices):
+    if environment is None:
+        if sampler is None:
+            sampler = ChoiceSetSampler(X, y, n_items=model.n_items, dtype=model.dtype)
 
-        # select a random two products from choice type 1 and 2
-        observation = create_random_observation(X[y == 0], X[y == 1], 1)
-        observation = observation.T  # transpose for model compatability
+        environment = ClusterEnvironment(sampler, n_agents=model.n_agents)
 
-        # determine the probability of making choice 1 or 2
-        probs = model.feed_forward(observation)
+    policy = create_policy(epsilon_greedy=epsilon_greedy, epsilon=epsilon, random_state=random_state)
 
-        if epsilon_greedy:
-            # use epsilon greedy exploration
-            rnd = np.random.rand()
+    # draw the random numbers of the environment and policy in blocks
+    plan = RandomPlan(random_state, [environment.n_uniforms, policy.n_uniforms], n_agents=model.n_agents)
+    active = None
 
-            if rnd < epsilon:
-                action = np.random.choice([0, 1])
-            else:
-                action = np.argmax(probs)
+    if profiler is not None:
+        profiler.begin(n_choices)
 
+    for t, (environment_uniforms, policy_uniforms) in plan.iterate(n_choices):
+
+        # receive the next choice set of each agent, given their last choices
+        if t == 0:
+            observation = environment.reset(environment_uniforms)
         else:
-            # use softmax exploration
-            action = np.random.choice([0, 1], p=probs)
+            observation = environment.step(actions, environment_uniforms)
+
+        if profiler is not None:
+            profiler.lap('observation')
+
+        # choose between the items and update the agents given their choices
+        actions = model.step(observation, policy, uniforms=policy_uniforms, active=active, profiler=profiler)
 
-        # update the agent given the choice
-        pref, attention = update_agent(model, action, observation)
+        if action_log is not None:
+            action_log.record(t, actions)
 
         # update preference history
-        pref_hist.append(pref)
-        attention_hist.append(attention)
+        recorder.record(t, model.preference_, model.attention_weights_)
 
-    return np.vstack(pref_hist), np.vstack(attention_hist)
+        if profiler is not None:
+            profiler.lap('record')
 
+        if monitor is not None:
+            # freeze the agents that have settled, and stop once all of them have
+            converged = monitor.update(t, model.preference_, model.attention_weights_)
 
-def main(config):
-    """Main entrypoint for the simulation code"""
+            if profiler is not None:
+                profiler.lap('monitor')
 
-    # simulate three clusters
-    X, y = simulate_blobs(config['cluster_centers'],
-                          n_samples=config['n_choices'],
-                          cluster_std=config['cluster_std'])
+            if converged:
+                recorder.finalise(t, model.preference_, model.attention_weights_)
+                break
 
-    # initialise the agent
-    mod = CoherencyMaximisingAgent(2,
-                                   2,
+            active = ~monitor.converged_
+
+        if profiler is not None:
+            profiler.end_step(t)
+
+    if profiler is not None:
+        profiler.end()
+
+    return recorder.history()
+
+
+def create_agent(config):
+    """Initialise a CoherencyMaximisingAgent from the simulation config"""
+
+    mod = CoherencyMaximisingAgent(config['n_items'],
+                                   len(config['cluster_centers'][0]),
                                    learn_prefs=True,
                                    learn_weights=True,
                                    c=config['c'],
                                    p_eta=config['lr'],
                                    w_eta=config['lr'],
                                    p_init=config['preference'],
-                                   w_init=config['weights'])
+                                   w_init=config['weights'],
+                                   track_history=False,
+                                   dtype=config['dtype'])
+
+    return mod
+
+
+def run_simulation(config, random_state=None, profiler=None):
+    """
+    Simulate the environment and a single agent described by config
+
+    # Parameters
+    config (dict): Simulation config, as in CONFIG
+    random_state (numpy.random.RandomState): Random state to simulate choices with. Defaults to the global state
+    profiler (PhaseProfiler): Optional profiler, timing every phase of the simulation loop
+    """
+
+    # simulate three clusters
+    X, y = simulate_blobs(config['cluster_centers'],
+                          n_samples=config['n_choices'],
+                          cluster_std=config['cluster_std'])
+
+    # initialise the agent
+    mod = create_agent(config)
+
+    # draw the choice sets from the clusters, which optionally drift through the space
+    sampler = ChoiceSetSampler(X, y, n_items=config['n_items'], dtype=mod.dtype)
+
+    if config['cluster_drift'] is None:
+        environment = ClusterEnvironment(sampler)
+    else:
+        environment = DriftingClusterEnvironment(sampler, config['cluster_drift'])
+
+    # only keep the part of the history that is asked for
+    if config['stream_trajectory']:
+        recorder = StreamingRecorder(config['save_path'] + 'trajectory',
+                                     config['n_timesteps'],
+                                     mod.n_attributes,
+                                     every=config['record_every'],
+                                     final_only=config['record_final_only'],
+                                     resume=config['resume'],
+                                     dtype=mod.dtype)
+    else:
+        recorder = TrajectoryRecorder(config['n_timesteps'],
+                                      mod.n_attributes,
+                                      every=config['record_every'],
+                                      final_only=config['record_final_only'],
+                                      dtype=mod.dtype)
+
+    # optionally log every action, to analyse the agent's streaks
+    action_log = None
+    if config['record_actions']:
+        action_log = ActionLog(config['n_timesteps'], mod.n_items, path=config['save_path'] + 'actions.npy',
+                               resume=config['resume'])
+
+    # optionally stop the simulation once the agent has settled
+    monitor = None
+    if config['convergence_window'] is not None:
+        monitor = ConvergenceMonitor(window=config['convergence_window'], tol=config['convergence_tol'])
+
+    # checkpoint long runs to the output directory
+    checkpointer = Checkpointer(config['save_path'] + 'checkpoint.npz', every=config['checkpoint_every'])
 
     # simulate choices for n_timesteps
     pref_hist, att_hist = simulate_choices(X,
                                            y,
                                            mod,
                                            n_choices=config['n_timesteps'],
-                                           epsilon_greedy=config['epsilon_greedy'])
+                                           epsilon=config['epsilon'],
+                                           epsilon_greedy=config['epsilon_greedy'],
+                                           random_state=random_state,
+                                           recorder=recorder,
+                                           backend=config['backend'],
+                                           monitor=monitor,
+                                           checkpointer=checkpointer,
+                                           resume=config['resume'],
+                                           profiler=profiler,
+                                           environment=environment,
+                                           action_log=action_log)
+
+    if action_log is not None:
+        action_log.flush()
+
+    return X, y, pref_hist, att_hist, monitor
+
+
+def main(config, profiler=None):
+    """Main entrypoint for the simulation code"""
+
+    # matplotlib and seaborn are slow to import, so only import them when plotting
+    from plot import plot_simulation_history
+
+    X, y, pref_hist, att_hist, _ = run_simulation(config, profiler=profiler)
 
     # plot the simulation history in a 2d plot. save to file.
     plot_simulation_history(X,
                             y,
                             pref_hist,
                             att_hist,
-                            save_path=config['save_path'] + '2d_axis_plot.eps')
+                            save_path=config['save_path'] + '2d_axis_plot.eps',
+                            max_points=config['plot_max_points'])
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Streaming of trajectories to memory-mapped .npy files, such that the length of a run is not
+limited by the amount of memory available
+"""
+
+from __future__ import division
+
+import os
+import json
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+from record import TrajectoryRecorder
+
+
+def trajectory_paths(path):
+    """Return the locations of the files that a streamed trajectory with prefix path is written to"""
+
+    return {'preferences': path + '_preferences.npy',
+            'attention_weights': path + '_attention_weights.npy',
+            'steps': path + '_steps.npy',
+            'meta': path + '_meta.json'}
+
+
+def load_trajectory(path):
+    """
+    Lazily open a streamed trajectory. Only the rows that are accessed are read from disk
+
+    # Parameters
+    path (str): Prefix of the trajectory files, as given to the StreamingRecorder
+
+    # Returns
+    Read-only memory maps of the preference history, attention weight history and the recorded steps
+    """
+
+    paths = trajectory_paths(path)
+
+    with open(paths['meta'], 'r') as f:
+        count = json.load(f)['count']
+
+    return tuple(np.load(paths[key], mmap_mode='r')[:count]
+                 for key in ['preferences', 'attention_weights', 'steps'])
+
+
+class StreamingRecorder(TrajectoryRecorder):
+    """
+    Records trajectories like the TrajectoryRecorder, but streams them to memory-mapped .npy files.
+
+    Kept steps are gathered into one of two in-memory blocks. Once a block is full, it is handed to a
+    background thread that writes it to disk, whilst the simulation carries on filling the other block.
+    The simulation only waits on the writer if it fills a block before the previous one was written.
+
+    # Parameters
+    path (str): Prefix of the files to write the trajectory to (see trajectory_paths)
+    n_timesteps (int): Number of steps that will be simulated
+    n_attributes (int): How many attributes belong to each choice?
+    n_agents (int): Number of agents in the population, or None when recording a single agent
+    every (int): Record every k-th step of the simulation
+    final_only (bool): Only keep the final state of the simulation
+    block_size (int): Number of kept steps in each in-memory block
+    resume (bool): Continue writing to existing files (when resuming from a checkpoint) rather than creating them
+    dtype (numpy.dtype): Floating point type of the recorded history
+    """
+    def __init__(self, path, n_timesteps, n_attributes, n_agents=None, every=1, final_only=False,
+                 block_size=4096, resume=False, dtype=float):
+        self.path = path
+        self.block_size = block_size
+        self.resume = resume
+
+        super(StreamingRecorder, self).__init__(n_timesteps, n_attributes, n_agents=n_agents,
+                                                every=every, final_only=final_only, dtype=dtype)
+
+    def _allocate(self):
+        """Open the memory-mapped files and allocate the two in-memory blocks"""
+
+        paths = trajectory_paths(self.path)
+        resuming = self.resume and os.path.exists(paths['preferences'])
+
+        def open_file(key, dtype, shape):
+            if resuming:
+                return np.load(paths[key], mmap_mode='r+')
+
+            return np.lib.format.open_memmap(paths[key], mode='w+', dtype=dtype, shape=shape)
+
+        self.preferences_ = open_file('preferences', self.dtype, (self.n_kept,) + self.shape)
+        self.attention_weights_ = open_file('attention_weights', self.dtype, (self.n_kept,) + self.shape)
+        self.steps_ = open_file('steps', int, (self.n_kept,))
+
+        self.count_ = 0
+        self.last_step_ = None
+
+        self._blocks = [{'preferences': np.zeros((self.block_size,) + self.shape, dtype=self.dtype),
+                         'attention_weights': np.zeros((self.block_size,) + self.shape, dtype=self.dtype),
+                         'steps': np.zeros(self.block_size, dtype=int)} for _ in range(2)]
+        self._free = [threading.Event() for _ in range(2)]
+        for free in self._free:
+            free.set()
+
+        self._active = 0
+        self._filled = 0
+        self._error = None
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_blocks)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _write_blocks(self):
+        """Write the blocks handed over by the simulation to disk, until told to stop"""
+
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                break
+
+            index, row, n_rows = item
+
+            try:
+                block = self._blocks[index]
+                self.preferences_[row:row + n_rows] = block['preferences'][:n_rows]
+                self.attention_weights_[row:row + n_rows] = block['attention_weights'][:n_rows]
+                self.steps_[row:row + n_rows] = block['steps'][:n_rows]
+            except Exception as e:
+                self._error = e
+
+            self._free[index].set()
+
+    def _hand_over(self):
+        """Hand the active block over to the writer thread, and switch to the other block"""
+
+        if self._filled == 0:
+            return
+
+        self._free[self._active].clear()
+        self._queue.put((self._active, self.count_ - self._filled, self._filled))
+
+        self._active = 1 - self._active
+        self._filled = 0
+
+        # wait until the writer is done with the block we are about to fill
+        self._free[self._active].wait()
+
+        if self._error is not None:
+            raise self._error
+
+    def _write_row(self, t, preference, attention_weights):
+        """Append the state after step t to the active block"""
+
+        block = self._blocks[self._active]
+        block['preferences'][self._filled] = np.reshape(preference, self.shape)
+        block['attention_weights'][self._filled] = np.reshape(attention_weights, self.shape)
+        block['steps'][self._filled] = t
+
+        self._filled += 1
+        self.count_ += 1
+        self.last_step_ = t
+
+        if self._filled == self.block_size:
+            self._hand_over()
+
+    def _write_rows(self, steps, preferences, attention_weights):
+        """Append the states after several steps to the blocks"""
+
+        start = 0
+        while start < len(steps):
+            n_rows = min(len(steps) - start, self.block_size - self._filled)
+            rows = slice(self._filled, self._filled + n_rows)
+
+            block = self._blocks[self._active]
+            block['preferences'][rows] = preferences[start:start + n_rows]
+            block['attention_weights'][rows] = attention_weights[start:start + n_rows]
+            block['steps'][rows] = steps[start:start + n_rows]
+
+            self._filled += n_rows
+            self.count_ += n_rows
+            start += n_rows
+
+            if self._filled == self.block_size:
+                self._hand_over()
+
+        self.last_step_ = steps[-1]
+
+    def flush(self):
+        """Write everything recorded so far to disk"""
+
+        self._hand_over()
+
+        for free in self._free:
+            free.wait()
+
+        if self._error is not None:
+            raise self._error
+
+        for array in [self.preferences_, self.attention_weights_, self.steps_]:
+            array.flush()
+
+        with open(trajectory_paths(self.path)['meta'], 'w') as f:
+            json.dump({'count': self.count_, 'n_timesteps': self.n_timesteps, 'every': self.every}, f)
+
+    def close(self):
+        """Write everything to disk and stop the writer thread"""
+
+        self.flush()
+
+        self._queue.put(None)
+        self._writer.join()
+
+    def get_state(self):
+        """Return the state of the recorder for checkpointing. The history itself stays on disk"""
+
+        self.flush()
+
+        return {'count': self.count_, 'last_step': -1 if self.last_step_ is None else self.last_step_}
+
+    def set_state(self, state):
+        """Restore the state of the recorder from a dictionary created by get_state"""
+
+        self.count_ = int(state['count'])
+        self.last_step_ = None if int(state['last_step']) < 0 else int(state['last_step'])
+
+    def history(self):
+        """Write the history to disk and return lazily loaded, read-only memory maps of it"""
+
+        self.close()
+
+        return load_trajectory(self.path)[:2]
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Run a sweep of simulations over a grid or list of CONFIG overrides, in parallel.
+
+Every run draws from its own RandomState, seeded from the sweep seed and the run's overrides,
+so that a run's results do not depend on which worker it was scheduled on or in what order.
+A summary of each run is appended to a single CSV as soon as it completes, such that an
+interrupted sweep can be resumed by running it again with the same results file.
+"""
+
+from __future__ import division
+
+import os
+import csv
+import copy
+import json
+import zlib
+import timeit
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from simulate import SEED, CONFIG, run_simulation
+from profiling import PhaseProfiler
+
+RESULT_COLUMNS = ['run_key', 'seed', 'final_preference', 'final_weights',
+                  'preference_extremity', 'attention_concentration', 'time_to_coherence']
+
+
+def expand_grid(grid):
+    """
+    Expand a grid of CONFIG overrides into a list with one override per combination
+
+    # Parameters
+    grid (dict): Dictionary mapping CONFIG keys to a list of values to sweep over
+    """
+
+    keys = sorted(grid.keys())
+
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def load_sweep(path):
+    """
+    Load a sweep specification from a JSON file. The file either contains a grid (a dictionary
+    of lists, see expand_grid) or a list of CONFIG overrides.
+    """
+
+    with open(path, 'r') as f:
+        spec = json.load(f)
+
+    if isinstance(spec, dict):
+        return expand_grid(spec)
+
+    return spec
+
+
+def run_key(overrides):
+    """Create a canonical string identifying the run with the given overrides"""
+
+    return json.dumps(overrides, sort_keys=True)
+
+
+def run_seed(key, seed=SEED):
+    """Derive the seed of a run's independent random stream from the sweep seed and its key"""
+
+    return [seed, zlib.crc32(key.encode('utf-8')) & 0xffffffff]
+
+
+def summarise_run(pref_hist, att_hist, monitor=None):
+    """
+    Summarise the final state of a simulated agent
+
+    # Parameters
+    pref_hist (numpy.ndarray): History of preferences over course of the simulation
+    att_hist (numpy.ndarray): History of attention weights over course of the simulation
+    monitor (ConvergenceMonitor): Monitor of the run, if convergence was monitored
+    """
+
+    final_pref = pref_hist[-1]
+    final_weights = att_hist[-1]
+
+    return {
+        'final_preference': json.dumps(final_pref.tolist()),
+        'final_weights': json.dumps(final_weights.tolist()),
+        # how far the preferences moved towards the edges of the space (0 = centre, 1 = edge)
+        'preference_extremity': 2 * np.abs(final_pref - 0.5).mean(),
+        # the share of attention given to the most attended attribute
+        'attention_concentration': final_weights.max() / final_weights.sum(),
+        # the timestep from which the agent had settled (-1 = never, empty = not monitored)
+        'time_to_coherence': '' if monitor is None else monitor.time_to_coherence_[0],
+    }
+
+
+def run_single(task):
+    """
+    Run and summarise a single simulation of the sweep. task is a (key, config, seed, profile) tuple
+
+    # Returns
+    The summary of the run, and the timers and counters of its phases (see PhaseProfiler.to_dict) if profile is set
+    """
+
+    key, config, seed, profile = task
+
+    profiler = PhaseProfiler() if profile else None
+
+    random_state = np.random.RandomState(seed)
+    _, _, pref_hist, att_hist, monitor = run_simulation(config, random_state=random_state, profiler=profiler)
+
+    row = summarise_run(pref_hist, att_hist, monitor)
+    row.update({'run_key': key, 'seed': json.dumps(seed)})
+
+    return row, None if profiler is None else profiler.to_dict()
+
+
+def create_task(override, base_config=CONFIG, seed=SEED, profile=False):
+    """Create the task of run_single for the run with the given CONFIG override"""
+
+    key = run_key(override)
+
+    config = copy.deepcopy(base_config)
+    config.update(override)
+
+    # only the final state is summarised, so don't keep the trajectory
+    config['record_final_only'] = True
+
+    # the runs of a sweep share the output directory, so they neither write nor restore the checkpoint,
+    # streamed trajectory or action log of a single run there. An interrupted sweep resumes by skipping
+    # the runs that are already in its results instead (see read_completed)
+    config.update({'checkpoint_every': None,
+                   'resume': False,
+                   'stream_trajectory': False,
+                   'record_actions': False})
+
+    return key, config, run_seed(key, seed), profile
+
+
+def read_completed(results_path):
+    """Read the keys of the runs that are already in the results file"""
+
+    if not os.path.exists(results_path):
+        return set()
+
+    with open(results_path, 'r') as f:
+        return set(row['run_key'] for row in csv.DictReader(f))
+
+
+def run_sweep(overrides, results_path, base_config=CONFIG, n_jobs=1, seed=SEED, profiler=None, progress=None):
+    """
+    Run one simulation per CONFIG override across a pool of processes
+
+    # Parameters
+    overrides (list): List of dictionaries, each overriding keys of base_config for one run
+    results_path (str): Location of the CSV to append per-run summaries to
+    base_config (dict): Config that the overrides are applied to
+    n_jobs (int): Number of worker processes to run simulations in
+    seed (int): Seed from which each run's random stream is derived
+    profiler (PhaseProfiler): Optional profiler, to which the phase timers of every run are added
+    progress (callable): Optional callback progress(n_done, n_runs, elapsed, eta), called as runs complete
+    """
+
+    # skip any runs that completed before the sweep was interrupted
+    completed = read_completed(results_path)
+
+    tasks = list()
+    for override in overrides:
+        key = run_key(override)
+
+        if key in completed:
+            continue
+
+        tasks.append(create_task(override, base_config, seed, profile=profiler is not None))
+        completed.add(key)
+
+    write_header = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+
+    with open(results_path, 'a') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+
+        if write_header:
+            writer.writeheader()
+
+        if n_jobs == 1:
+            results = map(run_single, tasks)
+        else:
+            pool = multiprocessing.Pool(n_jobs)
+            results = pool.imap_unordered(run_single, tasks)
+
+        # write each summary as soon as it arrives, so that progress survives interruption
+        start = timeit.default_timer()
+        for n_done, (row, profile) in enumerate(results, 1):
+            writer.writerow(row)
+            f.flush()
+
+            if profiler is not None:
+                profiler.merge(profile)
+
+            if progress is not None:
+                elapsed = timeit.default_timer() - start
+                progress(n_done, len(tasks), elapsed, elapsed * (len(tasks) - n_done) / n_done)
+
+        if n_jobs != 1:
+            pool.close()
+            pool.join()
+
+    return len(tasks)
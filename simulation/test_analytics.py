@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests of the analytics of the actions taken during a simulation
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from analytics import summarise_actions
+
+
+def test_summarise_actions():
+    actions = np.array([
+        [0, 0, 1, 1, 1, 0, 0, 0, 0, 0],  # switches twice, then locks in to 0 from the second window
+        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],  # locked in to 1 from the start
+        [0, 1, 0, 1, 0, 1, 0, 1, 0, 1],  # switches on every step, and never locks in
+    ]).T
+
+    # agents are analysed in blocks of two, such that the summary of the third comes from a second block
+    summary = summarise_actions(actions, window=5, threshold=0.8, block_size=2)
+
+    np.testing.assert_array_equal(summary['n_streaks'], [3, 1, 10])
+    np.testing.assert_allclose(summary['mean_streak'], [10 / 3, 10, 1])
+    np.testing.assert_array_equal(summary['longest_streak'], [5, 10, 1])
+    np.testing.assert_allclose(summary['switch_rate'], [2 / 9, 0, 1])
+    np.testing.assert_array_equal(summary['final_action'], [0, 1, 1])
+    np.testing.assert_array_equal(summary['lock_in'], [5, 0, -1])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests that an interrupted run resumed from its checkpoint gives the same results as an uninterrupted run
+"""
+
+from __future__ import division
+
+import copy
+
+import numpy as np
+import pytest
+
+from simulate import SEED, CONFIG, simulate_blobs, simulate_choices, create_agent
+from record import TrajectoryRecorder, ActionLog
+from convergence import ConvergenceMonitor
+from checkpoint import Checkpointer
+from kernels import HAS_NUMBA
+
+N_CHOICES = 3000
+EVERY = 250
+
+
+class Interruption(Exception):
+    pass
+
+
+class InterruptingCheckpointer(Checkpointer):
+    """Checkpointer that interrupts the run after saving n_saves checkpoints"""
+    def __init__(self, path, every, n_saves):
+        super(InterruptingCheckpointer, self).__init__(path, every=every)
+        self.n_saves = n_saves
+
+    def save(self, *args, **kwargs):
+        super(InterruptingCheckpointer, self).save(*args, **kwargs)
+
+        self.n_saves -= 1
+        if self.n_saves == 0:
+            raise Interruption()
+
+
+def run(checkpointer, backend, resume=False):
+    config = copy.deepcopy(CONFIG)
+
+    X, y = simulate_blobs(config['cluster_centers'], n_samples=config['n_choices'], cluster_std=config['cluster_std'])
+    model = create_agent(config)
+
+    recorder = TrajectoryRecorder(N_CHOICES, model.n_attributes, every=7)
+    action_log = ActionLog(N_CHOICES, model.n_items)
+    # the agent settles after the run was interrupted, on both backends
+    monitor = ConvergenceMonitor(window=500, tol=1.5e-2)
+
+    pref_hist, att_hist = simulate_choices(X, y, model, N_CHOICES, random_state=np.random.RandomState(SEED),
+                                           recorder=recorder, backend=backend, monitor=monitor,
+                                           checkpointer=checkpointer, resume=resume, action_log=action_log)
+
+    return pref_hist, att_hist, action_log.history(), monitor.time_to_coherence_, model.streak_lengths_
+
+
+@pytest.mark.parametrize('backend', ['numpy', pytest.param('numba', marks=pytest.mark.skipif(
+    not HAS_NUMBA, reason='numba is not installed'))])
+def test_resume_is_identical(tmpdir, backend):
+    path = str(tmpdir.join('checkpoint.npz'))
+
+    expected = run(None, backend)
+
+    with pytest.raises(Interruption):
+        run(InterruptingCheckpointer(path, EVERY, n_saves=2), backend)
+
+    resumed = run(Checkpointer(path, every=EVERY), backend, resume=True)
+
+    for result, uninterrupted in zip(resumed, expected):
+        np.testing.assert_array_equal(result, uninterrupted)
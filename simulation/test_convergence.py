@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests of the detection of agents that have settled into a coherent preference
+"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from convergence import ConvergenceMonitor
+
+
+def rolling_time_to_coherence(preferences, window, tol):
+    """Time to coherence of every agent, measured over every window of exactly window steps"""
+
+    time_to_coherence = np.full(preferences.shape[1], -1)
+
+    for t in range(window - 1, len(preferences)):
+        states = preferences[t - window + 1:t + 1]
+        settled = (states.max(axis=0) - states.min(axis=0)).max(axis=1) < tol
+
+        time_to_coherence[settled & (time_to_coherence < 0)] = t - window + 1
+
+    return time_to_coherence
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 1024])
+def test_rolling_window(block_size):
+    rng = np.random.RandomState(0)
+
+    # random walks of decaying step sizes, which settle at different times
+    scales = np.exp(-np.arange(600)[:, np.newaxis, np.newaxis] / rng.uniform(20, 200, size=(1, 8, 1)))
+    preferences = np.cumsum(0.01 * rng.randn(600, 8, 2) * scales, axis=0)
+
+    window, tol = 50, 2e-3
+    monitor = ConvergenceMonitor(window=window, tol=tol, n_agents=8, track_attention=False, n_buckets=window)
+
+    for t in range(0, len(preferences), block_size):
+        monitor.update_block(t, preferences[t:t + block_size], None)
+
+    expected = rolling_time_to_coherence(preferences, window, tol)
+
+    assert (expected >= 0).any()
+    np.testing.assert_array_equal(monitor.time_to_coherence_, expected)
+
+
+def test_attention_is_measured_as_shares():
+    # growing attention weights, which pay the same share of attention to every attribute
+    attention_weights = np.linspace(1, 10, 100)[:, np.newaxis] * np.ones(2)
+    preferences = np.full((100, 2), 0.5)
+
+    monitor = ConvergenceMonitor(window=10, tol=1e-3)
+    monitor.update_block(0, preferences, attention_weights)
+
+    assert monitor.done
+    assert monitor.time_to_coherence_[0] == 0
+    assert monitor.done_step_ == 9
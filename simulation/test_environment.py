@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests that agents learn from the choice sets of the environments without breaking down
+"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from environment import SharedFeatureEnvironment
+from model import BatchedCoherencyAgent
+from simulate import simulate_population_choices
+
+
+@pytest.mark.parametrize('n_designs, n_items', [(20, 2), (6, 3)])
+def test_shared_features_stay_finite(n_designs, n_items):
+    # binary designs make preferences coincide with items, where the gradient of the distance is undefined
+    n_agents = 200
+    model = BatchedCoherencyAgent(n_agents, n_items, n_designs, p_eta=0.05, w_eta=0.05,
+                                  learn_prefs=True, learn_weights=True,
+                                  p_init=[0.5] * n_designs, w_init=[1. / n_designs] * n_designs)
+    environment = SharedFeatureEnvironment(n_designs, n_items, n_agents=n_agents)
+
+    with np.errstate(divide='raise', invalid='raise'):
+        preferences, attention_weights = simulate_population_choices(None, None, model, 300,
+                                                                     random_state=np.random.RandomState(0),
+                                                                     environment=environment)
+
+    assert np.isfinite(preferences).all()
+    assert np.isfinite(attention_weights).all()
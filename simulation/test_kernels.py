@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests that the compiled kernel reproduces the trajectories of the NumPy simulation loop
+"""
+
+from __future__ import division
+
+import copy
+
+import numpy as np
+import pytest
+
+pytest.importorskip('numba')
+
+from simulate import SEED, CONFIG, simulate_blobs, simulate_choices, create_agent
+from record import ActionLog
+
+# spans several chunks of the random plan
+N_CHOICES = 3000
+
+# NumPy's vectorised exp and the fused multiply-adds of BLAS may round the last bit differently to the
+# scalar arithmetic of the kernel, depending on the CPU, so trajectories agree to a few ulp rather than bitwise
+RTOL = 1e-12
+ATOL = 1e-15
+
+
+@pytest.mark.parametrize('epsilon_greedy', [True, False])
+def test_numba_matches_numpy(epsilon_greedy):
+    config = copy.deepcopy(CONFIG)
+    X, y = simulate_blobs(config['cluster_centers'], n_samples=config['n_choices'], cluster_std=config['cluster_std'])
+
+    histories = dict()
+    actions = dict()
+
+    for backend in ['numpy', 'numba']:
+        action_log = ActionLog(N_CHOICES, config['n_items'])
+
+        histories[backend] = simulate_choices(X, y, create_agent(config), N_CHOICES,
+                                              epsilon=config['epsilon'],
+                                              epsilon_greedy=epsilon_greedy,
+                                              random_state=np.random.RandomState(SEED),
+                                              backend=backend,
+                                              action_log=action_log)
+        actions[backend] = action_log.history()
+
+    np.testing.assert_array_equal(actions['numba'], actions['numpy'])
+    np.testing.assert_allclose(histories['numba'][0], histories['numpy'][0], rtol=RTOL, atol=ATOL)
+    np.testing.assert_allclose(histories['numba'][1], histories['numpy'][1], rtol=RTOL, atol=ATOL)
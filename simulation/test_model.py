@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests of the Coherency Maximising agents
+"""
+
+from __future__ import division
+
+import copy
+
+import numpy as np
+import pytest
+
+from model import CoherencyMaximisingAgent, BatchedCoherencyAgent
+from policy import create_policy
+
+# largest difference of results that are summed in a different order (see BatchedCoherencyAgent)
+TOLERANCE = 1e-12
+
+
+@pytest.mark.parametrize('epsilon_greedy', [True, False])
+def test_batched_agents_follow_looped_agents(epsilon_greedy):
+    rng = np.random.RandomState(0)
+    n_agents, n_items, n_attributes = 10, 3, 2
+
+    p_init = rng.uniform(size=(n_agents, n_attributes))
+    w_init = rng.uniform(0.2, 1., size=(n_agents, n_attributes))
+    c = rng.uniform(0.5, 2., size=n_agents)
+
+    batched = BatchedCoherencyAgent(n_agents, n_items, n_attributes, c=c, p_eta=0.05, w_eta=0.05,
+                                    learn_prefs=True, learn_weights=True, p_init=p_init, w_init=w_init)
+    looped = [CoherencyMaximisingAgent(n_items, n_attributes, c=c[k], p_eta=0.05, w_eta=0.05,
+                                       learn_prefs=True, learn_weights=True, p_init=p_init[k].tolist(),
+                                       w_init=w_init[k].tolist(), track_history=False)
+              for k in range(n_agents)]
+
+    policy = create_policy(epsilon_greedy=epsilon_greedy)
+
+    for t in range(1000):
+        observation = rng.uniform(size=(n_agents, n_attributes, n_items))
+        uniforms = rng.uniform(size=(n_agents, policy.n_uniforms))
+
+        actions = batched.step(observation, policy, uniforms=uniforms)
+
+        for k, agent in enumerate(looped):
+            assert agent.step(observation[k], policy, uniforms=uniforms[k]) == actions[k]
+
+    np.testing.assert_allclose(batched.preference_, np.concatenate([agent.preference_ for agent in looped]),
+                               rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(batched.attention_weights_,
+                               np.concatenate([agent.attention_weights_ for agent in looped]), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('reduction', ['sum', 'mean'])
+def test_batch_update_reduces_the_gradients_of_every_choice(reduction):
+    rng = np.random.RandomState(0)
+    n_observations, n_items, n_attributes = 50, 3, 2
+
+    agent = CoherencyMaximisingAgent(n_items, n_attributes, c=1.5, learn_prefs=True, learn_weights=True,
+                                     p_init=[0.3, 0.6], w_init=[0.4, 0.8], track_history=False)
+
+    observations = rng.uniform(size=(n_observations, n_attributes, n_items))
+    actions = rng.randint(n_items, size=n_observations)
+
+    # the gradient of every choice on its own, from the same starting point
+    grad_p, grad_w = 0., 0.
+    for observation, action in zip(observations, actions):
+        single = copy.deepcopy(agent)
+        single.update_agent(observation, action)
+
+        grad_p, grad_w = grad_p + single.grad_p_, grad_w + single.grad_w_
+
+    scale = 1. / n_observations if reduction == 'mean' else 1.
+
+    agent.update_agent_batch(observations, actions, reduction=reduction)
+
+    np.testing.assert_allclose(agent.grad_p_, scale * grad_p, rtol=TOLERANCE)
+    np.testing.assert_allclose(agent.grad_w_, scale * grad_w, rtol=TOLERANCE)
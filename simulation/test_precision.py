@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests that single precision agents follow the trajectories of double precision agents
+"""
+
+from __future__ import division
+
+import copy
+
+import numpy as np
+import pytest
+
+from simulate import SEED, CONFIG, simulate_blobs, simulate_choices, create_agent
+
+N_CHOICES = 3000
+
+# largest absolute difference of the preference and attention weights over the run (about 1e-5 is observed)
+TOLERANCE = 1e-3
+
+
+@pytest.mark.parametrize('epsilon_greedy', [True, False])
+def test_float32_follows_float64(epsilon_greedy):
+    histories = dict()
+
+    for dtype in ['float32', 'float64']:
+        config = copy.deepcopy(CONFIG)
+        config['dtype'] = dtype
+
+        X, y = simulate_blobs(config['cluster_centers'], n_samples=config['n_choices'],
+                              cluster_std=config['cluster_std'])
+
+        histories[dtype] = simulate_choices(X, y, create_agent(config), N_CHOICES,
+                                            epsilon=config['epsilon'],
+                                            epsilon_greedy=epsilon_greedy,
+                                            random_state=np.random.RandomState(SEED))
+
+    assert histories['float32'][0].dtype == np.float32
+    assert histories['float64'][0].dtype == np.float64
+
+    for single, double in zip(histories['float32'], histories['float64']):
+        assert np.max(np.abs(single.astype(np.float64) - double)) < TOLERANCE
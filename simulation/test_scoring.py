@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests of the scoring of choice sets with a trained agent
+"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from model import CoherencyMaximisingAgent
+from scoring import score_choice_sets
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_scores_match_the_agent(tmpdir, n_jobs):
+    rng = np.random.RandomState(0)
+
+    agent = CoherencyMaximisingAgent(3, 2, c=2., learn_prefs=True, learn_weights=True,
+                                     p_init=[0.2, 0.7], w_init=[0.3, 0.9])
+    choice_sets = rng.uniform(size=(1000, 2, 3))
+
+    path = str(tmpdir.join('choice_sets.npy'))
+    np.save(path, choice_sets)
+
+    # the last observation the agent has seen, whose activations must survive scoring
+    agent.feed_forward(choice_sets[0])
+    activation = agent.h0.activation.copy()
+
+    probs = score_choice_sets(agent, path, out=str(tmpdir.join('probs.npy')), chunk_size=64, n_jobs=n_jobs)
+    np.testing.assert_array_equal(agent.h0.activation, activation)
+
+    expected = np.stack([agent.feed_forward(choice_set) for choice_set in choice_sets])
+
+    np.testing.assert_array_equal(probs, expected)
+    np.testing.assert_array_equal(np.load(str(tmpdir.join('probs.npy'))), expected)
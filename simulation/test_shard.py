@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests that a sweep run in shards by several workers gives the same results as an unsharded sweep
+"""
+
+from __future__ import division
+
+import os
+import csv
+import copy
+import time
+import multiprocessing
+
+from simulate import CONFIG
+from sweep import expand_grid, run_sweep
+from shard import plan_shards, run_worker, merge_shards
+
+
+def read_rows(path):
+    with open(path, 'r') as f:
+        return list(csv.DictReader(f))
+
+
+def work(shard_dir):
+    return run_worker(shard_dir, lease=60., heartbeat=0.05)
+
+
+def test_workers_take_over_stale_claims(tmpdir):
+    config = copy.deepcopy(CONFIG)
+    config['n_timesteps'] = 200
+
+    overrides = expand_grid({'lr': [0.01, 0.05], 'c': [1, 2]})
+    shard_dir = str(tmpdir.join('shards'))
+
+    assert plan_shards(overrides, shard_dir, base_config=config) == 4
+
+    # a worker that crashed long ago, halfway through writing the results of shard 1
+    claim = os.path.join(shard_dir, 'claimed', 'shard_00001@crashed-1')
+    os.rename(os.path.join(shard_dir, 'pending', 'shard_00001'), claim)
+
+    partial = os.path.join(shard_dir, 'done', '.shard_00001.1.tmp')
+    open(partial, 'w').close()
+
+    stale = time.time() - 3600
+    os.utime(claim, (stale, stale))
+
+    pool = multiprocessing.Pool(3)
+    completed = pool.map(work, [shard_dir] * 3)
+    pool.close()
+    pool.join()
+
+    # every shard ran exactly once, including the one taken over from the crashed worker
+    assert sorted(sum(completed, [])) == [0, 1, 2, 3]
+    assert os.listdir(os.path.join(shard_dir, 'claimed')) == []
+    assert not os.path.exists(partial)
+
+    sharded_path = str(tmpdir.join('sharded.csv'))
+    assert merge_shards(shard_dir, sharded_path) == []
+
+    results_path = str(tmpdir.join('results.csv'))
+    run_sweep(overrides, results_path, base_config=config)
+
+    assert read_rows(sharded_path) == read_rows(results_path)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# !/usr/bin/env python
+# Adam Hornsby
+
+"""
+Tests of the parallel sweep runner
+"""
+
+from __future__ import division
+
+import csv
+import copy
+
+from simulate import CONFIG
+from sweep import expand_grid, run_key, run_seed, run_sweep
+
+
+def read_rows(path):
+    with open(path, 'r') as f:
+        return list(csv.DictReader(f))
+
+
+def small_config():
+    config = copy.deepcopy(CONFIG)
+    config['n_timesteps'] = 200
+
+    return config
+
+
+def test_run_seed_is_deterministic():
+    key = run_key({'lr': 0.01, 'c': 2})
+
+    # the key does not depend on the order of the overrides, and the seed only on the key and sweep seed
+    assert key == run_key({'c': 2, 'lr': 0.01})
+    assert run_seed(key) == run_seed(key)
+    assert run_seed(key) != run_seed(run_key({'lr': 0.01, 'c': 1}))
+    assert run_seed(key, seed=1) != run_seed(key, seed=2)
+
+
+def test_resume_skips_completed_runs(tmpdir):
+    overrides = expand_grid({'lr': [0.01, 0.05], 'c': [1, 2]})
+    results_path = str(tmpdir.join('results.csv'))
+
+    # a sweep interrupted after its first three runs
+    assert run_sweep(overrides[:3], results_path, base_config=small_config()) == 3
+    interrupted = read_rows(results_path)
+
+    assert run_sweep(overrides, results_path, base_config=small_config()) == 1
+    resumed = read_rows(results_path)
+
+    assert resumed[:3] == interrupted
+    assert [row['run_key'] for row in resumed] == [run_key(override) for override in overrides]
+
+    # nor do the results depend on the worker a run was scheduled on
+    parallel_path = str(tmpdir.join('parallel.csv'))
+    run_sweep(overrides, parallel_path, base_config=small_config(), n_jobs=2)
+
+    assert (sorted(read_rows(parallel_path), key=lambda row: row['run_key']) ==
+            sorted(resumed, key=lambda row: row['run_key']))